@@ -0,0 +1,13 @@
+"""booklog の性能測定（スループット・レイテンシの劣化を検出する）
+
+backend ディレクトリで実行する::
+
+    python -m benchmarks.run                     # 測定して baseline.json と比較する
+    python -m benchmarks.run --update-baseline   # 測定結果をベースラインとして保存する
+    python -m benchmarks.server_modes            # WSGI と ASGI の比較
+
+- data: N ユーザー × M 冊 × K メモの合成データを作る
+- micro: booklog.urls の各ビューをテストクライアントで呼び、時間とクエリ数を測る
+- load: 同じプロセスで HTTP サーバーを動かし、一覧・検索・詳細・登録に同時に負荷をかける
+- compare: 結果をベースラインと比べ、劣化していれば失敗にする
+"""
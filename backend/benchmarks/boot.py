@@ -0,0 +1,139 @@
+"""コンテナの起動時間の比較
+
+gunicorn を実際に起動し、起動してから最初のリクエストに 200 が返るまでの時間と、
+その最初のリクエストの所要時間を測る。DB はベンチマーク用の SQLite（migrate 済み）、
+静的ファイルは本番と同じマニフェスト付きのストレージを使う。
+
+- legacy: 以前の start.sh。起動のたびに migrate と collectstatic を行い、preload しない
+- release: BOOKLOG_MIGRATE_ON_START=True の start.sh。release（未適用の確認だけ）の後、preload と warm-up
+- preload: Render の start.sh（migrate はリリースの手順、静的ファイルはビルド時）。preload と warm-up だけ
+
+使い方（backend ディレクトリで実行する）::
+
+    python -m benchmarks.boot --runs 3 --workers 2
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+MODES = ('legacy', 'release', 'preload')
+
+
+def manage(env, *args):
+    subprocess.run([sys.executable, 'manage.py', *args, '-v', '0'], env=env, check=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_response(url, process, timeout):
+    """url が 200 を返すまで待ち、(その時刻, 最初の 200 のリクエストの秒数) を返す"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn が終了しました（終了コード {process.returncode}）')
+        sent = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                response.read()
+                if response.status == 200:
+                    received = time.perf_counter()
+                    return received, received - sent
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.01)
+    raise RuntimeError(f'{timeout} 秒以内に {url} が応答しませんでした')
+
+
+def boot(mode, env, workdir, workers, path, timeout):
+    """mode の手順で起動し、(200 が返るまでの秒数, 最初のリクエストの秒数) を返す"""
+    port = free_port()
+    command = [
+        sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+    ]
+    if mode == 'legacy':
+        # preload も warm-up もしない（空の設定ファイルで gunicorn.conf.py を読ませない）
+        command += ['--config', os.path.join(workdir, 'empty.conf.py')]
+        # 起動したてのコンテナには集めた静的ファイルが無い
+        shutil.rmtree(os.path.join(workdir, 'staticfiles'), ignore_errors=True)
+
+    with open(os.path.join(workdir, f'{mode}.log'), 'ab') as log:
+        started = time.perf_counter()
+        if mode == 'legacy':
+            manage(env, 'migrate')
+            manage(env, 'collectstatic', '--noinput')
+        elif mode == 'release':
+            manage(env, 'release')
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=log)
+        try:
+            received, first_request = wait_for_response(f'http://127.0.0.1:{port}{path}', process, timeout)
+        finally:
+            process.terminate()
+            process.wait()
+    return received - started, first_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--runs', type=int, default=3, help='モードごとの起動回数（中央値を出す）')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn のワーカー数')
+    parser.add_argument('--path', default='/accounts/login/', help='最初に開くページ')
+    parser.add_argument('--timeout', type=float, default=60.0, help='起動を待つ最大の秒数')
+    parser.add_argument('--json', action='store_true', help='結果を JSON で出力する')
+    options = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='booklog-boot-')
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'benchmarks.settings',
+        'BOOKLOG_BENCH_DIR': workdir,
+        'BOOKLOG_BENCH_MANIFEST': '1',
+    }
+    # メトリクスのディレクトリは計測の対象外
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    open(os.path.join(workdir, 'empty.conf.py'), 'w').close()
+    # イメージのビルドとリリースの手順に当たる準備
+    manage(env, 'migrate')
+    manage(env, 'collectstatic', '--noinput')
+
+    results = []
+    try:
+        for mode in options.modes:
+            runs = [
+                boot(mode, env, workdir, options.workers, options.path, options.timeout)
+                for _ in range(options.runs)
+            ]
+            if mode == 'legacy':
+                # 次のモードのために静的ファイルを集め直しておく
+                manage(env, 'collectstatic', '--noinput')
+            results.append({
+                'mode': mode,
+                'ready_s': round(statistics.median(ready for ready, _ in runs), 3),
+                'first_request_ms': round(statistics.median(first for _, first in runs) * 1000, 1),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<10}{'起動 s':>10}{'初回 ms':>12}")
+    for row in results:
+        print(f"{row['mode']:<10}{row['ready_s']:>10}{row['first_request_ms']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""測定結果とベースラインの比較"""
+
+# 指標ごとの向き（'higher' は大きいほど悪い、'lower' は小さいほど悪い）
+MICRO_METRICS = {'median_ms': 'higher', 'queries': 'higher', 'bytes': 'higher'}
+LOAD_METRICS = {'p95_ms': 'higher', 'p99_ms': 'higher', 'rps': 'lower', 'errors': 'higher'}
+
+# 誤差では済まない指標（少しでも増えたら劣化とみなす）
+EXACT_METRICS = {'queries', 'errors'}
+
+
+def _regressed(metric, direction, current, baseline, tolerance, min_delta_ms):
+    if metric in EXACT_METRICS:
+        return current > baseline
+    if direction == 'higher':
+        return current > baseline * (1 + tolerance) and current - baseline >= min_delta_ms
+    return current < baseline * (1 - tolerance)
+
+
+def compare(results, baseline, tolerance=0.5, min_delta_ms=2.0):
+    """劣化した指標の説明のリストを返す（空なら劣化なし）
+
+    時間とレスポンスの大きさは tolerance（0.5 なら 50%）を超えて悪化し、かつ min_delta_ms 以上
+    増えた場合だけ劣化とする（1ms 未満のビューの揺れで失敗しないように）。
+    ベースラインに無いビュー・シナリオは比較しない。
+    """
+    problems = []
+    if results.get('params') != baseline.get('params'):
+        problems.append(
+            f"測定条件がベースラインと違います: {results.get('params')} != {baseline.get('params')}"
+        )
+        return problems
+    for section, metrics in (('micro', MICRO_METRICS), ('load', LOAD_METRICS)):
+        for name, values in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if previous is None:
+                continue
+            for metric, direction in metrics.items():
+                if metric not in values or previous.get(metric) is None:
+                    continue
+                if _regressed(metric, direction, values[metric], previous[metric], tolerance, min_delta_ms):
+                    problems.append(f'{section}.{name}.{metric}: {previous[metric]} -> {values[metric]}')
+    return problems
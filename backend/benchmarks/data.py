@@ -0,0 +1,25 @@
+"""ベンチマーク用の合成データ"""
+from django.contrib.auth import get_user_model
+
+from booklog import search
+from booklog.conditional import touch_library
+from booklog.models import Book
+from booklog.testing import seed_library
+
+PASSWORD = 'bench-password'
+
+
+def seed(users=1, books=1000, memos=2, index=True, prefix='bench'):
+    """ユーザー users 人 × 書籍 books 冊 × メモ memos 件を作り、ユーザーのリストを返す
+
+    index=True なら検索のベンチマーク用に検索インデックスも作る。
+    """
+    created = []
+    for number in range(users):
+        user = get_user_model().objects.create_user(f'{prefix}{number}', password=PASSWORD)
+        seed_library(user, books, memos)
+        touch_library(user.pk)
+        if index:
+            search.index_books(Book.objects.filter(user=user).values_list('pk', flat=True))
+        created.append(user)
+    return created
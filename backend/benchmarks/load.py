@@ -0,0 +1,165 @@
+"""同じプロセスで動かす HTTP サーバーへの負荷テスト
+
+Django の ThreadedWSGIServer（runserver と同じ）をスレッドで起動し、
+concurrency 本のクライアントスレッドから実際の HTTP でリクエストを送る。
+シナリオ（一覧・検索・詳細・登録）ごとにレイテンシの分布と毎秒のリクエスト数を返す。
+"""
+import http.client
+import random
+import statistics
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.urls import reverse
+
+from booklog.models import Book
+
+
+def percentile(ordered, q):
+    """並べ替え済みの値の q パーセンタイル（最近傍順位法）"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def summarize(latencies, elapsed, errors=0):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(ordered) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LiveServer:
+    """バックグラウンドのスレッドで動く HTTP サーバー（with 文で使う）"""
+
+    def __init__(self, host='127.0.0.1'):
+        self.host = host
+
+    def __enter__(self):
+        self.server = ThreadedWSGIServer((self.host, 0), QuietRequestHandler, allow_reuse_address=False)
+        self.server.set_app(get_wsgi_application())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Session:
+    """ログイン済みのユーザーとして HTTP でリクエストを送る"""
+
+    def __init__(self, server, user):
+        self.server = server
+        self.user = user
+        client = Client()
+        client.force_login(user)
+        self.cookies = {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+        # CSRF トークンはフォームのページを開いて Cookie から取る
+        self.request('GET', reverse('booklog:book_create'))
+
+    def request(self, method, path, data=None):
+        connection = http.client.HTTPConnection(self.server.host, self.server.port, timeout=60)
+        headers = {'Cookie': '; '.join(f'{key}={value}' for key, value in self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urlencode({**data, 'csrfmiddlewaretoken': self.cookies.get(settings.CSRF_COOKIE_NAME, '')})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['Referer'] = f'http://{self.server.host}:{self.server.port}/'
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            cookie = SimpleCookie(header)
+            self.cookies.update({key: morsel.value for key, morsel in cookie.items()})
+        return response.status
+
+
+def scenarios():
+    """名前 -> (メソッド, パスを作る関数, データを作る関数, 成功とみなすステータス)
+
+    パスを作る関数には Session を渡す（詳細はそのユーザーの書籍を開く）。
+    """
+    book_ids = {}
+
+    def detail_path(session):
+        if session.user.pk not in book_ids:
+            book_ids[session.user.pk] = list(
+                Book.objects.filter(user=session.user).values_list('pk', flat=True)[:500]
+            )
+        return reverse('booklog:book_detail', kwargs={'pk': random.choice(book_ids[session.user.pk])})
+
+    def search_path(session):
+        query = urlencode({'query': f'書籍{random.randint(1, 99)}'})
+        return f"{reverse('booklog:book_list')}?{query}"
+
+    return {
+        'list': ('GET', lambda session: reverse('booklog:book_list'), None, 200),
+        'search': ('GET', search_path, None, 200),
+        'detail': ('GET', detail_path, None, 200),
+        'create': (
+            'POST', lambda session: reverse('booklog:book_create'),
+            lambda: {'title': f'負荷テスト{random.random()}', 'author': '負荷テスト'}, 302,
+        ),
+    }
+
+
+def run_scenario(server, users, scenario, requests=200, concurrency=8):
+    method, path, data, expected = scenario
+    sessions = [Session(server, users[number % len(users)]) for number in range(concurrency)]
+    latencies, errors = [], []
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+
+    def client(session):
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            started = time.perf_counter()
+            status = session.request(method, path(session), data() if data else None)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status != expected:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=client, args=(session,)) for session in sessions]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, len(errors))
+
+
+def run(users, requests=200, concurrency=8, names=None):
+    """シナリオ名 -> {requests, errors, rps, p50_ms, p95_ms, p99_ms} を返す"""
+    results = {}
+    with LiveServer() as server:
+        for name, scenario in scenarios().items():
+            if names and name not in names:
+                continue
+            results[name] = run_scenario(server, users, scenario, requests, concurrency)
+    return results
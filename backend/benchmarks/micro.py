@@ -0,0 +1,114 @@
+"""booklog.urls の各ビューのマイクロベンチマーク（Django のテストクライアント経由）
+
+ビューを追加したら cases() にも追加する（booklog.tests.BenchmarkTest で確認している）。
+"""
+import json
+import statistics
+import time
+
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from booklog import jobs
+from booklog.auth import CachedModelBackend
+from booklog.models import Book
+
+from .load import percentile
+
+# ベンチマークしないビューと理由
+SKIPPED = {
+    'job_download': 'ダウンロードするファイルを作るにはワーカーでジョブを実行する必要があるため',
+    'metrics': 'BOOKLOG_METRICS が有効なときだけ公開するため',
+}
+
+
+def cases(user):
+    """[(ラベル, URL 名, メソッド, URL, データ)] を返す（ラベルは結果の JSON のキー）"""
+    book = Book.objects.filter(user=user).first()
+    memo = book.memos.first()
+    job = jobs.enqueue('reindex', user)
+
+    def url(name, **kwargs):
+        return reverse(f'booklog:{name}', kwargs=kwargs)
+
+    def get(name, data=None, label=None, **kwargs):
+        return (label or name, name, 'get', url(name, **kwargs), data)
+
+    def post_json(name, items):
+        return (name, name, 'post', url(name), items)
+
+    return [
+        get('book_list'),
+        get('book_list', {'sort': 'updated'}, label='book_list:updated'),
+        get('book_list', {'page': 2}, label='book_list:page'),
+        get('book_list', {'query': '書籍1'}, label='book_list:search'),
+        # 入力中の検索・ページ送りで取得する表の行だけの断片
+        get('book_list', {'query': '書籍1', 'fragment': 'rows'}, label='book_list:search:rows'),
+        get('book_list', {'page': 2, 'fragment': 'rows'}, label='book_list:page:rows'),
+        get('book_detail', pk=book.pk),
+        get('book_detail', {'fragment': 'rows'}, label='book_detail:rows', pk=book.pk),
+        get('book_create'),
+        get('book_update', pk=book.pk),
+        get('book_delete', pk=book.pk),
+        get('export', {'format': 'ndjson'}),
+        get('book_import'),
+        get('stats'),
+        get('signup'),
+        get('account_delete'),
+        get('job_list'),
+        get('job_detail', pk=job.pk),
+        ('job_reindex', 'job_reindex', 'post', url('job_reindex'), None),
+        get('memo_add', book_pk=book.pk),
+        get('memo_edit', pk=memo.pk),
+        get('memo_delete', pk=memo.pk),
+        get('api_book_list'),
+        get('api_book_detail', pk=book.pk),
+        post_json('api_book_bulk', [{'title': f'一括{n}', 'author': 'ベンチ'} for n in range(10)]),
+        get('api_memo_list'),
+        get('api_memo_detail', pk=memo.pk),
+        post_json('api_memo_bulk', [{'book': book.pk, 'content': f'一括メモ{n}'} for n in range(10)]),
+        get('api_changes'),
+        get('api_completions', {'q': '書籍1'}),
+    ]
+
+
+def request(client, method, url, data):
+    if method == 'post' and data is not None:
+        response = client.post(url, json.dumps(data), content_type='application/json')
+    else:
+        response = getattr(client, method)(url, data)
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    if response.status_code >= 400:
+        raise AssertionError(f'{method.upper()} {url} が {response.status_code} を返しました')
+    return len(content)
+
+
+def run(user, repeat=20):
+    """ラベル -> {median_ms, p95_ms, queries, bytes（レスポンスの本文の大きさ）} を返す"""
+    client = Client()
+    client.force_login(user)
+    # ログインでユーザーのキャッシュが消えるので、測る前に読み込んでおく（booklog.auth）
+    CachedModelBackend().get_user(user.pk)
+    results = {}
+    for label, _, method, url, data in cases(user):
+        # 1回目はテンプレートの読み込みやキャッシュの作成を含むので測らず、クエリ数だけ数える
+        # （request_started でクエリの記録が消されるので、先に空にして、すぐに数えておく）
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            size = request(client, method, url, data)
+        query_count = len(queries)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            request(client, method, url, data)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[label] = {
+            'median_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'queries': query_count,
+            'bytes': size,
+        }
+    return results
@@ -0,0 +1,101 @@
+"""ベンチマークを実行し、結果を JSON に書き出してベースラインと比較する
+
+劣化していれば終了コード 1 で終わるので、CI でもそのまま使える。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from pathlib import Path
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+
+from benchmarks import data, load, micro  # noqa: E402
+from benchmarks.compare import compare  # noqa: E402
+
+HERE = Path(__file__).resolve().parent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='booklog のベンチマーク')
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--books', type=int, default=2000, help='ユーザー1人あたりの書籍数')
+    parser.add_argument('--memos', type=int, default=2, help='書籍1冊あたりのメモ数')
+    parser.add_argument('--repeat', type=int, default=20, help='マイクロベンチマークで各ビューを呼ぶ回数')
+    parser.add_argument('--requests', type=int, default=200, help='負荷テストのシナリオごとのリクエスト数')
+    parser.add_argument('--concurrency', type=int, default=8, help='負荷テストの同時接続数')
+    parser.add_argument('--skip', choices=['micro', 'load'], action='append', default=[])
+    parser.add_argument('--output', type=Path, default=HERE / 'results' / 'latest.json')
+    parser.add_argument('--baseline', type=Path, default=HERE / 'baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='許容する悪化の割合')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='これ未満の悪化は無視する（ミリ秒）')
+    parser.add_argument('--update-baseline', action='store_true', help='結果をベースラインとして保存する')
+    options = parser.parse_args(argv)
+
+    call_command('migrate', verbosity=0)
+    print(f'データを作成しています（{options.users} 人 × {options.books} 冊 × {options.memos} メモ）', file=sys.stderr)
+    users = data.seed(options.users, options.books, options.memos)
+
+    results = {
+        'params': {
+            'users': options.users, 'books': options.books, 'memos': options.memos,
+            'repeat': options.repeat, 'requests': options.requests, 'concurrency': options.concurrency,
+        },
+        'environment': {'python': platform.python_version(), 'django': django.get_version(), 'machine': platform.machine()},
+    }
+    if 'micro' not in options.skip:
+        print('マイクロベンチマークを実行しています', file=sys.stderr)
+        results['micro'] = micro.run(users[0], options.repeat)
+    if 'load' not in options.skip:
+        print('負荷テストを実行しています', file=sys.stderr)
+        results['load'] = load.run(users, options.requests, options.concurrency)
+
+    options.output.parent.mkdir(parents=True, exist_ok=True)
+    options.output.write_text(json.dumps(results, indent=2, ensure_ascii=False) + '\n')
+    print_report(results)
+
+    if options.update_baseline:
+        options.baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False) + '\n')
+        print(f'ベースラインを更新しました: {options.baseline}')
+        return 0
+    if not options.baseline.exists():
+        print(f'ベースラインがありません（--update-baseline で作成）: {options.baseline}')
+        return 0
+    problems = compare(
+        results, json.loads(options.baseline.read_text()), options.tolerance, options.min_delta_ms
+    )
+    if problems:
+        print('\n!!! 性能が劣化しました !!!', file=sys.stderr)
+        for problem in problems:
+            print(f'  {problem}', file=sys.stderr)
+        return 1
+    print('\nベースラインからの劣化はありません')
+    return 0
+
+
+def print_report(results):
+    if 'micro' in results:
+        print(f"{'ビュー':<24}{'中央値 ms':>12}{'p95 ms':>10}{'クエリ':>8}{'バイト':>10}")
+        for label, row in results['micro'].items():
+            print(
+                f"{label:<24}{row['median_ms']:>12}{row['p95_ms']:>10}{row['queries']:>8}"
+                f"{row.get('bytes', ''):>10}"
+            )
+    if 'load' in results:
+        print(f"\n{'シナリオ':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'エラー':>8}")
+        for name, row in results['load'].items():
+            print(
+                f"{name:<10}{row['rps']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                f"{row['p99_ms']:>10}{row['errors']:>8}"
+            )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
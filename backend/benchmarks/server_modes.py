@@ -0,0 +1,198 @@
+"""WSGI（同期ワーカー）と ASGI（uvicorn ワーカー + 非同期ビュー）の比較
+
+DB が遅いとき（1クエリごとに --delay 秒かかる）に、ワーカー1つで同時に
+何リクエストをさばけるかを測る。実際のサーバーの代わりに Django の
+WSGIHandler / ASGIHandler を同じプロセスで直接呼び出す。
+
+- wsgi: gunicorn のワーカー1つ分。同時に処理できるのは --threads 件（sync ワーカーなら 1）
+- asgi: uvicorn のワーカー1つ分。イベントループ1つで、クエリの待ち時間に他のリクエストを進める
+
+使い方（backend ディレクトリで実行する）::
+
+    python -m benchmarks.server_modes --concurrency 1 8 32 --delay 0.02
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ページ断片キャッシュは無効にして毎回 DB を読ませる
+os.environ['BOOKLOG_FRAGMENT_CACHE_TIMEOUT'] = '0'
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import clear_url_caches  # noqa: E402
+
+from benchmarks import data  # noqa: E402
+from benchmarks.load import summarize  # noqa: E402
+
+# 1クエリあたりの待ち時間（秒）。準備中は 0 にしておく
+QUERY_DELAY = 0.0
+
+
+def slow_query(execute, sql, params, many, context):
+    if QUERY_DELAY:
+        time.sleep(QUERY_DELAY)
+    return execute(sql, params, many, context)
+
+
+def install_slow_query(sender, connection, **kwargs):
+    # 接続はスレッドごとに作られるので、作られるたびに遅延を仕込む（再接続では重複させない）
+    if slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query)
+
+
+def prepare(books):
+    call_command('migrate', verbosity=0)
+    user, = data.seed(users=1, books=books, memos=2, index=False)
+    client = Client()
+    client.force_login(user)
+    return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+
+def use_async_views(enabled):
+    import booklog.urls
+    import config.urls
+
+    settings.BOOKLOG_ASYNC_VIEWS = enabled
+    importlib.reload(booklog.urls)
+    importlib.reload(config.urls)
+    clear_url_caches()
+
+
+def wsgi_request(handler, path, cookie):
+    status = []
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'HTTP_COOKIE': cookie,
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    response = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+    b''.join(response)
+    response.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_request(handler, path, cookie):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 50000),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # 切断の待ち受けはレスポンスを返し終わるまで待たせておく
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await handler(scope, receive, send)
+    return status[0]
+
+
+async def run_load(mode, concurrency, total, path, cookie, threads):
+    """concurrency 個のクライアントが合計 total 件を送り、各リクエストの所要時間を返す"""
+    loop = asyncio.get_running_loop()
+    if mode == 'wsgi':
+        handler, pool = WSGIHandler(), ThreadPoolExecutor(max_workers=threads)
+
+        def request():
+            return loop.run_in_executor(pool, wsgi_request, handler, path, cookie)
+    else:
+        handler, pool = ASGIHandler(), None
+
+        def request():
+            return asgi_request(handler, path, cookie)
+
+    latencies, errors, remaining = [], 0, total
+
+    async def client():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            status = await request()
+            latencies.append(time.perf_counter() - started)
+            errors += status != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if pool:
+        pool.shutdown()
+    return latencies, errors, elapsed
+
+
+def main():
+    global QUERY_DELAY
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=64, help='同時接続数ごとのリクエスト数')
+    parser.add_argument('--delay', type=float, default=0.02, help='1クエリあたりの待ち時間（秒）')
+    parser.add_argument('--threads', type=int, default=1, help='WSGI ワーカーのスレッド数（gthread を想定）')
+    parser.add_argument('--books', type=int, default=100)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--json', action='store_true', help='結果を JSON で出力する')
+    options = parser.parse_args()
+
+    cookie = prepare(options.books)
+    connection_created.connect(install_slow_query)
+    QUERY_DELAY = options.delay
+
+    results = []
+    for mode in ('wsgi', 'asgi'):
+        use_async_views(mode == 'asgi')
+        for concurrency in options.concurrency:
+            latencies, errors, elapsed = asyncio.run(
+                run_load(mode, concurrency, options.requests, options.path, cookie, options.threads)
+            )
+            results.append({'mode': mode, 'concurrency': concurrency, **summarize(latencies, elapsed, errors)})
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<6}{'同時接続':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'エラー':>8}")
+    for row in results:
+        print(
+            f"{row['mode']:<6}{row['concurrency']:>8}{row['rps']:>10}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""ベンチマーク用の設定
+
+本番と同じ設定を読み込み、DB だけ一時ディレクトリの SQLite（BOOKLOG_BENCH_DIR で指定可）にする。
+"""
+import os
+import tempfile
+
+from config.settings import *  # noqa: F401,F403
+
+BENCHMARK_DIR = os.environ.get('BOOKLOG_BENCH_DIR') or tempfile.mkdtemp(prefix='booklog-bench-')
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+    }
+}
+BOOKLOG_SEARCH_BACKEND = 'booklog.search.DatabaseSearchBackend'
+BOOKLOG_JOB_STORAGE_DIR = os.path.join(BENCHMARK_DIR, 'jobfiles')
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+# データの準備でユーザーを大量に作るので、パスワードのハッシュは速いものにする
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# collectstatic せずに動かすので、マニフェスト（ハッシュ付きのファイル名）は使わない。
+# 起動時間のベンチマーク（benchmarks.boot）はビルド時と同じく collectstatic してから本番と同じものを使う
+STATIC_ROOT = os.path.join(BENCHMARK_DIR, 'staticfiles')
+if not os.environ.get('BOOKLOG_BENCH_MANIFEST'):
+    STORAGES = {**STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}  # noqa: F405
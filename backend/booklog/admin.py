@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import Book, Memo
+from .models import Book, Job, Memo
 
 admin.site.register(Book)
 admin.site.register(Memo)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'kind')
@@ -0,0 +1,358 @@
+# backend/booklog/api.py
+"""書籍・メモの JSON API（/api/v1/）
+
+認証は画面と同じセッション（CSRF トークンも必要）。所有者の絞り込みは
+画面と同じ UserBookOwnerMixin / UserMemoOwnerMixin で行う。
+"""
+import json
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from django.views import View
+
+from . import completion, deletion, sync
+from .forms import BookForm, MemoForm
+from .models import Book, Memo
+from .pagination import InvalidCursor, KeysetPaginator
+from .signals import bulk_changed
+from .views import UserBookOwnerMixin, UserMemoOwnerMixin
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def read_json(request):
+    try:
+        return json.loads(request.body or b'null')
+    except ValueError:
+        raise ApiError('JSON を解析できません')
+
+
+class ApiMixin:
+    """エラーを JSON で返す API ビュー共通の処理
+
+    LoginRequiredMixin より前、View より後ろに来るよう
+    ``class XxxApi(ApiListView, BookResourceMixin, View)`` の順で継承する。
+    """
+    page_size = 20
+    max_page_size = 100
+
+    def handle_no_permission(self):
+        return json_response({'error': 'ログインが必要です'}, status=401)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            data = {'error': error.message}
+            if error.errors:
+                data['errors'] = error.errors
+            return json_response(data, status=error.status)
+
+    def get_fields(self):
+        """?fields=title,author による疎なフィールドセット（id は常に含める）"""
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return self.fields
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"不明なフィールドです: {', '.join(unknown)}")
+        return ('id', *[name for name in names if name != 'id'])
+
+    def get_limit(self):
+        """?limit=N（max_page_size まで）"""
+        try:
+            limit = min(int(self.request.GET.get('limit', self.page_size)), self.max_page_size)
+        except ValueError:
+            raise ApiError('limit は整数で指定してください')
+        if limit < 1:
+            raise ApiError('limit は1以上で指定してください')
+        return limit
+
+    def serialize(self, obj, fields=None):
+        opts = obj._meta
+        return {
+            name: getattr(obj, opts.get_field(name).attname)
+            for name in (fields or self.fields)
+        }
+
+    def build(self, payload, instance=None, partial=False):
+        """payload をフォームで検証し、(未保存のインスタンス, エラー) を返す"""
+        if not isinstance(payload, dict):
+            return None, {'__all__': ['オブジェクトを指定してください']}
+        data = {}
+        if partial:
+            data.update(model_to_dict(instance, fields=self.form_class._meta.fields))
+        data.update(payload)
+        form = self.form_class(data=data, instance=instance)
+        if not form.is_valid():
+            return None, {field: list(messages) for field, messages in form.errors.items()}
+        return form.save(commit=False), None
+
+    def get_object(self):
+        try:
+            return self.get_queryset().get(pk=self.kwargs['pk'])
+        except self.model.DoesNotExist:
+            raise ApiError('見つかりません', status=404)
+
+
+class BookResourceMixin(UserBookOwnerMixin):
+    model = Book
+    form_class = BookForm
+    fields = ('id', 'title', 'author', 'published_date', 'created_at', 'updated_at')
+
+    def attach(self, entries):
+        """新規作成するインスタンスに所有者・親を設定する。{index: エラー} を返す"""
+        for index, instance, payload in entries:
+            instance.user = self.request.user
+        return {}
+
+    def soft_delete(self, queryset):
+        """論理削除して件数を返す（booklog.deletion）"""
+        return deletion.soft_delete_books(self.request.user.pk, queryset)
+
+
+class MemoResourceMixin(UserMemoOwnerMixin):
+    model = Memo
+    form_class = MemoForm
+    fields = ('id', 'book', 'content', 'created_at', 'updated_at')
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related(None)
+        book = self.request.GET.get('book')
+        if book:
+            if not book.isdigit():
+                raise ApiError('book は書籍の id で指定してください')
+            queryset = queryset.filter(book_id=book)
+        return queryset
+
+    def attach(self, entries):
+        requested = {payload.get('book') for _, _, payload in entries}
+        owned = set(
+            Book.objects.filter(user=self.request.user, pk__in=[pk for pk in requested if isinstance(pk, int)])
+            .values_list('pk', flat=True)
+        )
+        errors = {}
+        for index, instance, payload in entries:
+            if payload.get('book') in owned:
+                instance.book_id = payload['book']
+            else:
+                errors[index] = {'book': ['書籍が見つかりません']}
+        return errors
+
+    def soft_delete(self, queryset):
+        return deletion.soft_delete_memos(self.request.user.pk, queryset)
+
+
+class ApiListView(ApiMixin):
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        limit = self.get_limit()
+        queryset = self.get_queryset().only(*fields)
+        paginator = KeysetPaginator(queryset, limit, ('-id',))
+        try:
+            page = paginator.page(request.GET.get('after'))
+        except InvalidCursor:
+            raise ApiError('不正なカーソルです')
+        return json_response({
+            'results': [self.serialize(obj, fields) for obj in page],
+            'next': page.next_cursor,
+        })
+
+    def post(self, request, *args, **kwargs):
+        payload = read_json(request)
+        instance, errors = self.build(payload)
+        if not errors:
+            errors = self.attach([(0, instance, payload)]).get(0)
+        if errors:
+            raise ApiError('入力に誤りがあります', errors=errors)
+        instance.save()
+        return json_response(self.serialize(instance), status=201)
+
+
+class ApiDetailView(ApiMixin):
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        return json_response(self.serialize(self.get_object(), self.get_fields()))
+
+    def put(self, request, *args, **kwargs):
+        return self.update(partial=False)
+
+    def patch(self, request, *args, **kwargs):
+        return self.update(partial=True)
+
+    def update(self, partial):
+        instance, errors = self.build(read_json(self.request), instance=self.get_object(), partial=partial)
+        if errors:
+            raise ApiError('入力に誤りがあります', errors=errors)
+        instance.save()
+        return json_response(self.serialize(instance))
+
+    def delete(self, request, *args, **kwargs):
+        if not self.soft_delete(self.get_queryset().filter(pk=self.kwargs['pk'])):
+            raise ApiError('見つかりません', status=404)
+        return HttpResponse(status=204)
+
+
+class ApiBulkView(ApiMixin):
+    """一括作成（POST）・一括更新（PATCH）・一括削除（DELETE）
+
+    リクエストの全件を検証してから1トランザクションで書き込む。
+    1件でも誤りがあれば何も書き込まずに 400 を返す。
+    """
+    query_budget = 1
+
+    def read_items(self):
+        items = read_json(self.request)
+        if not isinstance(items, list):
+            raise ApiError('配列を指定してください')
+        limit = settings.BOOKLOG_API_BULK_LIMIT
+        if len(items) > limit:
+            raise ApiError(f'一度に処理できるのは {limit} 件までです')
+        return items
+
+    def post(self, request, *args, **kwargs):
+        entries, errors = [], {}
+        for index, payload in enumerate(self.read_items()):
+            instance, error = self.build(payload)
+            if error:
+                errors[index] = error
+            else:
+                entries.append((index, instance, payload))
+        errors.update(self.attach(entries))
+        if errors:
+            raise ApiError('入力に誤りがあります', errors=errors)
+
+        instances = [instance for _, instance, _ in entries]
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                created = self.model.objects.bulk_create(instances, batch_size=settings.BOOKLOG_BULK_BATCH_SIZE)
+                bulk_changed.send(sender=self.model, user_id=request.user.pk, objects=created, created=True)
+            else:
+                # bulk_create が pk を返さない DB（MySQL）では1件ずつ保存する。
+                # 書籍は同じタイトル・著者のものもあり、メモには引き直す手がかりがない（派生データは post_save で更新）
+                for instance in instances:
+                    instance.save(force_insert=True)
+                created = instances
+        return json_response({'results': [self.serialize(obj) for obj in created]}, status=201)
+
+    def patch(self, request, *args, **kwargs):
+        items = self.read_items()
+        ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+        if not all(isinstance(pk, int) for pk in ids) or len(set(ids)) != len(ids):
+            raise ApiError('各要素に重複のない id を指定してください')
+        instances = self.get_queryset().in_bulk(ids)
+
+        updated, errors, fields = [], {}, {'updated_at'}
+        for index, payload in enumerate(items):
+            if payload['id'] not in instances:
+                errors[index] = {'id': ['見つかりません']}
+                continue
+            instance, error = self.build(payload, instance=instances[payload['id']], partial=True)
+            if error:
+                errors[index] = error
+                continue
+            fields.update(name for name in payload if name in self.form_class._meta.fields)
+            updated.append(instance)
+        if errors:
+            raise ApiError('入力に誤りがあります', errors=errors)
+
+        # bulk_update は auto_now を更新しないので自分で設定する
+        now = timezone.now()
+        for instance in updated:
+            instance.updated_at = now
+        with transaction.atomic():
+            self.model.objects.bulk_update(updated, sorted(fields), batch_size=settings.BOOKLOG_BULK_BATCH_SIZE)
+            bulk_changed.send(sender=self.model, user_id=request.user.pk, objects=updated, created=False)
+        return json_response({'results': [self.serialize(obj) for obj in updated]})
+
+    def delete(self, request, *args, **kwargs):
+        ids = self.read_items()
+        if not all(isinstance(pk, int) for pk in ids):
+            raise ApiError('削除する id の配列を指定してください')
+        deleted = self.soft_delete(self.get_queryset().filter(pk__in=ids))
+        return json_response({'deleted': deleted})
+
+
+class BookListApi(ApiListView, BookResourceMixin, View):
+    pass
+
+
+class BookDetailApi(ApiDetailView, BookResourceMixin, View):
+    pass
+
+
+class BookBulkApi(ApiBulkView, BookResourceMixin, View):
+    pass
+
+
+class MemoListApi(ApiListView, MemoResourceMixin, View):
+    pass
+
+
+class MemoDetailApi(ApiDetailView, MemoResourceMixin, View):
+    pass
+
+
+class MemoBulkApi(ApiBulkView, MemoResourceMixin, View):
+    pass
+
+
+@method_decorator(gzip_page, name='dispatch')
+class ChangeFeedApi(ApiMixin, LoginRequiredMixin, View):
+    """?since=<同期トークン> より後に作成・更新・削除された書籍・メモ（booklog.sync）
+
+    レスポンスの sync_token を次回の since に渡す。has_more が true の間は続けて取得する。
+    """
+    page_size = 200
+    max_page_size = 1000
+    # ユーザー（キャッシュに無いとき）・変更・書籍・メモ
+    query_budget = 4
+
+    def get(self, request, *args, **kwargs):
+        limit = self.get_limit()
+        try:
+            changes = sync.changes_since(request.user.pk, request.GET.get('since'), limit)
+        except sync.InvalidToken:
+            raise ApiError('不正な同期トークンです')
+        return json_response({
+            'books': [self.serialize(book, BookResourceMixin.fields) for book in changes.books],
+            'memos': [self.serialize(memo, MemoResourceMixin.fields) for memo in changes.memos],
+            'deleted': {'books': changes.deleted_books, 'memos': changes.deleted_memos},
+            'sync_token': changes.token,
+            'has_more': changes.has_more,
+        })
+
+
+class CompletionApi(ApiMixin, LoginRequiredMixin, View):
+    """?q=<入力中の文字列> に前方一致するタイトル・著者（booklog.completion）
+
+    検索欄で1文字入力するごとに呼ばれる。
+    """
+    page_size = 10
+    max_page_size = 20
+    # ユーザー（キャッシュに無いとき）・補完のエントリ
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        limit = self.get_limit()
+        return json_response({'results': completion.complete(request.user.pk, request.GET.get('q', ''), limit)})
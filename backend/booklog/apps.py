@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BooklogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booklog'
+
+    def ready(self):
+        from . import auth, signals, tasks  # noqa: F401
@@ -0,0 +1,217 @@
+# backend/booklog/assets.py
+"""静的ファイル（Bootstrap の CSS）を小さくして配信する
+
+- collectstatic（イメージのビルド時）に BooklogStaticFilesStorage が css/bootstrap.min.css を
+  テンプレートとフォームで使っているクラスのルールだけに削ってから、ハッシュ付きの名前と
+  Brotli・gzip 版を作る。ハッシュ付きの名前のファイルは WhiteNoise が
+  ``Cache-Control: max-age=315360000, public, immutable`` で返す。
+- base.html の {% stylesheet %} は、初めてのページ（Cookie が無い）ではページの枠
+  （base.html のクラス）の CSS を <style> に埋め込み、CSS 全体は描画を止めずに読み込む。
+  読み込んだら Cookie を付けるので、次のページからはキャッシュ済みの CSS を <link> で読み、
+  CSS の転送は 0 バイトになる（CSS が変われば URL も Cookie の値も変わる）。
+
+CSS の削り方は単純で、セレクタのクラスがすべて使われているセレクタだけを残す
+（:not() と属性セレクタの中は見ない）。要素だけのセレクタ・:root・@font-face などは残す。
+Bootstrap の JavaScript が付け外しするクラスは SAFELIST に入れておく。
+"""
+import hashlib
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+STYLESHEET = 'css/bootstrap.min.css'
+# 初めてのページで CSS 全体を読み終えたことを覚えておく Cookie（値は CSS の URL のハッシュ）
+COOKIE = 'booklog_css'
+
+APP_DIR = Path(__file__).resolve().parent
+TEMPLATE_DIR = APP_DIR / 'templates'
+SHELL_TEMPLATE = TEMPLATE_DIR / 'booklog' / 'base.html'
+
+# Bootstrap の JavaScript（ナビバーの折りたたみ・ドロップダウン）が付け外しするクラス
+SAFELIST = {'show', 'collapsing', 'collapsed', 'active', 'disabled'}
+# 中にルールを持つ @ 規則（@keyframes・@font-face などは1つのルールとして扱う）
+NESTED_AT_RULES = {'media', 'supports', 'container', 'layer'}
+
+CLASS_ATTRIBUTE = re.compile(r'''\bclass\s*=\s*(["'])(.*?)\1''', re.S)
+WIDGET_CLASS = re.compile(r'''["']class["']\s*:\s*(["'])(.*?)\1''')
+TOKEN = re.compile(r'-?[_a-zA-Z][\w-]*')
+SELECTOR_CLASS = re.compile(r'\.(-?[_a-zA-Z](?:[\w-]|\\.)*)')
+NOT_PSEUDO = re.compile(r':not\([^()]*\)')
+ATTRIBUTE_SELECTOR = re.compile(r'\[[^\]]*\]')
+KEYFRAMES = re.compile(r'@(?:-webkit-)?keyframes\s+([\w-]+)')
+
+
+def template_classes(paths):
+    """テンプレートの class 属性に現れる名前（{% if %} の中の名前も含む）"""
+    classes = set()
+    for path in paths:
+        for _, value in CLASS_ATTRIBUTE.findall(Path(path).read_text(encoding='utf-8')):
+            classes.update(TOKEN.findall(value))
+    return classes
+
+
+def used_classes():
+    """テンプレートとフォームのウィジェット（attrs={'class': ...}）で使っているクラス"""
+    classes = template_classes(TEMPLATE_DIR.rglob('*.html'))
+    for path in APP_DIR.glob('*.py'):
+        for _, value in WIDGET_CLASS.findall(path.read_text(encoding='utf-8')):
+            classes.update(TOKEN.findall(value))
+    return classes | SAFELIST
+
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while css[i] != quote:
+        i += 2 if css[i] == '\\' else 1
+    return i + 1
+
+
+def _block_end(css, i):
+    """css[i] の { に対応する } の次の位置"""
+    depth = 0
+    while True:
+        if css[i] in '"\'':
+            i = _skip_string(css, i)
+            continue
+        if css[i] == '{':
+            depth += 1
+        elif css[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+
+
+def parse_css(css, i=0):
+    """CSS を (プレリュード, 本体) のリストにする
+
+    本体はルールなら {} の中の文字列、@media などならその中のリスト、; で終わる文と
+    /*! のコメントなら None。(リスト, 読み終えた位置) を返す。
+    """
+    nodes = []
+    start = i
+    while i < len(css):
+        char = css[i]
+        if char in '"\'':
+            i = _skip_string(css, i)
+        elif css.startswith('/*', i):
+            end = css.index('*/', i) + 2
+            if not css[start:i].strip():
+                # ライセンスのコメント（/*!）だけ残す
+                if css.startswith('/*!', i):
+                    nodes.append((css[i:end], None))
+                start = end
+            i = end
+        elif char == '}':
+            return nodes, i + 1
+        elif char == ';':
+            nodes.append((css[start:i].strip(), None))
+            i = start = i + 1
+        elif char == '{':
+            prelude = css[start:i].strip()
+            name = prelude[1:].split(None, 1)[0].split('(', 1)[0] if prelude.startswith('@') else None
+            if name in NESTED_AT_RULES:
+                children, i = parse_css(css, i + 1)
+                nodes.append((prelude, children))
+            else:
+                end = _block_end(css, i)
+                nodes.append((prelude, css[i + 1:end - 1]))
+                i = end
+            start = i
+        else:
+            i += 1
+    return nodes, i
+
+
+def serialize_css(nodes):
+    parts = []
+    for prelude, body in nodes:
+        if body is None:
+            parts.append(prelude if prelude.startswith('/*') else f'{prelude};')
+        elif isinstance(body, list):
+            parts.append(f'{prelude}{{{serialize_css(body)}}}')
+        else:
+            parts.append(f'{prelude}{{{body}}}')
+    return ''.join(parts)
+
+
+def split_selectors(prelude):
+    """カンマで区切られたセレクタ（括弧の中のカンマでは区切らない）"""
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:i])
+            start = i + 1
+    selectors.append(prelude[start:])
+    return selectors
+
+
+def selector_used(selector, classes):
+    previous = None
+    while previous != selector:
+        previous, selector = selector, NOT_PSEUDO.sub('', selector)
+    selector = ATTRIBUTE_SELECTOR.sub('', selector)
+    return all(name in classes for name in SELECTOR_CLASS.findall(selector))
+
+
+def _purge_nodes(nodes, classes):
+    kept = []
+    for prelude, body in nodes:
+        if isinstance(body, list):
+            children = _purge_nodes(body, classes)
+            if children:
+                kept.append((prelude, children))
+        elif body is None or prelude.startswith('@'):
+            kept.append((prelude, body))
+        else:
+            selectors = [selector for selector in split_selectors(prelude) if selector_used(selector, classes)]
+            if selectors:
+                kept.append((','.join(selectors), body))
+    return kept
+
+
+def purge_css(css, classes):
+    """classes に無いクラスのセレクタを除いた CSS（使われなくなった @keyframes も除く）"""
+    nodes = _purge_nodes(parse_css(css)[0], classes)
+    rest = serialize_css([node for node in nodes if not KEYFRAMES.match(node[0])])
+    return serialize_css([
+        node for node in nodes
+        if not (match := KEYFRAMES.match(node[0])) or re.search(rf'\b{re.escape(match.group(1))}\b', rest)
+    ])
+
+
+@lru_cache(maxsize=None)
+def critical_css():
+    """ページの枠（base.html）の描画に使う CSS（最初のページの <style> に埋め込む）"""
+    css = Path(finders.find(STYLESHEET)).read_text(encoding='utf-8')
+    # <style> の中では @charset は意味が無く、ライセンスは CSS 全体に残っている
+    nodes = parse_css(purge_css(css, template_classes([SHELL_TEMPLATE]) | SAFELIST))[0]
+    return serialize_css([(prelude, body) for prelude, body in nodes if body is not None])
+
+
+def stylesheet_version(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:12]
+
+
+class BooklogStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """STYLESHEET を使っているクラスだけに削ってから、ハッシュ付きの名前と圧縮版を作る"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run and STYLESHEET in paths:
+            storage, path = paths[STYLESHEET]
+            with storage.open(path) as source:
+                css = source.read().decode('utf-8')
+            # collectstatic がコピーしたものを削ったものに置き換え、ハッシュもそこから計算させる
+            self.delete(STYLESHEET)
+            self.save(STYLESHEET, ContentFile(purge_css(css, used_classes()).encode('utf-8')))
+            paths = {**paths, STYLESHEET: (self, STYLESHEET)}
+        yield from super().post_process(paths, dry_run=dry_run, **options)
@@ -0,0 +1,140 @@
+# backend/booklog/async_views.py
+"""一覧・詳細（検索を含む）の非同期版ビュー
+
+ASGI（uvicorn ワーカー）で動かすときに booklog.urls が views の代わりに使う
+（settings.BOOKLOG_ASYNC_VIEWS）。DB の待ち時間の間にイベントループが他の
+リクエストを処理できるよう、クエリは非同期 ORM（aget / acount / async for）で
+発行し、テンプレートの描画など同期の処理だけ sync_to_async でスレッドに逃がす。
+
+ETag・ページ断片キャッシュは同期版と同じ関数を使い、キャッシュのキーも
+同期版と共有する（クラス名を同じにしている）ので、どちらで描画しても結果は同じ。
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.views import View
+from django.views.generic.base import TemplateResponseMixin
+
+from .cache import aget_fragment, aset_fragment, view_fragment_key, wants_rows
+from .conditional import (
+    abook_validators, alibrary_state, apply_validators, detail_validators, detail_version, not_modified_response,
+)
+from .counting import acount_results, afacet_counts
+from .instrumentation import timed_render
+from .models import Book
+from . import views
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin の非同期版（ユーザーは request.auser() で取得する）"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        # 以降の同期の処理（テンプレートなど）で再びクエリしないよう、取得済みのユーザーに置き換える
+        request.user = user
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncFragmentPageView(AsyncLoginRequiredMixin, TemplateResponseMixin, View):
+    """ConditionalGetMixin と FragmentCacheMixin を合わせた非同期のページ"""
+    fragment_template_name = None
+    rows_template_name = None
+    fragment_cache_params = ()
+    # get_validators() で設定する蔵書の版（booklog.cache.FragmentCacheMixin と同じ）
+    fragment_version = None
+
+    def renders_rows(self):
+        return self.rows_template_name is not None and wants_rows(self.request)
+
+    async def get_validators(self):
+        return None, None
+
+    async def get_context_data(self):
+        raise NotImplementedError
+
+    def get_cached_context(self, context):
+        return {}
+
+    async def get(self, request, *args, **kwargs):
+        etag, last_modified = await self.get_validators()
+        response = not_modified_response(request, etag, last_modified)
+        if response is None:
+            response = await self.render_page()
+        return apply_validators(response, etag, last_modified)
+
+    async def render_page(self):
+        key = view_fragment_key(
+            self.request, type(self).__name__, self.kwargs, self.fragment_cache_params, self.fragment_version
+        )
+        rows = self.renders_rows()
+        cached = await aget_fragment(key)
+        if cached is None:
+            context = await self.get_context_data()
+            with timed_render():
+                fragment = await sync_to_async(render_to_string)(
+                    self.rows_template_name if rows else self.fragment_template_name, context, self.request
+                )
+            cached = {'fragment': fragment} if rows else {'fragment': fragment, **self.get_cached_context(context)}
+            await aset_fragment(key, cached)
+        if rows:
+            return HttpResponse(cached['fragment'])
+        # ページ全体（base.html）は ASGI ハンドラがスレッドで描画する
+        return self.render_to_response(cached)
+
+
+class BookListView(views.BookListMixin, AsyncFragmentPageView):
+    template_name = 'booklog/book_list.html'
+    fragment_template_name = 'booklog/includes/book_list_content.html'
+    query_budget = views.BookListView.query_budget
+
+    async def get_validators(self):
+        return self.get_list_validators(await alibrary_state(self.request.user.pk))
+
+    async def get_context_data(self):
+        queryset = self.get_queryset()
+        paginator = self.get_paginator(queryset, self.paginate_by)
+        if not self.uses_cursor():
+            # Paginator.count は同期のクエリで数えるので先に非同期で求めておく
+            paginator.result_count = await acount_results(queryset)
+        window, position = self.get_window(paginator)
+        page = self.get_page(paginator, [book async for book in window], position)
+        facets = None
+        if self.wants_facets():
+            facets = await afacet_counts(
+                self.request.user.pk, self.fragment_version, self.get_search_queryset(), self.request.GET['query']
+            )
+        return {
+            'view': self,
+            'books': page.object_list,
+            'object_list': page.object_list,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            **self.get_list_context(paginator, page, facets),
+        }
+
+
+class BookDetailView(AsyncFragmentPageView):
+    template_name = 'booklog/book_detail.html'
+    fragment_template_name = 'booklog/includes/book_detail_content.html'
+    rows_template_name = views.BookDetailView.rows_template_name
+    query_budget = 4
+
+    async def get_validators(self):
+        state = await abook_validators(self.request.user.pk, self.kwargs['pk'])
+        self.fragment_version = detail_version(state)
+        return detail_validators(self.request, self.kwargs['pk'], state)
+
+    async def get_context_data(self):
+        queryset = Book.objects.filter(user=self.request.user).prefetch_related('memos')
+        try:
+            book = await queryset.aget(pk=self.kwargs['pk'])
+        except Book.DoesNotExist:
+            raise Http404('書籍が見つかりません')
+        return {'view': self, 'object': book, 'book': book}
+
+    def get_cached_context(self, context):
+        return {'title': context['object'].title}
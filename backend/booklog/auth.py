@@ -0,0 +1,65 @@
+# backend/booklog/auth.py
+"""リクエストごとの認証を DB に問い合わせずに済ませるための認証バックエンド
+
+セッションは cached_db（キャッシュから読み、DB にも書く）に置き、ログイン中のユーザーは
+CachedModelBackend が BOOKLOG_USER_CACHE_TIMEOUT 秒キャッシュする。ページを開くたびに
+発行していた django_session と auth_user の SELECT が、キャッシュが温まっていれば 0 回になる。
+
+Django はキャッシュから読んだユーザーのパスワードでセッションのハッシュを確認するので、
+ユーザーが保存されたら（パスワードの変更・退会・ログイン日時の更新）とログアウトで
+キャッシュを消し、次のリクエストで DB から読み直す。消したことがすべてのプロセスに
+伝わる共有のキャッシュ（Redis）でなければ、settings.BOOKLOG_USER_CACHE でキャッシュを
+使わず ModelBackend と同じく毎回 DB から読む。
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+def user_cache_key(user_id):
+    return f'booklog:user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """get_user() の結果をキャッシュする ModelBackend（settings.AUTHENTICATION_BACKENDS）"""
+
+    def get_user(self, user_id):
+        if not settings.BOOKLOG_USER_CACHE:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.BOOKLOG_USER_CACHE_TIMEOUT)
+        return user
+
+    async def aget_user(self, user_id):
+        if not settings.BOOKLOG_USER_CACHE:
+            return await super().aget_user(user_id)
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, settings.BOOKLOG_USER_CACHE_TIMEOUT)
+        return user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_saved_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
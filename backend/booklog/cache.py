@@ -0,0 +1,131 @@
+# backend/booklog/cache.py
+"""ユーザーごとのページ断片キャッシュ
+
+一覧・詳細ページの本体（content ブロック）を描画済み HTML として Django の
+キャッシュに保存する。キーには蔵書の版（一覧は LibraryState.seq、詳細は書籍と
+メモの更新状況）を含め、Book / Memo が変更されて版が変わったら古いエントリを
+使わないようにする（古いエントリは TTL と LRU で自然に追い出される）。
+
+版は ETag（booklog.conditional）を計算するときに DB から読んだ値を使う。キャッシュの
+カウンタと違い、プロセスごとの LocMemCache でも全プロセスで同じ値になり、書き込みの
+トランザクションがコミットされるまでは古い版のままなので、コミット前のデータを
+新しい版として保存することもない。
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from .instrumentation import record_cache_lookup, timed_render
+
+
+def fragment_key(user_id, version, name, parts):
+    """version は蔵書の版。版が分からない（None）ときはキャッシュしないので None を返す"""
+    if version is None:
+        return None
+    digest = hashlib.sha256(repr((str(version), sorted(parts))).encode()).hexdigest()[:32]
+    return f'booklog:fragment:{user_id}:{name}:{digest}'
+
+
+def get_fragment(key):
+    if key is None:
+        return None
+    cached = cache.get(key)
+    record_cache_lookup(cached is not None)
+    return cached
+
+
+async def aget_fragment(key):
+    if key is None:
+        return None
+    cached = await cache.aget(key)
+    record_cache_lookup(cached is not None)
+    return cached
+
+
+def set_fragment(key, value):
+    if key is not None:
+        cache.set(key, value, settings.BOOKLOG_FRAGMENT_CACHE_TIMEOUT)
+
+
+async def aset_fragment(key, value):
+    if key is not None:
+        await cache.aset(key, value, settings.BOOKLOG_FRAGMENT_CACHE_TIMEOUT)
+
+
+def wants_rows(request):
+    """表の行とページ送りだけを求めるリクエスト（?fragment=rows、static/js/fragments.js が送る）"""
+    return request.GET.get('fragment') == 'rows'
+
+
+def view_fragment_key(request, name, kwargs, params, version):
+    """ビューの URL 引数と GET パラメータ（params）、蔵書の版からキャッシュキーを作る
+
+    同期・非同期のビュー（booklog.async_views）は同じ name でキーを共有する。
+    表の行だけの断片（wants_rows）はページ本体とは別のキーにする。
+    """
+    if wants_rows(request):
+        name = f'{name}:rows'
+    parts = [(key, str(value)) for key, value in kwargs.items()]
+    parts += [(f'GET:{param}', request.GET.get(param, '')) for param in params]
+    return fragment_key(request.user.pk, version, name, parts)
+
+
+class FragmentCacheMixin:
+    """ページ本体を fragment_template_name で描画し、ユーザーごとにキャッシュする
+
+    ページのテンプレートは ``{{ fragment }}`` を content ブロックに出力する。
+    キャッシュから返すときはビューのクエリを一切実行しない。
+    ?fragment=rows なら rows_template_name（表の行とページ送り）だけを描画して、
+    base.html を使わずにそのまま返す（これも同じようにキャッシュする）。
+
+    キーに含める蔵書の版 fragment_version は、ConditionalGetMixin より後ろに継承して
+    get_validators() の中で設定する（None のままならキャッシュしない）。
+    """
+    fragment_template_name = None
+    rows_template_name = None
+    # キャッシュキーに含める GET パラメータ
+    fragment_cache_params = ()
+    fragment_version = None
+
+    def renders_rows(self):
+        return self.rows_template_name is not None and wants_rows(self.request)
+
+    def get_fragment_cache_key(self):
+        return view_fragment_key(
+            self.request, type(self).__name__, self.kwargs, self.fragment_cache_params, self.fragment_version
+        )
+
+    def get_cached_context(self, context):
+        """断片以外にページのテンプレートが使う値（キャッシュに一緒に保存する）"""
+        return {}
+
+    def get(self, request, *args, **kwargs):
+        self.fragment_cache_key = self.get_fragment_cache_key()
+        cached = get_fragment(self.fragment_cache_key)
+        if cached is None:
+            return super().get(request, *args, **kwargs)
+        if self.renders_rows():
+            return HttpResponse(cached['fragment'])
+        # object_list / object が無いので get_template_names() は使わない
+        return self.response_class(
+            request=request,
+            template=[self.template_name],
+            context=cached,
+            using=self.template_engine,
+            content_type=self.content_type,
+        )
+
+    def render_to_response(self, context, **response_kwargs):
+        rows = self.renders_rows()
+        with timed_render():
+            fragment = render_to_string(
+                self.rows_template_name if rows else self.fragment_template_name, context, self.request
+            )
+        cached = {'fragment': fragment} if rows else {'fragment': fragment, **self.get_cached_context(context)}
+        set_fragment(self.fragment_cache_key, cached)
+        if rows:
+            return HttpResponse(fragment)
+        return super().render_to_response(cached, **response_kwargs)
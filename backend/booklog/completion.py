@@ -0,0 +1,229 @@
+# backend/booklog/completion.py
+"""検索欄の入力補完（タイトル・著者の前方一致）
+
+ユーザーごとのタイトル・著者を CompletionEntry に (キー, 値, 冊数) として保存しておき、
+入力中の文字列をキーの前方一致で引く。(user, key) のインデックスを範囲で読んで
+先頭の数件で止めるので、1文字ごとのリクエストの時間は蔵書の冊数によらない。
+
+キーは全角・半角、大文字・小文字、カタカナ・ひらがなの揺れを吸収し、空白や
+記号を除いたもの。値の先頭からのキーのほか、2語目以降の各語から始まるキーも作るので
+「ポッター」でも「ハリー・ポッター」が出る。漢字は入力した文字のまま比べる
+（読みから漢字を引くには辞書が要るので扱わない）。
+
+冊数は書籍が変更されるたびに booklog.stats と同じく差分だけを加減する
+（booklog.signals・booklog.deletion から呼ぶ）。ずれたときは ``manage.py rebuild_completions`` で作り直す。
+"""
+from collections import defaultdict
+
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Collate
+
+from . import search
+from .models import Book, CompletionEntry
+
+TITLE = CompletionEntry.TITLE
+AUTHOR = CompletionEntry.AUTHOR
+
+KEY_LENGTH = CompletionEntry._meta.get_field('key').max_length
+# 1つの値に作るキーの数（先頭の語から数えて何語目までをキーの始まりにするか）
+MAX_KEYS = 8
+
+# カタカナ（ァ〜ヶ、ヽヾ）をひらがなにする
+KANA_FOLD = {code: code - 0x60 for code in [*range(0x30A1, 0x30F7), 0x30FD, 0x30FE]}
+
+
+def _words(text):
+    """全角・半角、大文字・小文字（search.normalize）とカタカナ・ひらがなの揺れを吸収した語"""
+    return [word.translate(KANA_FOLD) for word in search.split_words(text)]
+
+
+def completion_keys(value):
+    """値を引くためのキー（値の先頭と、2語目以降の各語から始まるもの）"""
+    words = _words(value)
+    keys = []
+    for start in range(min(len(words), MAX_KEYS)):
+        key = ''.join(words[start:])[:KEY_LENGTH]
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def query_key(query):
+    """入力中の文字列をキーと比べる形にする（キーより長い分は比べない）"""
+    return ''.join(_words(query))[:KEY_LENGTH]
+
+
+def prefix_end(prefix):
+    """prefix で始まる文字列がすべてこれより前に並ぶ、最小の文字列"""
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+
+def _matching(queryset, prefix):
+    """キーが prefix で始まるエントリを、キーの順に読むクエリセット"""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'mysql':
+        # 照合順序が濁点や大文字・小文字を区別しないので、範囲の上限が使えない。
+        # 前方一致の LIKE もインデックスを使う（多めに一致した分は complete() で除く）
+        return queryset.filter(key__istartswith=prefix).order_by('key')
+    key = F('key')
+    if vendor == 'postgresql':
+        # 既定の照合順序の並びはコードポイント順と違うので "C" で比べる
+        key = Collate('key', 'C')
+    queryset = queryset.alias(prefix_key=key).filter(prefix_key__gte=prefix)
+    end = prefix_end(prefix)
+    if end is not None:
+        queryset = queryset.filter(prefix_key__lt=end)
+    return queryset.order_by('prefix_key')
+
+
+def entries(user_id, query):
+    """入力中の文字列に前方一致するエントリのクエリセット（キーの順）"""
+    return _matching(CompletionEntry.objects.filter(user_id=user_id), query_key(query))
+
+
+def complete(user_id, query, limit=10):
+    """入力中の文字列に前方一致するタイトル・著者を limit 件まで返す
+
+    [{'kind': 種類, 'value': 値, 'count': 冊数}] をキーの順に返す。
+    """
+    prefix = query_key(query)
+    if not prefix:
+        return []
+    rows = entries(user_id, query).values_list('kind', 'key', 'value', 'count')
+    suggestions, seen = [], set()
+    # 同じ値が複数のキー（先頭と各語）で一致することがあるので、多めに読んでおく
+    for kind, key, value, count in rows[:limit * 2]:
+        if not key.startswith(prefix) or (kind, value) in seen:
+            continue
+        seen.add((kind, value))
+        suggestions.append({'kind': kind, 'value': value, 'count': count})
+        if len(suggestions) == limit:
+            break
+    return suggestions
+
+
+def completion_counts(books):
+    """書籍のクエリセットから {(種類, 値): 冊数} を求める（マイグレーションからも使う）"""
+    books = books.order_by()
+    counts = {}
+    for kind in (TITLE, AUTHOR):
+        for value, count in books.values_list(kind).annotate(count=Count('pk')):
+            counts[kind, value] = count
+    return counts
+
+
+def build_entries(model, user_id, counts):
+    """{(種類, 値): 冊数} から model（CompletionEntry）のインスタンスを作る（マイグレーションからも使う）"""
+    return [
+        model(user_id=user_id, kind=kind, key=key, value=value, count=count)
+        for (kind, value), count in sorted(counts.items())
+        for key in completion_keys(value)
+    ]
+
+
+def rebuild_user(user_id):
+    """ユーザーの補完のエントリを Book から作り直す"""
+    counts = completion_counts(Book.objects.filter(user_id=user_id))
+    with transaction.atomic():
+        CompletionEntry.objects.filter(user_id=user_id).delete()
+        CompletionEntry.objects.bulk_create(build_entries(CompletionEntry, user_id, counts), batch_size=1000)
+
+
+def apply(user_id, deltas):
+    """冊数に差分を加える。deltas は {(種類, 値): 増減}"""
+    deltas = {entry: delta for entry, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # 失敗を捕まえてやり直すことはないので、呼び出し側のトランザクションの中ならセーブポイントは作らない
+    with transaction.atomic(savepoint=False):
+        added = {entry: delta for entry, delta in deltas.items() if delta > 0}
+        if added:
+            _upsert(user_id, added)
+        # 減るほうは値ごとではなく増減ごとに UPDATE する
+        removed, emptied = defaultdict(lambda: defaultdict(list)), defaultdict(list)
+        for (kind, value), delta in deltas.items():
+            if delta < 0:
+                removed[delta][kind].append(value)
+                emptied[kind].append(value)
+        for delta, values in removed.items():
+            _entries(user_id, values).update(count=F('count') + delta)
+        if emptied:
+            _entries(user_id, emptied).filter(count__lte=0).delete()
+
+
+def _upsert(user_id, counts):
+    """エントリを作り、すでにあれば冊数に加える（1文で行う）
+
+    読んでから書くと SQLite では同時に書き込むリクエストとの間でロックを上げられずに失敗し、
+    書き込みの文が増えるほどロックの待ちも長くなる。
+    """
+    opts = CompletionEntry._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = [quote(opts.get_field(name).column) for name in ('user', 'kind', 'value', 'key', 'count')]
+    count = columns[-1]
+    if connection.vendor == 'mysql':
+        conflict = f'ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count})'
+    else:
+        # 一意制約 booklog_completion_unique の列
+        conflict = f'ON CONFLICT ({", ".join(columns[:4])}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}'
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES (%s, %s, %s, %s, %s) {conflict}'
+    rows = [
+        (user_id, entry.kind, entry.value, entry.key, entry.count)
+        for entry in build_entries(CompletionEntry, user_id, counts)
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _entries(user_id, values):
+    """values（{種類: [値]}）のエントリ"""
+    condition = Q()
+    for kind, kind_values in values.items():
+        condition |= Q(kind=kind, value__in=kind_values)
+    return CompletionEntry.objects.filter(condition, user_id=user_id)
+
+
+def _remember(book):
+    book._completion_loaded = (book.title, book.author)
+
+
+def _book_values(title, author):
+    return [(TITLE, title), (AUTHOR, author)]
+
+
+def books_added(user_id, books):
+    deltas = defaultdict(int)
+    for book in books:
+        for entry in _book_values(book.title, book.author):
+            deltas[entry] += 1
+        _remember(book)
+    apply(user_id, deltas)
+
+
+def books_changed(user_id, books):
+    """書籍の更新。読み込んだ時点（Book.from_db）のタイトル・著者との差分を数える"""
+    deltas = defaultdict(int)
+    for book in books:
+        loaded = getattr(book, '_completion_loaded', None)
+        if loaded is None:
+            # 読み込んだ時点の値が分からない（Book(pk=...) を直接保存した場合など）
+            rebuild_user(user_id)
+            return
+        for entry in _book_values(book.title, book.author):
+            deltas[entry] += 1
+        for entry in _book_values(*loaded):
+            deltas[entry] -= 1
+        _remember(book)
+    apply(user_id, deltas)
+
+
+def books_removed(user_id, books):
+    """書籍の削除。books は (タイトル, 著者)"""
+    deltas = defaultdict(int)
+    for title, author in books:
+        for entry in _book_values(title, author):
+            deltas[entry] -= 1
+    apply(user_id, deltas)
@@ -0,0 +1,135 @@
+# backend/booklog/conditional.py
+"""条件付き GET（ETag / Last-Modified）
+
+ビューはテンプレートを描画する前に安価なクエリで検証子を計算し、
+クライアントの持っている版と同じなら 304 Not Modified を返す。
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Book, LibraryState
+
+
+def touch_library(user_id):
+    """ユーザーの蔵書の最終変更日時を更新し、変更の通番（booklog.sync）を進める"""
+    now = timezone.now()
+    state = LibraryState.objects.filter(user_id=user_id)
+    if not state.update(changed_at=now, seq=F('seq') + 1):
+        _, created = LibraryState.objects.get_or_create(user_id=user_id, defaults={'changed_at': now, 'seq': 1})
+        if not created:
+            state.update(changed_at=now, seq=F('seq') + 1)
+
+
+def _library_state(user_id):
+    return LibraryState.objects.filter(user_id=user_id).values_list('changed_at', 'seq')
+
+
+def library_state(user_id):
+    """蔵書の (最終変更日時, 変更の通番)。まだ変更が無ければ None"""
+    return _library_state(user_id).first()
+
+
+async def alibrary_state(user_id):
+    return await _library_state(user_id).afirst()
+
+
+_BOOK_VALIDATORS = {
+    'updated_at': Max('updated_at'),
+    'memo_updated_at': Max('memos__updated_at'),
+    'memo_count': Count('memos'),
+}
+
+
+def book_validators(user_id, book_id):
+    """書籍とそのメモの更新状況を1回の集計クエリで取得する
+
+    メモの削除は件数の変化で検出する。
+    """
+    return Book.objects.filter(pk=book_id, user_id=user_id).aggregate(**_BOOK_VALIDATORS)
+
+
+async def abook_validators(user_id, book_id):
+    return await Book.objects.filter(pk=book_id, user_id=user_id).aaggregate(**_BOOK_VALIDATORS)
+
+
+def make_etag(*parts):
+    # デプロイでテンプレートが変わったら古い ETag を無効にする
+    raw = '|'.join(str(part) for part in (settings.BOOKLOG_RENDER_VERSION, *parts))
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def session_marker(request):
+    """ページのフォームに埋め込む CSRF トークンの元になる値とセッションの Cookie
+
+    ログインし直すと CSRF トークンが変わるので、ETag に含めて、蔵書が変わっていなくても
+    古いトークンを持つページ（ログアウトのフォームなど）を 304 で使い回させない。
+    """
+    get_token(request)  # 未発行ならここで発行して、ページに埋め込むものと同じ値を使う
+    # get_token() の戻り値は毎回マスクが変わるので、元の値（シークレット）を使う
+    return request.META['CSRF_COOKIE'], request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+
+
+def list_validators(request, state):
+    """一覧の (etag, last_modified)。state は library_state() の結果"""
+    if state is None:
+        return None, None
+    changed_at, seq = state
+    etag = make_etag(
+        'book_list', request.user.pk, changed_at.isoformat(), seq, request.GET.urlencode(), *session_marker(request),
+    )
+    return etag, changed_at
+
+
+def detail_version(state):
+    """詳細のページ断片キャッシュ（booklog.cache）の版。state は book_validators() の結果"""
+    if state['updated_at'] is None:
+        return None
+    return (state['updated_at'].isoformat(), state['memo_updated_at'], state['memo_count'])
+
+
+def detail_validators(request, book_id, state):
+    """詳細の (etag, last_modified)。state は book_validators() の結果"""
+    if state['updated_at'] is None:
+        return None, None  # 存在しない書籍は通常どおり 404 にする
+    etag = make_etag(
+        'book_detail', book_id, state['updated_at'].isoformat(),
+        state['memo_updated_at'], state['memo_count'], *session_marker(request),
+    )
+    return etag, max(filter(None, [state['updated_at'], state['memo_updated_at']]))
+
+
+def not_modified_response(request, etag, last_modified):
+    """クライアントの版が最新なら 304（または 412）のレスポンス、そうでなければ None"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def apply_validators(response, etag, last_modified):
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    # ログインユーザー専用のページなので共有キャッシュには置かせず、毎回再検証させる
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """get_validators() が返す ETag / Last-Modified で条件付き GET に応える"""
+
+    def get_validators(self):
+        """(etag, last_modified) を返す。計算できない場合は (None, None)"""
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = not_modified_response(request, etag, last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return apply_validators(response, etag, last_modified)
@@ -0,0 +1,240 @@
+# backend/booklog/counting.py
+"""検索結果の件数と、著者別・出版年別の件数（ファセット）
+
+件数は BOOKLOG_COUNT_CAP 件までなら正確に数える。LIMIT を付けたサブクエリを
+COUNT するので、結果がどれだけ多くても上限 + 1 件より先は読まない。上限を
+超えたときは、PostgreSQL ならプランナの推定行数（EXPLAIN）を「約 N 件」、
+それ以外の DB では「1000+ 件」のように表示する。上限を超えた結果のページ送りは
+件数に頼らず、各ページで1件多く読んで次のページの有無を決める（CountingPage）。
+
+ファセットは検索結果を (著者, 出版年) で1回だけ GROUP BY して両方を求め、
+蔵書の版（LibraryState.seq）を含むキー（booklog.cache）でキャッシュする。
+"""
+import json
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+from django.utils.functional import cached_property
+
+from .cache import aget_fragment, aset_fragment, fragment_key, get_fragment, set_fragment
+from .models import Book
+from .search import normalize
+
+
+class ResultCount:
+    """件数。exact でなければ value は推定値か上限"""
+
+    def __init__(self, value, exact=True, estimated=False):
+        self.value = value
+        self.exact = exact
+        self.estimated = estimated
+
+    def __repr__(self):
+        return f'<ResultCount {self}>'
+
+    def __str__(self):
+        if self.exact:
+            return f'{self.value:,}'
+        if self.estimated:
+            return f'約 {self.value:,}'
+        return f'{self.value:,}+'
+
+
+def _capped(queryset, cap):
+    # 並べ替えは件数に関係ないので外す（関連度の計算は GROUP BY のまま残る）
+    return queryset.order_by()[:cap + 1]
+
+
+def _plan_rows(plan):
+    try:
+        return int(json.loads(plan)[0]['Plan']['Plan Rows'])
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def estimate_count(queryset):
+    """プランナの推定行数（PostgreSQL 以外は None）"""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    return _plan_rows(queryset.order_by().explain(format='json'))
+
+
+async def aestimate_count(queryset):
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    return _plan_rows(await queryset.order_by().aexplain(format='json'))
+
+
+def _result_count(rows, cap, estimate):
+    if rows <= cap:
+        return ResultCount(rows)
+    # 推定値が上限より小さいときは統計が古いので、上限だけを示す
+    if estimate is not None and estimate > cap:
+        return ResultCount(estimate, exact=False, estimated=True)
+    return ResultCount(cap, exact=False)
+
+
+def count_results(queryset, cap=None):
+    cap = settings.BOOKLOG_COUNT_CAP if cap is None else cap
+    rows = _capped(queryset, cap).count()
+    estimate = estimate_count(queryset) if rows > cap else None
+    return _result_count(rows, cap, estimate)
+
+
+async def acount_results(queryset, cap=None):
+    cap = settings.BOOKLOG_COUNT_CAP if cap is None else cap
+    rows = await _capped(queryset, cap).acount()
+    estimate = await aestimate_count(queryset) if rows > cap else None
+    return _result_count(rows, cap, estimate)
+
+
+class CountingPage(Page):
+    """CountingPaginator のページ
+
+    has_next を渡したとき（件数が上限を超えたとき）は、次のページの有無を件数ではなく
+    1件多く読んだ結果で決める。
+    """
+
+    def __init__(self, object_list, number, paginator, has_next=None):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        if self._has_next is None:
+            return super().has_next()
+        return self._has_next
+
+    def end_index(self):
+        if self._has_next is None:
+            return super().end_index()
+        return self.start_index() + len(self.object_list) - 1
+
+    @property
+    def page_range(self):
+        """ページ番号のリンクを出す範囲（件数が分からないときは次のページまで）"""
+        if self._has_next is None:
+            return self.paginator.page_range
+        last = self.number + 1 if self._has_next else self.number
+        return range(1, max(self.paginator.num_pages, last) + 1)
+
+
+class CountingPaginator(Paginator):
+    """件数を count_results() で数える Paginator
+
+    num_pages は上限の件数までで数える。上限を超える結果はページ番号に上限を設けず、
+    ページを読んでみて空なら EmptyPage にする。非同期のビューは result_count を先に設定しておく。
+    """
+
+    @cached_property
+    def result_count(self):
+        return count_results(self.object_list)
+
+    @cached_property
+    def count(self):
+        return min(self.result_count.value, settings.BOOKLOG_COUNT_CAP)
+
+    def validate_number(self, number):
+        if self.result_count.exact:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def window(self, number):
+        """number ページの行を読むクエリセット（KeysetPaginator.window と同じく、非同期のビューは async for で読む）
+
+        件数が上限を超えたときは、次のページの有無の判定用に1件多く読む。
+        """
+        bottom = (number - 1) * self.per_page
+        extra = 0 if self.result_count.exact else 1
+        return self.object_list[bottom:bottom + self.per_page + extra]
+
+    def page_from_rows(self, rows, number):
+        if self.result_count.exact:
+            return self._get_page(rows, number, self)
+        if not rows:
+            raise EmptyPage(self.error_messages['no_results'])
+        return self._get_page(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+    def _get_page(self, *args, **kwargs):
+        return CountingPage(*args, **kwargs)
+
+
+FACET_PARAMS = ('author', 'year')
+
+
+def facet_context(params):
+    """選択中のファセットと、ページ送りなどのリンクに付け足す GET パラメータ（filter_query）"""
+    selected = {name: params.get(name, '') for name in FACET_PARAMS}
+    return {**selected, 'filter_query': urlencode({k: v for k, v in selected.items() if v})}
+
+
+def apply_facet_filters(queryset, params):
+    """ファセットで選んだ著者（author）・出版年（year）で絞り込む"""
+    author = params.get('author')
+    if author:
+        queryset = queryset.filter(author=author)
+    year = params.get('year', '')
+    if year.isdigit():
+        queryset = queryset.filter(published_date__year=int(year))
+    return queryset
+
+
+def _facet_rows(queryset):
+    # 関連度の集計（GROUP BY）と混ざらないよう、検索結果は id のサブクエリにする
+    return (
+        Book.objects.filter(pk__in=queryset.order_by().values('pk'))
+        .order_by()
+        .values('author', year=ExtractYear('published_date'))
+        .annotate(count=Count('pk'))
+    )
+
+
+def _facets_from_rows(rows):
+    authors, years = Counter(), Counter()
+    for row in rows:
+        authors[row['author']] += row['count']
+        if row['year'] is not None:
+            years[row['year']] += row['count']
+    limit = settings.BOOKLOG_FACET_LIMIT
+    return {
+        'authors': sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:limit],
+        'years': sorted(years.items(), key=lambda item: (-item[1], -item[0]))[:limit],
+    }
+
+
+def facets_key(user_id, version, query):
+    return fragment_key(user_id, version, 'facets', [('query', normalize(query))])
+
+
+def facet_counts(user_id, version, queryset, query):
+    """検索結果（queryset、ファセットでの絞り込み前）の {'authors': [(著者, 件数)], 'years': [(年, 件数)]}
+
+    version は蔵書の版（LibraryState.seq）で、キャッシュのキーに含める。
+    """
+    key = facets_key(user_id, version, query)
+    facets = get_fragment(key)
+    if facets is None:
+        facets = _facets_from_rows(_facet_rows(queryset))
+        set_fragment(key, facets)
+    return facets
+
+
+async def afacet_counts(user_id, version, queryset, query):
+    key = facets_key(user_id, version, query)
+    facets = await aget_fragment(key)
+    if facets is None:
+        facets = _facets_from_rows([row async for row in _facet_rows(queryset)])
+        await aset_fragment(key, facets)
+    return facets
@@ -0,0 +1,136 @@
+# backend/booklog/deletion.py
+"""書籍・メモの論理削除と、削除済みの行の物理削除
+
+画面・API からの削除は行を消さずに deleted_at を設定するだけにする（書籍なら
+書籍とメモへの UPDATE が1回ずつ）。メモや検索インデックスの行をカスケードで
+消さないので、蔵書がどれだけ大きくても削除のリクエストの時間は変わらない。
+削除済みの行は既定のマネージャー（Book.objects / Memo.objects）から見えなくなり、
+集計・変更フィード（booklog.sync、ページ断片キャッシュの版にもなる）もこの時点で更新する。
+
+物理削除は ``manage.py purge_deleted`` がまとめて行う。BOOKLOG_BULK_BATCH_SIZE 件ずつ
+別のトランザクションで消すので、1回のロックの範囲は件数に関係なく一定になる。
+退会したユーザーの行（purge_user）も同じく、ユーザーの削除のカスケードに任せずに少しずつ消す。
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import completion, search, stats, sync
+from .models import (
+    Book, CompletionEntry, Job, LibraryChange, LibraryStatBucket, Memo, SearchDocument, SearchToken,
+)
+
+# ユーザーの削除でカスケードする、ユーザーごとの派生データ（行数が蔵書の大きさに比例するもの）
+USER_TABLES = [SearchToken, SearchDocument, CompletionEntry, LibraryStatBucket, LibraryChange]
+
+
+def _library_changed(user_id, kind, object_ids):
+    sync.record_changes(user_id, kind, object_ids, deleted=True)
+
+
+def soft_delete_books(user_id, queryset):
+    """ユーザーの書籍（とそのメモ）を論理削除して、削除した冊数を返す"""
+    now = timezone.now()
+    with transaction.atomic():
+        # 同時に削除されたときに二重に数えないよう、削除する行をロックしてから読む
+        books = list(
+            queryset.filter(user_id=user_id).order_by().select_for_update()
+            .values_list('pk', 'title', 'author', 'published_date', 'created_at')
+        )
+        if not books:
+            return 0
+        book_ids = [pk for pk, *_ in books]
+        Book.objects.filter(pk__in=book_ids).update(deleted_at=now, updated_at=now)
+        memos = Memo.objects.filter(book_id__in=book_ids).update(deleted_at=now, updated_at=now)
+        stats.books_removed(user_id, [values for _, _, *values in books], memos=memos)
+        completion.books_removed(user_id, [(title, author) for _, title, author, *_ in books])
+        _library_changed(user_id, sync.BOOK, book_ids)
+    return len(books)
+
+
+def soft_delete_book(book):
+    return soft_delete_books(book.user_id, Book.objects.filter(pk=book.pk))
+
+
+def soft_delete_memos(user_id, queryset):
+    """ユーザーのメモを論理削除して、削除した件数を返す"""
+    now = timezone.now()
+    with transaction.atomic():
+        memos = list(
+            queryset.filter(book__user_id=user_id).order_by().select_for_update()
+            .values_list('pk', 'book_id')
+        )
+        if not memos:
+            return 0
+        memo_ids = [pk for pk, _ in memos]
+        Memo.objects.filter(pk__in=memo_ids).update(deleted_at=now, updated_at=now)
+        # メモの本文は書籍の検索ドキュメントに含まれている
+        search.index_books({book_id for _, book_id in memos})
+        stats.memos_added(user_id, -len(memos))
+        _library_changed(user_id, sync.MEMO, memo_ids)
+    return len(memos)
+
+
+def soft_delete_memo(memo):
+    return soft_delete_memos(memo.book.user_id, Memo.objects.filter(pk=memo.pk))
+
+
+def _purge(queryset, batch_size, tombstone=False, progress=None):
+    """queryset の行を batch_size 件ずつ物理削除して件数を返す
+
+    tombstone なら、まだ論理削除されていない行も消す前に論理削除する
+    （シグナルハンドラに1行ずつ集計などを更新させない）。
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            if tombstone:
+                model.objects.filter(pk__in=ids).update(deleted_at=timezone.now())
+            # 論理削除のあるモデルでは all_objects と同じく、削除済みの行も含めて消す
+            model._base_manager.filter(pk__in=ids).delete()
+        deleted += len(ids)
+        if progress:
+            progress(model._meta.model_name, deleted)
+
+
+def purge_deleted(before, batch_size=None, progress=None):
+    """before より前に論理削除された書籍・メモを物理削除する
+
+    メモを先に消しておくので、書籍を消すときにカスケードで消えるのは検索インデックスだけになる。
+    progress はバッチごとに (モデル名, それまでの件数) で呼ばれる。
+    """
+    batch_size = batch_size or settings.BOOKLOG_BULK_BATCH_SIZE
+    return {
+        'memos': _purge(Memo.all_objects.filter(deleted_at__lt=before), batch_size, progress=progress),
+        'books': _purge(Book.all_objects.filter(deleted_at__lt=before), batch_size, progress=progress),
+    }
+
+
+def _detach_jobs(user_id, batch_size):
+    """ジョブの履歴は残すので、ユーザーの削除（SET_NULL）の1文で更新させず先に user を外す"""
+    jobs = Job.objects.filter(user_id=user_id)
+    while ids := list(jobs.order_by('pk').values_list('pk', flat=True)[:batch_size]):
+        Job.objects.filter(pk__in=ids).update(user=None)
+
+
+def purge_user(user_id, batch_size=None, progress=None):
+    """退会したユーザーの書籍・メモを（論理削除されていないものも）すべて物理削除する
+
+    検索インデックス・補完・集計・変更フィードの行とジョブの紐づけも少しずつ消しておくので、
+    最後にユーザーを削除するときにカスケードで消えるのはユーザーごとに1行の状態だけになる。
+    """
+    batch_size = batch_size or settings.BOOKLOG_BULK_BATCH_SIZE
+    purged = {
+        'memos': _purge(
+            Memo.all_objects.filter(book__user_id=user_id), batch_size, tombstone=True, progress=progress,
+        ),
+        'books': _purge(Book.all_objects.filter(user_id=user_id), batch_size, tombstone=True, progress=progress),
+    }
+    for model in USER_TABLES:
+        _purge(model.objects.filter(user_id=user_id), batch_size, progress=progress)
+    _detach_jobs(user_id, batch_size)
+    return purged
@@ -0,0 +1,134 @@
+# backend/booklog/export.py
+"""蔵書のストリーミングエクスポート（CSV / NDJSON、gzip 圧縮可）
+
+書籍は QuerySet.iterator(chunk_size=...) で少しずつ読み、メモもチャンクごとに
+prefetch するので、蔵書の大きさに関係なくメモリ使用量は一定になる。
+"""
+import csv
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from .models import Book, Memo
+
+FORMATS = ('csv', 'ndjson')
+MEMO_MODES = ('nested', 'flat')
+
+BOOK_COLUMNS = ('id', 'title', 'author', 'published_date', 'created_at', 'updated_at')
+MEMO_COLUMNS = ('memo_id', 'memo_content', 'memo_created_at', 'memo_updated_at')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def book_record(book):
+    return {
+        'id': book.pk,
+        'title': book.title,
+        'author': book.author,
+        'published_date': _isoformat(book.published_date),
+        'created_at': _isoformat(book.created_at),
+        'updated_at': _isoformat(book.updated_at),
+    }
+
+
+def memo_record(memo):
+    return {
+        'memo_id': memo.pk,
+        'memo_content': memo.content,
+        'memo_created_at': _isoformat(memo.created_at),
+        'memo_updated_at': _isoformat(memo.updated_at),
+    }
+
+
+def iter_books(user, chunk_size=None):
+    memos = Prefetch('memos', queryset=Memo.objects.order_by('id'))
+    return (
+        Book.objects.filter(user=user)
+        .order_by('id')
+        .prefetch_related(memos)
+        .iterator(chunk_size=chunk_size or settings.BOOKLOG_EXPORT_CHUNK_SIZE)
+    )
+
+
+def iter_records(books, memos='nested'):
+    """nested は書籍1件につき1レコード（memos にメモの配列）、flat はメモ1件につき1レコード"""
+    for book in books:
+        record = book_record(book)
+        if memos == 'nested':
+            record['memos'] = [memo_record(memo) for memo in book.memos.all()]
+            yield record
+            continue
+        book_memos = book.memos.all()
+        if not book_memos:
+            yield {**record, **dict.fromkeys(MEMO_COLUMNS)}
+        for memo in book_memos:
+            yield {**record, **memo_record(memo)}
+
+
+class _Echo:
+    """csv.writer の書き込み先として、書かれた行をそのまま返す"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(records, memos='nested'):
+    # Excel で文字化けしないよう BOM を付ける
+    yield '\ufeff'
+    writer = csv.writer(_Echo())
+    columns = BOOK_COLUMNS + (('memos',) if memos == 'nested' else MEMO_COLUMNS)
+    yield writer.writerow(columns)
+    for record in records:
+        if memos == 'nested':
+            record = {**record, 'memos': json.dumps(record['memos'], ensure_ascii=False)}
+        yield writer.writerow(['' if record[column] is None else record[column] for column in columns])
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def buffered(chunks, size=64 * 1024):
+    """小さな行をまとめて、だいたい size バイトごとに返す"""
+    buffer, length = [], 0
+    for chunk in chunks:
+        data = chunk.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_library(user, format='csv', memos='nested', gzip=False, chunk_size=None):
+    """エクスポートするバイト列を少しずつ返すジェネレータ"""
+    records = iter_records(iter_books(user, chunk_size), memos)
+    lines = iter_csv(records, memos) if format == 'csv' else iter_ndjson(records)
+    chunks = buffered(lines)
+    return gzip_stream(chunks) if gzip else chunks
+
+
+def export_filename(format, gzip=False, date=None):
+    name = f"booklog-{date:%Y%m%d}" if date else 'booklog'
+    return f"{name}.{format}{'.gz' if gzip else ''}"
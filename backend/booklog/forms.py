@@ -27,4 +27,23 @@ class MemoForm(forms.ModelForm):
         }
         labels = {
             'content': 'メモ内容',
-        }
\ No newline at end of file
+        }
+
+class ImportForm(forms.Form):
+    FORMAT_CHOICES = [
+        ('auto', 'ファイル名から判定'),
+        ('csv', 'CSV（booklog のエクスポート）'),
+        ('goodreads', 'Goodreads の CSV'),
+        ('ndjson', 'JSON Lines'),
+    ]
+
+    file = forms.FileField(
+        label='ファイル',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control'}),
+    )
+    format = forms.ChoiceField(
+        label='形式',
+        choices=FORMAT_CHOICES,
+        initial='auto',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
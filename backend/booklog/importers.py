@@ -0,0 +1,293 @@
+# backend/booklog/importers.py
+"""書籍の一括インポート（CSV / NDJSON / Goodreads の CSV）
+
+ファイルは1行ずつ読み、batch_size 行ごとに検証・重複除外・bulk_create を行う。
+検証には BookForm / MemoForm のフィールドをそのまま使うので、画面から
+登録する場合と同じ規則になる（フォームを1行ごとに作ると遅いのでフィールドだけ使う）。
+
+同じ (タイトル, 著者) の書籍がすでにあれば、その行は登録しない。ファイル内で
+同じ書籍が繰り返される場合（エクスポートの memos=flat など）はメモをまとめる。
+"""
+import csv
+import gzip
+import io
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .forms import BookForm, MemoForm
+from .models import Book, Memo
+from .signals import bulk_changed
+
+FORMATS = ('auto', 'csv', 'goodreads', 'ndjson')
+
+# Goodreads のエクスポートにしかない列（ヘッダーにあれば Goodreads 形式とみなす）
+GOODREADS_COLUMNS = {'Book Id', 'Exclusive Shelf', 'My Rating'}
+
+
+class ImportFailed(Exception):
+    """ファイル自体が読めないなど、行単位で続けられないエラー"""
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class ImportResult:
+    """インポートの進捗と結果（エラーは max_errors 件まで詳細を残す）"""
+
+    def __init__(self, max_errors=100):
+        self.processed = 0
+        self.created = 0
+        self.memos = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def __repr__(self):
+        return (
+            f'<ImportResult processed={self.processed} created={self.created} '
+            f'duplicates={self.duplicates} errors={self.error_count}>'
+        )
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, errors))
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'memos': self.memos,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'errors': errors} for line, errors in self.errors],
+        }
+
+
+def detect_format(filename):
+    name = (filename or '').lower().removesuffix('.gz')
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def open_text(fileobj, filename=None):
+    """バイナリのファイルをテキストとして開く（.gz なら展開しながら読む）"""
+    if (filename or '').lower().endswith('.gz'):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def _memo_contents(value):
+    """エクスポートの memos 列（JSON の配列）や NDJSON の memos をメモ本文のリストにする"""
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise RowError({'memos': ['JSON の配列で指定してください']})
+    if not isinstance(value, list):
+        raise RowError({'memos': ['配列で指定してください']})
+    contents = []
+    for memo in value:
+        if isinstance(memo, dict):
+            memo = memo.get('memo_content', memo.get('content'))
+        contents.append(memo)
+    return contents
+
+
+def from_booklog(row):
+    contents = _memo_contents(row.get('memos'))
+    if row.get('memo_content'):
+        contents.append(row['memo_content'])
+    return {
+        'title': row.get('title'),
+        'author': row.get('author'),
+        'published_date': row.get('published_date'),
+        'memos': contents,
+    }
+
+
+def from_goodreads(row):
+    year = (row.get('Original Publication Year') or row.get('Year Published') or '').strip()
+    return {
+        'title': row.get('Title'),
+        'author': row.get('Author'),
+        'published_date': f'{year}-01-01' if year else None,
+        'memos': [row[column] for column in ('My Review', 'Private Notes') if (row.get(column) or '').strip()],
+    }
+
+
+def read_rows(stream, format='csv'):
+    """(行番号, 行の dict または RowError) を順に返す"""
+    try:
+        if format == 'ndjson':
+            for line, text in enumerate(stream, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                    if not isinstance(row, dict):
+                        raise RowError({'__all__': ['オブジェクトを指定してください']})
+                    yield line, from_booklog(row)
+                except ValueError:
+                    yield line, RowError({'__all__': ['JSON を解析できません']})
+                except RowError as error:
+                    yield line, error
+            return
+
+        reader = csv.DictReader(stream)
+        goodreads = format == 'goodreads' or bool(GOODREADS_COLUMNS & set(reader.fieldnames or ()))
+        convert = from_goodreads if goodreads else from_booklog
+        for row in reader:
+            try:
+                yield reader.line_num, convert(row)
+            except RowError as error:
+                yield reader.line_num, error
+    except UnicodeDecodeError:
+        raise ImportFailed('UTF-8 のファイルを指定してください')
+    except (csv.Error, OSError) as error:
+        raise ImportFailed(f'ファイルを読み込めません: {error}')
+
+
+class RowValidator:
+    """BookForm / MemoForm のフィールドで1行を検証する"""
+
+    def __init__(self):
+        self.book_fields = BookForm().fields
+        self.memo_field = MemoForm().fields['content']
+
+    def clean(self, row):
+        cleaned, errors = {}, {}
+        for name, field in self.book_fields.items():
+            try:
+                cleaned[name] = field.clean(row.get(name))
+            except ValidationError as error:
+                errors[name] = error.messages
+        memos = []
+        for content in row['memos']:
+            try:
+                memos.append(self.memo_field.clean(content))
+            except ValidationError as error:
+                errors.setdefault('memos', []).extend(error.messages)
+        if errors:
+            raise RowError(errors)
+        return cleaned, memos
+
+
+class BookImporter:
+    def __init__(self, user, batch_size=None, progress=None, max_errors=100):
+        self.user = user
+        self.batch_size = batch_size or settings.BOOKLOG_IMPORT_BATCH_SIZE
+        self.progress = progress
+        self.result = ImportResult(max_errors)
+        self.validator = RowValidator()
+        # このインポートで登録した書籍の (タイトル, 著者) -> pk
+        self.created = {}
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            self.result.processed += 1
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                cleaned, memos = self.validator.clean(row)
+            except RowError as error:
+                self.result.add_error(line, error.errors)
+                continue
+            batch.append(((cleaned['title'], cleaned['author']), cleaned, memos))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return self.result
+
+    def flush(self, batch):
+        titles = {key[0] for key, _, _ in batch if key not in self.created}
+        existing = set(
+            Book.objects.filter(user=self.user, title__in=titles).order_by().values_list('title', 'author')
+        ) if titles else set()
+
+        pending, extra_memos = {}, []
+        for key, cleaned, memos in batch:
+            if key in pending:
+                pending[key][1].extend(memos)
+                self.result.duplicates += 1
+            elif key in self.created:
+                extra_memos += [Memo(book_id=self.created[key], content=content) for content in memos]
+                self.result.duplicates += 1
+            elif key in existing:
+                self.result.duplicates += 1
+            else:
+                pending[key] = (Book(user=self.user, **cleaned), memos)
+
+        with transaction.atomic():
+            books = Book.objects.bulk_create(
+                [book for book, _ in pending.values()], batch_size=settings.BOOKLOG_BULK_BATCH_SIZE
+            )
+            if books and books[0].pk is None:
+                self.fill_pks(books)
+            memos = [
+                Memo(book_id=book.pk, content=content)
+                for book, contents in pending.values()
+                for content in contents
+            ]
+            last_memo = self.last_memo_pk(extra_memos)
+            Memo.objects.bulk_create(memos + extra_memos, batch_size=settings.BOOKLOG_BULK_BATCH_SIZE)
+            if last_memo is not None:
+                extra_memos = self.fill_memo_pks(extra_memos, last_memo)
+            # 書籍の再インデックスは追加したメモも含めて行われる
+            if books:
+                bulk_changed.send(sender=Book, user_id=self.user.pk, objects=books, created=True)
+            if extra_memos:
+                bulk_changed.send(sender=Memo, user_id=self.user.pk, objects=extra_memos, created=True)
+
+        self.created.update({(book.title, book.author): book.pk for book in books})
+        self.result.created += len(books)
+        self.result.memos += len(memos) + len(extra_memos)
+        if self.progress:
+            self.progress(self.result)
+
+    def fill_pks(self, books):
+        """bulk_create が pk を返さない DB（MySQL）では登録後に引き直す"""
+        pks = {
+            (title, author): pk
+            for title, author, pk in Book.objects.filter(
+                user=self.user, title__in={book.title for book in books}
+            ).values_list('title', 'author', 'pk')
+        }
+        for book in books:
+            book.pk = pks[(book.title, book.author)]
+
+    def last_memo_pk(self, memos):
+        """bulk_create が pk を返さない DB（MySQL）では、登録前のメモの最後の pk を返す"""
+        if not memos or connection.features.can_return_rows_from_bulk_insert:
+            return None
+        return Memo.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    def fill_memo_pks(self, memos, last_memo):
+        """前のバッチで登録した書籍に追加したメモを引き直す
+
+        書籍と違って引き直す手がかり（タイトル・著者）がないので、登録前の最後の pk より後の行を読む。
+        """
+        return list(
+            Memo.objects.filter(book_id__in={memo.book_id for memo in memos}, pk__gt=last_memo).order_by('pk')
+        )
+
+
+def import_books(user, stream, format='csv', batch_size=None, progress=None, max_errors=100):
+    """テキストのストリームから書籍とメモを登録し、ImportResult を返す
+
+    progress を渡すとバッチを書き込むたびに ImportResult を渡して呼ぶ。
+    """
+    importer = BookImporter(user, batch_size=batch_size, progress=progress, max_errors=max_errors)
+    return importer.run(read_rows(stream, format))
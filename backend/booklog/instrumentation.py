@@ -0,0 +1,233 @@
+# backend/booklog/instrumentation.py
+"""リクエストごとの計測（BOOKLOG_INSTRUMENTATION か BOOKLOG_METRICS で MIDDLEWARE に追加される）
+
+1リクエストごとに次を記録し、BOOKLOG_INSTRUMENTATION なら Server-Timing ヘッダーと
+JSON 1行のログ（ロガー booklog.instrumentation）に、BOOKLOG_METRICS なら
+Prometheus のメトリクス（booklog.metrics）に出力する。
+
+- DB のクエリ数と合計時間（接続の execute_wrappers に record_query を入れて測る）
+- テンプレートの描画時間（TemplateResponse と、キャッシュする断片の描画）
+- ページ断片キャッシュのヒット・ミス
+- リクエスト全体の時間
+
+BOOKLOG_PROFILE_SAMPLE_RATE=N なら N 件に1件、BOOKLOG_PROFILE_SLOW_MS を超えた
+リクエストは cProfile の結果を BOOKLOG_PROFILE_DIR に .pstats で保存する
+（``python -m pstats <ファイル>`` で調べる）。遅いリクエストを捕まえるには
+全リクエストを計測する必要があるので、SLOW_MS を設定すると全体が少し遅くなる。
+ASGI ではイベントループのスレッドだけが計測の対象になる。
+"""
+import contextvars
+import cProfile
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from django.utils.functional import empty
+
+from . import metrics as prometheus
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('booklog_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.total = None
+        # 前のリクエストの DB 接続を使い回したか（DB を使わなかった・分からない場合は None）
+        self.connection_open = None
+        self.connection_reused = None
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        if self.queries and self.connection_open is not None:
+            self.connection_reused = self.connection_open
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'cache;desc="hit={self.cache_hits} miss={self.cache_misses}"',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'db_queries': self.queries,
+            'db_ms': round(self.query_time * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def current_metrics():
+    """計測中のリクエストの RequestMetrics（計測していなければ None）"""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_time += time.perf_counter() - started
+
+
+def instrument_connection(connection):
+    # 計測中でなければ何もしないので、一度入れたら外さない
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _connection_created(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+@contextmanager
+def timed_render():
+    """with の中をテンプレートの描画時間として記録する"""
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.render_time += time.perf_counter() - started
+
+
+def record_cache_lookup(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class InstrumentationMiddleware:
+    """リクエストを計測し、Server-Timing ヘッダーとログを出力する（同期・非同期の両方に対応）"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.counter = itertools.count()
+        # 他のスレッドの接続は作られたときに計測できるようにする
+        connection_created.connect(_connection_created, dispatch_uid='booklog.instrumentation')
+        connection_created.connect(prometheus.connection_opened, dispatch_uid='booklog.metrics')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics, profiler, sampled, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(profiler, token)
+        return self.finish(request, response, metrics, profiler, sampled)
+
+    async def __acall__(self, request):
+        metrics, profiler, sampled, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(profiler, token)
+        return self.finish(request, response, metrics, profiler, sampled)
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def start(self):
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+        rate = settings.BOOKLOG_PROFILE_SAMPLE_RATE
+        sampled = rate > 0 and next(self.counter) % rate == 0
+        profiler = None
+        if sampled or settings.BOOKLOG_PROFILE_SLOW_MS > 0:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 別のリクエストのプロファイルが動いている（ASGI で同時に来た場合など）
+                profiler = None
+        metrics = RequestMetrics()
+        if not self.async_mode:
+            # ASGI では接続がスレッドごとなので、イベントループのスレッドで調べても意味がない
+            metrics.connection_open = prometheus.connection_is_open()
+        return metrics, profiler, sampled, _current.set(metrics)
+
+    def stop(self, profiler, token):
+        if profiler is not None:
+            profiler.disable()
+        _current.reset(token)
+
+    def finish(self, request, response, metrics, profiler, sampled):
+        metrics.finish()
+        slow_ms = settings.BOOKLOG_PROFILE_SLOW_MS
+        profile_path = None
+        if profiler is not None and (sampled or (slow_ms > 0 and metrics.total * 1000 >= slow_ms)):
+            profile_path = save_profile(profiler, request, metrics)
+        if settings.BOOKLOG_METRICS:
+            prometheus.observe(request, response, metrics)
+        if settings.BOOKLOG_INSTRUMENTATION:
+            response.headers['Server-Timing'] = metrics.server_timing()
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'view': request.resolver_match.view_name if request.resolver_match else None,
+                'status': response.status_code,
+                'user_id': _user_id(request),
+                **metrics.as_dict(),
+                'profile': profile_path,
+            }
+            logger.info(json.dumps(record, ensure_ascii=False), extra={'request_metrics': record})
+        return response
+
+
+def _user_id(request):
+    # 未評価の request.user を評価するとクエリが走る（ASGI ではエラーになる）ので、取得済みのときだけ使う
+    user = getattr(request, 'user', None)
+    user = getattr(user, '_wrapped', user)
+    return None if user is empty else getattr(user, 'pk', None)
+
+
+def save_profile(profiler, request, metrics):
+    directory = settings.BOOKLOG_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+    name = f'{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{slug}-{metrics.total * 1000:.0f}ms.pstats'
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path)
+    return path
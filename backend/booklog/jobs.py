@@ -0,0 +1,194 @@
+# backend/booklog/jobs.py
+"""DB をキューにしたバックグラウンドジョブ
+
+外部のブローカーは使わず、Job テーブルから実行予定時刻を過ぎたジョブを
+ワーカー（``manage.py run_workers``）が取り出して実行する。取り出しは
+「status が queued のままなら running にする」条件付き UPDATE で行うので、
+SQLite でも複数のワーカーが同じジョブを二重に実行することはない。
+
+処理の本体は ``@task('kind')`` で登録する（booklog.tasks を参照）。
+失敗したジョブは max_attempts 回まで指数バックオフで再実行する。
+
+実行中のジョブは report_progress() のたびに locked_at を更新する（ハートビート）。
+BOOKLOG_JOB_TIMEOUT 秒以上更新されなければワーカーが落ちたとみなし、各ワーカーが
+BOOKLOG_JOB_STALE_CHECK_INTERVAL 秒ごとに待機中へ戻す。処理の本体は少なくとも
+BOOKLOG_JOB_TIMEOUT 秒に1回は report_progress() を呼ぶこと。
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class PermanentJobError(Exception):
+    """再実行しても成功しない失敗（入力ファイルが壊れているなど）"""
+
+
+def job_storage():
+    """インポートするファイルやエクスポートの結果を置くストレージ"""
+    return FileSystemStorage(location=settings.BOOKLOG_JOB_STORAGE_DIR)
+
+
+def task(kind, label, max_attempts=3):
+    """ジョブの処理本体を登録するデコレータ
+
+    関数は Job を受け取り、結果（JSON にできる値）を返す。label は状態ページに表示する名前。
+    """
+    def register(func):
+        TASKS[kind] = (func, max_attempts, label)
+        return func
+    return register
+
+
+def enqueue(kind, user=None, payload=None, run_at=None):
+    if kind not in TASKS:
+        raise KeyError(f'未登録のジョブです: {kind}')
+    return Job.objects.create(
+        kind=kind,
+        user=user,
+        payload=payload or {},
+        max_attempts=TASKS[kind][1],
+        run_at=run_at or timezone.now(),
+    )
+
+
+def worker_name(index):
+    """ワーカーの名前（locked_by）。ホスト・プロセスが違えば別の名前になる"""
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def report_progress(job, **progress):
+    """実行中のジョブの進捗を保存する（状態ページに表示される）
+
+    locked_at も更新するので、進捗を報告している間は requeue_stale() に戻されない。
+    """
+    job.progress = progress
+    job.locked_at = timezone.now()
+    Job.objects.filter(pk=job.pk).update(progress=progress, locked_at=job.locked_at)
+
+
+def backoff(attempts):
+    """attempts 回目の失敗の後、次に実行するまでの待ち時間"""
+    delay = settings.BOOKLOG_JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.BOOKLOG_JOB_RETRY_MAX_DELAY))
+
+
+def claim(worker, kinds=None):
+    """実行予定時刻を過ぎた最も古いジョブを1件取り出す（無ければ None）"""
+    while True:
+        candidates = Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now())
+        if kinds:
+            candidates = candidates.filter(kind__in=kinds)
+        pk = candidates.order_by('run_at', 'id').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        # 他のワーカーに先に取られたら次の候補を探す
+        if claimed:
+            return Job.objects.get(pk=pk)
+
+
+def run_job(job):
+    """取り出したジョブを実行し、結果に応じて完了・再実行待ち・失敗にする"""
+    func = TASKS[job.kind][0] if job.kind in TASKS else None
+    try:
+        if func is None:
+            raise PermanentJobError(f'未登録のジョブです: {job.kind}')
+        result = func(job)
+    except Exception as error:
+        retry = not isinstance(error, PermanentJobError) and job.attempts < job.max_attempts
+        logger.warning('ジョブ %s が失敗しました（%s 回目）', job, job.attempts, exc_info=True)
+        job.error = str(error) if isinstance(error, PermanentJobError) else traceback.format_exc()
+        if retry:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + backoff(job.attempts)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = result
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    # アカウント削除のジョブはユーザーが消えているので user は書き戻さない
+    Job.objects.filter(pk=job.pk).update(
+        status=job.status, result=job.result, error=job.error, run_at=job.run_at,
+        locked_by='', locked_at=None, finished_at=job.finished_at, progress=job.progress,
+    )
+    return job
+
+
+def requeue_stale():
+    """ワーカーが落ちて running のまま残ったジョブを待機中に戻す"""
+    limit = timezone.now() - timedelta(seconds=settings.BOOKLOG_JOB_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=limit)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error='ワーカーが応答しなくなりました', finished_at=timezone.now(),
+        locked_by='', locked_at=None,
+    )
+    queued = stale.update(status=Job.QUEUED, locked_by='', locked_at=None)
+    return failed + queued
+
+
+class Worker:
+    """ジョブを1件ずつ取り出して実行するループ（スレッドまたはプロセスで複数動かす）"""
+
+    def __init__(self, name=None, kinds=None, burst=False, poll_interval=1.0, stop_event=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.kinds = kinds
+        self.burst = burst
+        self.poll_interval = poll_interval
+        self.stop_event = stop_event or threading.Event()
+        self.processed = 0
+        self.checked_at = None
+
+    def check_stale(self):
+        """BOOKLOG_JOB_STALE_CHECK_INTERVAL 秒ごとに、落ちたワーカーのジョブを待機中に戻す"""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < settings.BOOKLOG_JOB_STALE_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        requeued = requeue_stale()
+        if requeued:
+            logger.warning('%s 件の止まっていたジョブを戻しました', requeued)
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                # 長く動くので、リクエストと同じように古い接続を閉じておく
+                # （テストのようにトランザクションの中で呼ばれた場合は閉じない）
+                if not connection.in_atomic_block:
+                    close_old_connections()
+                self.check_stale()
+                job = claim(self.name, self.kinds)
+                if job is None:
+                    if self.burst:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                run_job(job)
+                self.processed += 1
+        finally:
+            if not connection.in_atomic_block:
+                connection.close()
+        return self.processed
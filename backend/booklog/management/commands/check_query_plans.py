@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booklog import queryplans
+
+
+class Command(BaseCommand):
+    help = 'よく実行されるクエリが複合インデックスを使っているかを EXPLAIN で確認する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='確認に使うユーザー名（蔵書の大きいユーザーを指定する）')
+        parser.add_argument('--query', action='append', choices=sorted(queryplans.HOT_QUERIES), dest='queries')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"ユーザー {options['user']} が見つかりません")
+
+        failed = []
+        for name, index, plan, problems in queryplans.check_plans(user, options['queries']):
+            if problems is None:
+                self.stdout.write(self.style.WARNING(f'{name}: この DB のプランは判定できません'))
+            elif problems:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f"{name}: {'、'.join(problems)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: {index} を使っています'))
+            if problems or options['verbosity'] > 1:
+                self.stdout.write(plan)
+        if failed:
+            raise CommandError(f"インデックスを使っていないクエリがあります: {', '.join(failed)}")
@@ -0,0 +1,40 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booklog import export
+
+
+class Command(BaseCommand):
+    help = 'ユーザーの蔵書を CSV / NDJSON でエクスポートする'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='対象ユーザー名')
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--memos', choices=export.MEMO_MODES, default='nested')
+        parser.add_argument('--gzip', action='store_true', help='gzip で圧縮する')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--output', '-o', default='-', help='出力先ファイル（省略時は標準出力）')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"ユーザー {options['user']} が見つかりません")
+
+        chunks = export.export_library(
+            user, options['format'], options['memos'],
+            gzip=options['gzip'], chunk_size=options['chunk_size'],
+        )
+        if options['output'] == '-':
+            self.write_chunks(chunks, sys.stdout.buffer)
+            return
+        with open(options['output'], 'wb') as output:
+            self.write_chunks(chunks, output)
+        self.stderr.write(self.style.SUCCESS(f"{options['output']} に書き出しました"))
+
+    def write_chunks(self, chunks, output):
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
@@ -0,0 +1,53 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booklog import importers
+
+
+class Command(BaseCommand):
+    help = 'CSV / NDJSON / Goodreads の CSV から書籍とメモを一括登録する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='登録先のユーザー名')
+        parser.add_argument('path', help='読み込むファイル（- で標準入力）')
+        parser.add_argument('--format', choices=importers.FORMATS, default='auto')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"ユーザー {options['user']} が見つかりません")
+
+        path = options['path']
+        format = options['format']
+        if format == 'auto':
+            format = importers.detect_format(path)
+
+        def progress(result):
+            self.stderr.write(f'{result.processed} 行を処理（登録 {result.created} 件）')
+
+        try:
+            if path == '-':
+                result = self.run(user, sys.stdin.buffer, None, format, options, progress)
+            else:
+                with open(path, 'rb') as source:
+                    result = self.run(user, source, path, format, options, progress)
+        except (OSError, importers.ImportFailed) as error:
+            raise CommandError(str(error))
+
+        for line, errors in result.errors:
+            messages = ' '.join(f"{field}: {' '.join(texts)}" for field, texts in errors.items())
+            self.stderr.write(self.style.WARNING(f'{line} 行目: {messages}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'書籍 {result.created} 件・メモ {result.memos} 件を登録しました'
+            f'（重複 {result.duplicates} 件、エラー {result.error_count} 件）'
+        ))
+
+    def run(self, user, source, path, format, options, progress):
+        return importers.import_books(
+            user, importers.open_text(source, path), format,
+            batch_size=options['batch_size'], progress=progress,
+        )
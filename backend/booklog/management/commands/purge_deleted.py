@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from booklog import deletion
+
+
+class Command(BaseCommand):
+    help = '論理削除した書籍・メモを少しずつ物理削除する（定期的に実行する）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=settings.BOOKLOG_PURGE_AFTER,
+            help='削除してからこの秒数が過ぎたものだけを消す（既定は BOOKLOG_PURGE_AFTER）',
+        )
+        parser.add_argument('--batch-size', type=int, default=settings.BOOKLOG_BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--older-than は0以上、--batch-size は1以上で指定してください')
+        before = timezone.now() - timedelta(seconds=options['older_than'])
+
+        def progress(model_name, deleted):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{model_name}: {deleted} 件')
+
+        purged = deletion.purge_deleted(before, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"書籍 {purged['books']} 件・メモ {purged['memos']} 件を削除しました"
+        ))
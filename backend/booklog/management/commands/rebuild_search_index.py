@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booklog import search
+from booklog.models import Book
+
+
+class Command(BaseCommand):
+    help = '書籍の検索インデックスを作り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザー名（省略時は全ユーザー）')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        books = Book.objects.order_by('pk')
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"ユーザー {options['user']} が見つかりません")
+            books = books.filter(user=user)
+
+        book_ids = list(books.values_list('pk', flat=True))
+        search.index_books(book_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{len(book_ids)} 件の書籍をインデックスしました'))
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booklog import stats
+
+
+class Command(BaseCommand):
+    help = 'ユーザーごとの蔵書の集計（ダッシュボード）を作り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザー名（省略時は全ユーザー）')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"ユーザー {options['user']} が見つかりません")
+
+        count = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            stats.rebuild_user(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'{count} 人の集計を作り直しました'))
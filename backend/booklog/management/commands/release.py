@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    """未適用のマイグレーションの名前（app_label.name）のリスト"""
+    executor = MigrationExecutor(connections[database])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [f'{migration.app_label}.{migration.name}' for migration, _ in plan]
+
+
+class Command(BaseCommand):
+    help = 'デプロイのリリース手順: 未適用のマイグレーションがあるときだけ migrate する'
+    # 未適用が無ければマイグレーションの表を1回読むだけで終わらせる（チェックは migrate が行う）
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--check', action='store_true',
+            help='適用はせず、未適用のマイグレーションがあれば終了コード 1 で終わる',
+        )
+
+    def handle(self, *args, **options):
+        pending = pending_migrations(options['database'])
+        if not pending:
+            if options['verbosity'] > 0:
+                self.stdout.write('未適用のマイグレーションはありません')
+            return
+        self.stdout.write(f'未適用のマイグレーション {len(pending)} 件: {", ".join(pending)}')
+        if options['check']:
+            sys.exit(1)
+        call_command(
+            'migrate', database=options['database'], interactive=False, verbosity=options['verbosity'],
+            stdout=self.stdout, stderr=self.stderr,
+        )
@@ -0,0 +1,73 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from booklog.jobs import TASKS, Worker, requeue_stale, worker_name
+
+
+def _run_process(index, kinds, burst, poll_interval):
+    """プロセスプールの1ワーカー（SIGTERM で今のジョブを終えてから止まる）"""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    # 名前には子プロセスの pid を使う
+    Worker(worker_name(index), kinds, burst, poll_interval, stop_event).run()
+
+
+class Command(BaseCommand):
+    help = 'バックグラウンドジョブを実行するワーカーを起動する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='同時に実行するジョブの数')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--kind', action='append', choices=sorted(TASKS), dest='kinds', help='実行するジョブの種類（複数指定可）')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='ジョブが無いときの待ち時間（秒）')
+        parser.add_argument('--burst', action='store_true', help='実行できるジョブが無くなったら終了する')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'{requeued} 件の止まっていたジョブを戻しました')
+
+        indexes = range(1, options['workers'] + 1)
+        args = (options['kinds'], options['burst'], options['poll_interval'])
+        self.stdout.write(f"{options['pool']} を {options['workers']} 個起動します")
+        if options['pool'] == 'process':
+            self.run_processes(indexes, args)
+        else:
+            self.run_threads(indexes, args)
+        self.stdout.write(self.style.SUCCESS('ワーカーを停止しました'))
+
+    def run_threads(self, indexes, args):
+        stop_event = threading.Event()
+        workers = [Worker(worker_name(index), *args, stop_event=stop_event) for index in indexes]
+        threads = [threading.Thread(target=worker.run, name=worker.name) for worker in workers]
+        for thread in threads:
+            thread.start()
+        self.wait(threads, stop_event.set)
+
+    def run_processes(self, indexes, args):
+        # 親の DB 接続を子プロセスに引き継がないよう閉じてから fork する
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=_run_process, args=(index, *args), name=f'worker-{index}') for index in indexes
+        ]
+        for process in processes:
+            process.start()
+        self.wait(processes, lambda: [process.terminate() for process in processes])
+
+    def wait(self, runners, stop):
+        """Ctrl+C / SIGTERM で各ワーカーに停止を伝え、実行中のジョブが終わるのを待つ"""
+        signal.signal(signal.SIGTERM, lambda *args: stop())
+        try:
+            for runner in runners:
+                while runner.is_alive():
+                    runner.join(0.5)
+        except KeyboardInterrupt:
+            stop()
+            for runner in runners:
+                runner.join()
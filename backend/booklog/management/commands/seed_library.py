@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from booklog.testing import seed_library
+
+
+class Command(BaseCommand):
+    help = 'クエリプランや性能の確認用に、大きな合成の蔵書を作る（検索インデックスは作らない）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='蔵書を作るユーザー名（無ければ作る）')
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--memos', type=int, default=2, help='書籍1冊あたりのメモ数')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username=options['user'])
+        seed_library(user, options['books'], options['memos'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{user.username} に書籍 {options['books']} 件・メモ {options['books'] * options['memos']} 件を作りました"
+        ))
@@ -0,0 +1,123 @@
+# backend/booklog/metrics.py
+"""Prometheus 形式のメトリクス（/metrics、BOOKLOG_METRICS=True で有効）
+
+値は InstrumentationMiddleware がリクエストの終わりに observe() で記録する。
+
+gunicorn の複数ワーカーで動かすときは環境変数 PROMETHEUS_MULTIPROC_DIR を
+設定しておくと、各プロセスの値がそのディレクトリのファイル（mmap）に書かれ、
+どのワーカーにスクレイプしても全ワーカーを合計した値を返す。ディレクトリは
+起動前に空にし（Dockerfile の start.sh）、終了したワーカーは gunicorn.conf.py の
+child_exit で片付ける。
+"""
+import os
+import resource
+import sys
+
+from django.db import connection, connections
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'booklog_request_duration_seconds', 'リクエストの処理時間', ['view', 'method'],
+)
+REQUESTS = Counter(
+    'booklog_requests', 'リクエスト数', ['view', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'booklog_request_db_queries', '1リクエストで発行したクエリ数', ['view'],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_TIME = Counter(
+    'booklog_request_db_seconds', 'リクエスト中のクエリの合計時間', ['view'],
+)
+CACHE_LOOKUPS = Counter(
+    'booklog_fragment_cache_lookups', 'ページ断片キャッシュの参照（result=hit|miss）', ['result'],
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'booklog_db_connections_opened', '新しく開いた DB 接続の数', ['alias'],
+)
+DB_CONNECTION_REUSE = Counter(
+    'booklog_db_connection_reuse',
+    'リクエストの開始時に前のリクエストの DB 接続が残っていたか（reused=true|false）', ['reused'],
+)
+MEMORY = Gauge(
+    'booklog_process_resident_memory_bytes', 'ワーカーごとの常駐メモリ', multiprocess_mode='liveall',
+)
+DB_POOL = Gauge(
+    'booklog_db_pool', 'ワーカーごとの DB コネクションプールの状態（psycopg_pool の get_stats() の値）',
+    ['alias', 'stat'], multiprocess_mode='liveall',
+)
+
+# URL に一致しなかったリクエスト（404 など）はまとめる
+UNRESOLVED = '<unresolved>'
+
+
+def multiprocess_enabled():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def resident_memory():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # /proc が無い環境では最大使用量で代用する（macOS はバイト、Linux は KB 単位）
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def connection_opened(sender, connection, **kwargs):
+    DB_CONNECTIONS_OPENED.labels(connection.alias).inc()
+
+
+def connection_is_open():
+    """リクエストの開始時（古い接続を閉じた後）に接続が残っているか"""
+    return connection.connection is not None
+
+
+def pool_stats():
+    """{エイリアス: get_stats()}（コネクションプールを使っている DB だけ）"""
+    stats = {}
+    for alias in connections:
+        # PostgreSQL 以外の接続には pool が無い（プールを使わない PostgreSQL は None）
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def update_pool_stats():
+    for alias, stats in pool_stats().items():
+        for name, value in stats.items():
+            DB_POOL.labels(alias, name).set(value)
+
+
+def observe(request, response, metrics):
+    """1リクエストの計測結果（instrumentation.RequestMetrics）を記録する"""
+    view = request.resolver_match.view_name if request.resolver_match else UNRESOLVED
+    REQUEST_LATENCY.labels(view, request.method).observe(metrics.total)
+    REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+    REQUEST_QUERIES.labels(view).observe(metrics.queries)
+    REQUEST_DB_TIME.labels(view).inc(metrics.query_time)
+    if metrics.cache_hits:
+        CACHE_LOOKUPS.labels('hit').inc(metrics.cache_hits)
+    if metrics.cache_misses:
+        CACHE_LOOKUPS.labels('miss').inc(metrics.cache_misses)
+    if metrics.connection_reused is not None:
+        DB_CONNECTION_REUSE.labels('true' if metrics.connection_reused else 'false').inc()
+    MEMORY.set(resident_memory())
+    update_pool_stats()
+
+
+def render_latest():
+    """(本文, Content-Type) を返す。マルチプロセスなら全プロセスの値を合計する"""
+    MEMORY.set(resident_memory())
+    update_pool_stats()
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from booklog.search import DEFAULT_BACKEND, build_document
+
+
+def build_search_index(apps, schema_editor):
+    """既存の書籍を検索インデックスに登録する"""
+    Book = apps.get_model('booklog', 'Book')
+    SearchDocument = apps.get_model('booklog', 'SearchDocument')
+    SearchToken = apps.get_model('booklog', 'SearchToken')
+    with_tokens = getattr(settings, 'BOOKLOG_SEARCH_BACKEND', DEFAULT_BACKEND) == DEFAULT_BACKEND
+
+    for book in Book.objects.prefetch_related('memos').iterator(chunk_size=500):
+        text, grams, weights = build_document(
+            book.title, book.author, (memo.content for memo in book.memos.all())
+        )
+        SearchDocument.objects.create(book=book, user_id=book.user_id, text=text, grams=grams)
+        if with_tokens:
+            SearchToken.objects.bulk_create([
+                SearchToken(book=book, user_id=book.user_id, token=term, weight=weight)
+                for term, weight in weights.items()
+            ])
+
+
+def create_postgres_indexes(apps, schema_editor):
+    """PostgresSearchBackend 用の GIN インデックス（PostgreSQL のみ）"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS booklog_searchdocument_grams_tsv ON booklog_searchdocument "
+        "USING gin (to_tsvector('simple'::regconfig, COALESCE(grams, '')))"
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS booklog_searchdocument_text_trgm ON booklog_searchdocument '
+        'USING gin (text gin_trgm_ops)'
+    )
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS booklog_searchdocument_grams_tsv')
+    schema_editor.execute('DROP INDEX IF EXISTS booklog_searchdocument_text_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booklog', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='booklog.book')),
+                ('text', models.TextField(verbose_name='正規化テキスト')),
+                ('grams', models.TextField(verbose_name='n-gram')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=2, verbose_name='トークン')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='重み')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='booklog.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'token', 'book'], name='booklog_searchtoken_lookup')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'token'), name='booklog_searchtoken_unique')],
+            },
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_library_states(apps, schema_editor):
+    """書籍を持つユーザーの最終変更日時を初期化する"""
+    Book = apps.get_model('booklog', 'Book')
+    LibraryState = apps.get_model('booklog', 'LibraryState')
+    now = django.utils.timezone.now()
+    user_ids = Book.objects.values_list('user_id', flat=True).distinct()
+    LibraryState.objects.bulk_create(
+        [LibraryState(user_id=user_id, changed_at=now) for user_id in user_ids],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booklog', '0002_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='更新日時'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='LibraryState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='library_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('changed_at', models.DateTimeField(verbose_name='最終変更日時')),
+            ],
+        ),
+        migrations.RunPython(create_library_states, migrations.RunPython.noop),
+    ]
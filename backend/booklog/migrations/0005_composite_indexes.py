@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booklog', '0004_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='book',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='memo',
+            options={'ordering': ['created_at', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', '-id'], name='booklog_book_user_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='booklog_book_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'title', 'author'], name='booklog_book_user_title'),
+        ),
+        migrations.AddIndex(
+            model_name='memo',
+            index=models.Index(fields=['book', 'created_at', 'id'], name='booklog_memo_book_created'),
+        ),
+    ]
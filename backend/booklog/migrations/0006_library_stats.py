@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from booklog.stats import bucket_counts
+
+
+def build_library_stats(apps, schema_editor):
+    """書籍を持つユーザーの集計を作成する"""
+    Book = apps.get_model('booklog', 'Book')
+    Memo = apps.get_model('booklog', 'Memo')
+    LibraryStats = apps.get_model('booklog', 'LibraryStats')
+    LibraryStatBucket = apps.get_model('booklog', 'LibraryStatBucket')
+    for user_id in Book.objects.values_list('user_id', flat=True).distinct().order_by():
+        books = Book.objects.filter(user_id=user_id)
+        LibraryStats.objects.create(
+            user_id=user_id,
+            book_count=books.count(),
+            memo_count=Memo.objects.filter(book__user_id=user_id).count(),
+        )
+        LibraryStatBucket.objects.bulk_create([
+            LibraryStatBucket(user_id=user_id, kind=kind, key=key, count=count)
+            for (kind, key), count in sorted(bucket_counts(books).items())
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('booklog', '0005_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='library_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('book_count', models.IntegerField(default=0, verbose_name='書籍数')),
+                ('memo_count', models.IntegerField(default=0, verbose_name='メモ数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LibraryStatBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('author', '著者'), ('month', '登録月'), ('year', '出版年')], max_length=10, verbose_name='種類')),
+                ('key', models.CharField(max_length=100, verbose_name='キー')),
+                ('count', models.IntegerField(default=0, verbose_name='冊数')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='library_stat_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'key'), name='booklog_librarystatbucket_unique')],
+            },
+        ),
+        migrations.RunPython(build_library_stats, migrations.RunPython.noop),
+    ]
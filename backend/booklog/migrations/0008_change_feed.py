@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def record_existing_rows(apps, schema_editor):
+    """既存の書籍・メモを通番 1 の変更として記録する（最初の同期で全件を受け取れるように）"""
+    Book = apps.get_model('booklog', 'Book')
+    Memo = apps.get_model('booklog', 'Memo')
+    LibraryState = apps.get_model('booklog', 'LibraryState')
+    LibraryChange = apps.get_model('booklog', 'LibraryChange')
+    now = timezone.now()
+    for user_id in Book.objects.values_list('user_id', flat=True).distinct().order_by():
+        LibraryState.objects.get_or_create(user_id=user_id, defaults={'changed_at': now})
+        LibraryState.objects.filter(user_id=user_id).update(seq=1)
+        rows = [
+            ('book', Book.objects.filter(user_id=user_id)),
+            ('memo', Memo.objects.filter(book__user_id=user_id)),
+        ]
+        for kind, queryset in rows:
+            LibraryChange.objects.bulk_create([
+                LibraryChange(user_id=user_id, kind=kind, object_id=pk, seq=1, deleted=deleted_at is not None)
+                for pk, deleted_at in queryset.values_list('pk', 'deleted_at').iterator()
+            ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booklog', '0007_soft_delete'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='librarystate',
+            name='seq',
+            field=models.BigIntegerField(default=0, verbose_name='変更の通番'),
+        ),
+        migrations.CreateModel(
+            name='LibraryChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book', '書籍'), ('memo', 'メモ')], max_length=10, verbose_name='種類')),
+                ('object_id', models.BigIntegerField(verbose_name='対象の id')),
+                ('seq', models.BigIntegerField(verbose_name='通番')),
+                ('deleted', models.BooleanField(default=False, verbose_name='削除')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='library_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'seq', 'id'], name='booklog_librarychange_feed')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='booklog_librarychange_unique')],
+            },
+        ),
+        migrations.RunPython(record_existing_rows, migrations.RunPython.noop),
+    ]
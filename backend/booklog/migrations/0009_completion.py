@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from booklog.completion import build_entries, completion_counts
+
+
+def build_completions(apps, schema_editor):
+    """書籍を持つユーザーの入力補完のエントリを作成する"""
+    Book = apps.get_model('booklog', 'Book')
+    CompletionEntry = apps.get_model('booklog', 'CompletionEntry')
+    books = Book.objects.filter(deleted_at__isnull=True)
+    for user_id in books.values_list('user_id', flat=True).distinct().order_by():
+        counts = completion_counts(books.filter(user_id=user_id))
+        CompletionEntry.objects.bulk_create(build_entries(CompletionEntry, user_id, counts), batch_size=1000)
+
+
+def collate_postgres_index(apps, schema_editor):
+    """PostgreSQL では前方一致のインデックスのキーを照合順序 "C" で作り直す
+
+    既定の照合順序では範囲の比較がコードポイント順にならない（booklog.completion）。
+    名前は同じにしておき、マイグレーションの状態とずれないようにする。
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS booklog_completion_prefix')
+    schema_editor.execute(
+        'CREATE INDEX booklog_completion_prefix ON booklog_completionentry (user_id, key COLLATE "C")'
+    )
+
+
+def uncollate_postgres_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS booklog_completion_prefix')
+    schema_editor.execute('CREATE INDEX booklog_completion_prefix ON booklog_completionentry (user_id, key)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booklog', '0008_change_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompletionEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('title', 'タイトル'), ('author', '著者')], max_length=10, verbose_name='種類')),
+                ('key', models.CharField(max_length=50, verbose_name='キー')),
+                ('value', models.CharField(max_length=200, verbose_name='値')),
+                ('count', models.IntegerField(default=0, verbose_name='冊数')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completion_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'key'], name='booklog_completion_prefix')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'value', 'key'), name='booklog_completion_unique')],
+            },
+        ),
+        migrations.RunPython(collate_postgres_index, uncollate_postgres_index),
+        migrations.RunPython(build_completions, migrations.RunPython.noop),
+    ]
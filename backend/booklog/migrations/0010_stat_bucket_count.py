@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booklog', '0009_completion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='librarystatbucket',
+            index=models.Index(fields=['user', 'kind', '-count', 'key'], name='booklog_statbucket_count'),
+        ),
+    ]
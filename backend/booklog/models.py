@@ -1,7 +1,32 @@
 from django.db import models
 from django.conf import settings
 
-class Book(models.Model):
+
+class NotDeletedManager(models.Manager):
+    """論理削除されていない行だけを返す（Book.objects / Memo.objects、関連マネージャーも同じ）"""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+class SoftDeleteModel(models.Model):
+    """論理削除できるモデル
+
+    削除すると deleted_at を設定するだけで行は残り（booklog.deletion）、
+    ``manage.py purge_deleted`` がまとめて物理削除する。削除済みの行も含めて
+    読むときは all_objects を使う。
+    """
+    deleted_at = models.DateTimeField('削除日時', null=True, blank=True, editable=False, db_index=True)
+
+    objects = NotDeletedManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        abstract = True
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+class Book(SoftDeleteModel):
     title = models.CharField('タイトル', max_length=200)
     author = models.CharField('著者', max_length=100)
     published_date = models.DateField('出版日', null=True, blank=True)
@@ -10,13 +35,228 @@ class Book(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            # 一覧（登録順・更新順）のキーセットページネーション用（booklog.queryplans で検証する）
+            models.Index(fields=['user', '-id'], name='booklog_book_user_id'),
+            models.Index(fields=['user', '-updated_at', '-id'], name='booklog_book_user_updated'),
+            # インポート時の重複チェック用
+            models.Index(fields=['user', 'title', 'author'], name='booklog_book_user_title'),
+        ]
+
     def __str__(self):
         return self.title
 
-class Memo(models.Model):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 集計（booklog.stats）・入力補完（booklog.completion）の差分を求めるため、
+        # 読み込んだ時点のタイトル・著者・出版日を覚えておく
+        loaded = dict(zip(field_names, values))
+        if 'author' in loaded and 'published_date' in loaded:
+            instance._stats_loaded = (loaded['author'], loaded['published_date'])
+        if 'title' in loaded and 'author' in loaded:
+            instance._completion_loaded = (loaded['title'], loaded['author'])
+        return instance
+
+class Memo(SoftDeleteModel):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='memos')
     content = models.TextField('メモ内容')
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['book', 'created_at', 'id'], name='booklog_memo_book_created'),
+        ]
 
     def __str__(self):
         return f"Memo for {self.book.title}"
+
+
+class LibraryState(models.Model):
+    """ユーザーの蔵書（書籍・メモ）が最後に変更された日時"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='library_state')
+    changed_at = models.DateTimeField('最終変更日時')
+    # 変更フィード（booklog.sync）の通番。書籍・メモが変更されるたびに1ずつ増える
+    seq = models.BigIntegerField('変更の通番', default=0)
+
+    def __str__(self):
+        return f"Library state for {self.user_id}"
+
+class LibraryChange(models.Model):
+    """変更フィード（booklog.sync）の1行。書籍・メモ1件ごとに最後の変更だけを残す"""
+    BOOK = 'book'
+    MEMO = 'memo'
+    KIND_CHOICES = [
+        (BOOK, '書籍'),
+        (MEMO, 'メモ'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='library_changes')
+    kind = models.CharField('種類', max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField('対象の id')
+    seq = models.BigIntegerField('通番')
+    deleted = models.BooleanField('削除', default=False)
+
+    class Meta:
+        indexes = [
+            # 同期トークン（通番, id）より後の変更を順に読む
+            models.Index(fields=['user', 'seq', 'id'], name='booklog_librarychange_feed'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='booklog_librarychange_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} @{self.seq}"
+
+class LibraryStats(models.Model):
+    """ユーザーごとの蔵書の集計（booklog.stats が書籍・メモの変更に合わせて増減する）"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='library_stats')
+    book_count = models.IntegerField('書籍数', default=0)
+    memo_count = models.IntegerField('メモ数', default=0)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    def __str__(self):
+        return f"Library stats for {self.user_id}"
+
+    @property
+    def memos_per_book(self):
+        return self.memo_count / self.book_count if self.book_count else 0
+
+class LibraryStatBucket(models.Model):
+    """集計の内訳（著者別・登録月別・出版年別の冊数）"""
+    AUTHOR = 'author'
+    MONTH = 'month'
+    YEAR = 'year'
+    KIND_CHOICES = [
+        (AUTHOR, '著者'),
+        (MONTH, '登録月'),
+        (YEAR, '出版年'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='library_stat_buckets')
+    kind = models.CharField('種類', max_length=10, choices=KIND_CHOICES)
+    # 著者名・登録月（YYYY-MM）・出版年（YYYY）
+    key = models.CharField('キー', max_length=100)
+    count = models.IntegerField('冊数', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'key'], name='booklog_librarystatbucket_unique'),
+        ]
+        indexes = [
+            # ダッシュボードの著者の上位（booklog.stats.top_buckets）
+            models.Index(fields=['user', 'kind', '-count', 'key'], name='booklog_statbucket_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key} ({self.count})"
+
+class CompletionEntry(models.Model):
+    """入力補完（booklog.completion）の1エントリ: タイトル・著者を前方一致で引くためのキー
+
+    キーは読みの揺れを吸収した文字列で、値（タイトル・著者）ごとに先頭と各語の先頭から作る。
+    """
+    TITLE = 'title'
+    AUTHOR = 'author'
+    KIND_CHOICES = [
+        (TITLE, 'タイトル'),
+        (AUTHOR, '著者'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='completion_entries')
+    kind = models.CharField('種類', max_length=10, choices=KIND_CHOICES)
+    key = models.CharField('キー', max_length=50)
+    value = models.CharField('値', max_length=200)
+    count = models.IntegerField('冊数', default=0)
+
+    class Meta:
+        indexes = [
+            # 前方一致の範囲検索用（PostgreSQL ではマイグレーション 0009 でキーを照合順序 "C" にしている）
+            models.Index(fields=['user', 'key'], name='booklog_completion_prefix'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'value', 'key'], name='booklog_completion_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.value} ({self.count})"
+
+class SearchDocument(models.Model):
+    """書籍ごとの検索用ドキュメント（タイトル・著者・メモを正規化したもの）"""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    text = models.TextField('正規化テキスト')
+    grams = models.TextField('n-gram')
+
+    def __str__(self):
+        return f"Search document for {self.book_id}"
+
+class SearchToken(models.Model):
+    """n-gram 転置インデックスの1エントリ"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='search_tokens')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    token = models.CharField('トークン', max_length=2)
+    weight = models.PositiveSmallIntegerField('重み', default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'token', 'book'], name='booklog_searchtoken_lookup'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'token'], name='booklog_searchtoken_unique'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+class Job(models.Model):
+    """バックグラウンドで実行する処理（booklog.jobs のワーカーが取り出して実行する）"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, '待機中'),
+        (RUNNING, '実行中'),
+        (SUCCEEDED, '完了'),
+        (FAILED, '失敗'),
+    ]
+
+    # アカウント削除のジョブはユーザーより後まで残るので SET_NULL にする
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    kind = models.CharField('種類', max_length=50)
+    payload = models.JSONField('引数', default=dict, blank=True)
+    status = models.CharField('状態', max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField('実行回数', default=0)
+    max_attempts = models.PositiveSmallIntegerField('最大実行回数', default=3)
+    run_at = models.DateTimeField('実行予定日時')
+    locked_by = models.CharField('実行中のワーカー', max_length=100, blank=True)
+    locked_at = models.DateTimeField('実行開始日時', null=True, blank=True)
+    progress = models.JSONField('進捗', default=dict, blank=True)
+    result = models.JSONField('結果', null=True, blank=True)
+    error = models.TextField('エラー', blank=True)
+    created_at = models.DateTimeField('登録日時', auto_now_add=True)
+    finished_at = models.DateTimeField('終了日時', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='booklog_job_due'),
+            models.Index(fields=['user', '-id'], name='booklog_job_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    @property
+    def kind_label(self):
+        from .jobs import TASKS
+        return TASKS[self.kind][2] if self.kind in TASKS else self.kind
@@ -0,0 +1,142 @@
+# backend/booklog/pagination.py
+"""キーセット（カーソル）方式のページネーション
+
+OFFSET と COUNT(*) を使わず、前ページ最後の行の並び替えキーより後ろを
+シークして取得する。カーソルは ``?after=`` に載せる不透明なトークン。
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _json_default(value):
+    # DjangoJSONEncoder はミリ秒に丸めるので、シーク位置がずれないよう isoformat をそのまま使う
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':'), default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode()).rstrip(b'=').decode()
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        return json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+
+
+class KeysetPaginator:
+    """ordering の各フィールドでシークするページネータ
+
+    ordering の最後のフィールドは一意（通常は id）である必要がある。
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    @cached_property
+    def count(self):
+        # テンプレートが件数を参照したときだけ COUNT(*) を発行する
+        return self.queryset.count()
+
+    def window(self, cursor=None):
+        """カーソル以降の per_page + 1 件を返すクエリセット（次ページ有無の判定用に1件多く取る）"""
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._seek(self.parse_cursor(cursor)))
+        return queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        return self.page_from_rows(list(self.window(cursor)), cursor)
+
+    def page_from_rows(self, rows, cursor=None):
+        return KeysetPage(rows[:self.per_page], self, cursor, has_next=len(rows) > self.per_page)
+
+    def parse_cursor(self, cursor):
+        data = decode_cursor(cursor)
+        if not isinstance(data, dict) or data.get('o') != list(self.ordering):
+            raise InvalidCursor(cursor)
+        values = data.get('v')
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        model = self.queryset.model
+        try:
+            return [model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def cursor_for(self, obj):
+        return encode_cursor({
+            'o': list(self.ordering),
+            'v': [getattr(obj, name) for name in self.fields],
+        })
+
+    def _seek(self, values):
+        # (a, b) < (x, y) を a < x OR (a = x AND b < y) に展開する
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            term = Q(**{f'{field}__{lookup}': values[index]})
+            for previous, value in zip(self.fields[:index], values[:index]):
+                term &= Q(**{previous: value})
+            condition |= term
+        if len(self.ordering) > 1:
+            # OR だけだと DB が複合インデックスを範囲で走査できず並べ替えが発生するので、
+            # 先頭のフィールドの範囲条件（a <= x）を AND で加えておく
+            first = self.ordering[0]
+            lookup = 'lte' if first.startswith('-') else 'gte'
+            condition = Q(**{f'{self.fields[0]}__{lookup}': values[0]}) & condition
+        return condition
+
+
+class KeysetPage:
+    """django.core.paginator.Page と同じように使えるページ"""
+
+    def __init__(self, object_list, paginator, cursor, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f'<KeysetPage after {self.cursor!r}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return bool(self.cursor)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @cached_property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1])
@@ -0,0 +1,130 @@
+# backend/booklog/queryplans.py
+"""よく実行されるクエリが複合インデックスを使っているかを EXPLAIN で確認する
+
+クエリはビューの get_queryset() などから実際と同じ方法で組み立てる。
+テスト（booklog.tests.QueryPlanTest）と ``manage.py check_query_plans`` から使う。
+"""
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import RequestFactory
+
+from . import completion, stats
+from .models import Book, Memo
+from .pagination import KeysetPaginator
+from .views import BookListView
+
+# 名前 -> (クエリセットを組み立てる関数, 使うべきインデックス)
+HOT_QUERIES = {}
+
+
+def hot_query(name, index):
+    def register(func):
+        HOT_QUERIES[name] = (func, index)
+        return func
+    return register
+
+
+def _list_view(user, **params):
+    request = RequestFactory().get('/', params)
+    request.user = user or AnonymousUser()
+    view = BookListView()
+    view.setup(request)
+    return view
+
+
+def _list_window(user, sort, after_first_page=False):
+    view = _list_view(user, sort=sort)
+    paginator = KeysetPaginator(view.get_queryset(), view.paginate_by, view.orderings[sort])
+    cursor = None
+    if after_first_page:
+        first = list(paginator.window())
+        if len(first) > paginator.per_page:
+            cursor = paginator.cursor_for(first[paginator.per_page - 1])
+    return paginator.window(cursor)
+
+
+@hot_query('book_list', 'booklog_book_user_id')
+def book_list(user):
+    return _list_window(user, 'new')
+
+
+@hot_query('book_list_next_page', 'booklog_book_user_id')
+def book_list_next_page(user):
+    return _list_window(user, 'new', after_first_page=True)
+
+
+@hot_query('book_list_updated', 'booklog_book_user_updated')
+def book_list_updated(user):
+    return _list_window(user, 'updated')
+
+
+@hot_query('book_list_updated_next_page', 'booklog_book_user_updated')
+def book_list_updated_next_page(user):
+    return _list_window(user, 'updated', after_first_page=True)
+
+
+@hot_query('book_detail_memos', 'booklog_memo_book_created')
+def book_detail_memos(user):
+    # BookDetailView が prefetch するメモ（Memo.Meta.ordering の順）
+    book = Book.objects.filter(user=user).first()
+    return Memo.objects.filter(book=book)
+
+
+@hot_query('import_duplicates', 'booklog_book_user_title')
+def import_duplicates(user):
+    # importers.BookImporter.flush の重複チェック
+    titles = list(Book.objects.filter(user=user).values_list('title', flat=True)[:50])
+    return Book.objects.filter(user=user, title__in=titles).order_by().values_list('title', 'author')
+
+
+@hot_query('completions', 'booklog_completion_prefix')
+def completions(user):
+    # CompletionApi が入力1文字ごとに読むエントリ
+    return completion.entries(user.pk, '書')[:20]
+
+
+@hot_query('dashboard_authors', 'booklog_statbucket_count')
+def dashboard_authors(user):
+    # StatsView の著者の上位
+    return stats.top_buckets(user.pk, stats.AUTHOR, 10)
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        return queryset.explain(costs=False)
+    return queryset.explain()
+
+
+def plan_problems(plan, index):
+    """プランの問題点（インデックスを使っていない・並べ替えをしている）のリスト
+
+    SQLite と PostgreSQL 以外は判定できないので None を返す。
+    """
+    if connection.vendor == 'sqlite':
+        problems = []
+        if not re.search(rf'USING (COVERING )?INDEX {index}\b', plan):
+            problems.append(f'{index} を使っていません')
+        if 'TEMP B-TREE' in plan:
+            problems.append('ORDER BY のために並べ替えています')
+        return problems
+    if connection.vendor == 'postgresql':
+        problems = []
+        if not re.search(rf'Index (Only )?Scan (Backward )?using {index}\b|Bitmap Index Scan on {index}\b', plan):
+            problems.append(f'{index} を使っていません')
+        if re.search(r'^\s*(->\s*)?(Incremental )?Sort\b', plan, re.MULTILINE):
+            problems.append('ORDER BY のために並べ替えています')
+        return problems
+    return None
+
+
+def check_plans(user, names=None):
+    """[(名前, インデックス, プラン, 問題点)] を返す"""
+    results = []
+    for name, (build, index) in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        plan = explain(build(user))
+        results.append((name, index, plan, plan_problems(plan, index)))
+    return results
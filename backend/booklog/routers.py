@@ -0,0 +1,124 @@
+# backend/booklog/routers.py
+"""読み取りをレプリカに振り分けるデータベースルーター（settings.BOOKLOG_REPLICAS）
+
+ReplicaPinMiddleware を通ったリクエスト（ビュー）の中で、蔵書のモデルの読み取りだけを
+レプリカに送る。次の場合はプライマリから読む。
+
+- GET / HEAD 以外のリクエスト
+- 同じリクエストの中で蔵書のモデルを書き込んだ後
+- トランザクションの中（書き込みと同じ接続で読む必要がある）
+- 直前に書き込んだユーザー（書き込みの後 BOOKLOG_PRIMARY_PIN_SECONDS 秒、Cookie で固定する）。
+  書籍を登録した後のリダイレクト先の一覧に、レプリカの遅れで登録した書籍が出ないことを防ぐ
+
+管理コマンドやジョブのワーカーなどリクエストの外では常にプライマリを使う。
+認証・セッションなど他のアプリのモデルと Job（ワーカーが行ロックを取る）もプライマリのまま。
+"""
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# レプリカから読んでよいモデル
+REPLICATED_MODELS = {
+    'book', 'memo', 'librarychange', 'librarystate', 'librarystats', 'librarystatbucket', 'searchdocument', 'searchtoken',
+    'completionentry',
+}
+PIN_COOKIE = 'booklog_primary'
+
+_current = contextvars.ContextVar('booklog_db_routing', default=None)
+
+
+class RoutingState:
+    """1リクエストの振り分けの状態（sync_to_async のスレッドとも共有するので値は書き換えて使う）"""
+
+    def __init__(self, replica, pinned):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+    @property
+    def uses_replica(self):
+        return self.replica is not None and not (self.pinned or self.wrote)
+
+
+def _replicated(model):
+    return model._meta.app_label == 'booklog' and model._meta.model_name in REPLICATED_MODELS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or not state.uses_replica or not _replicated(model):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None and _replicated(model):
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリの複製なので、どの組み合わせでも同じデータ
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # レプリカのスキーマはレプリケーションで揃う
+        return False if db in settings.BOOKLOG_REPLICAS else None
+
+
+def _pinned(request):
+    if request.method not in ('GET', 'HEAD'):
+        return True
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaPinMiddleware:
+    """リクエストごとにレプリカを選び、蔵書を書き込んだユーザーを一定時間プライマリに固定する"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(response, state)
+
+    def start(self, request):
+        replicas = settings.BOOKLOG_REPLICAS
+        state = RoutingState(random.choice(replicas) if replicas else None, _pinned(request))
+        return state, _current.set(state)
+
+    def finish(self, response, state):
+        if state.wrote:
+            seconds = settings.BOOKLOG_PRIMARY_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,199 @@
+# backend/booklog/search.py
+"""書籍の全文検索
+
+タイトル・著者・メモ本文を正規化して n-gram に分割し、検索用インデックス
+（SearchDocument / SearchToken）として保持する。日本語は分かち書きをせず
+bi-gram で扱う。検索エンジンは ``BOOKLOG_SEARCH_BACKEND`` 設定で切り替える。
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils.module_loading import import_string
+
+from .models import Book, SearchDocument, SearchToken
+
+DEFAULT_BACKEND = 'booklog.search.DatabaseSearchBackend'
+
+TITLE_WEIGHT = 3
+AUTHOR_WEIGHT = 2
+MEMO_WEIGHT = 1
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """全角・半角、大文字・小文字の揺れを吸収する"""
+    return unicodedata.normalize('NFKC', text or '').casefold()
+
+
+def split_words(text):
+    return _WORD_RE.findall(normalize(text))
+
+
+def ngrams(word):
+    """1文字の語はそのまま、2文字以上は bi-gram に分割する"""
+    if len(word) < 2:
+        return [word]
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def index_terms(text):
+    """インデックスに登録する語（1文字検索用の uni-gram と bi-gram）"""
+    terms = set()
+    for word in split_words(text):
+        terms.update(word)
+        terms.update(ngrams(word))
+    return terms
+
+
+def query_terms(query):
+    terms = set()
+    for word in split_words(query):
+        terms.update(ngrams(word))
+    return terms
+
+
+def build_document(title, author, memo_contents):
+    """検索用テキスト・n-gram 文字列・語ごとの重みを組み立てる
+
+    マイグレーションからも使うため、モデルに依存しない純粋な関数にしている。
+    """
+    memo_contents = list(memo_contents)
+    text = '\n'.join(normalize(part) for part in [title, author, *memo_contents])
+
+    weights = {}
+    fields = [
+        (index_terms(title), TITLE_WEIGHT),
+        (index_terms(author), AUTHOR_WEIGHT),
+        (set().union(*(index_terms(content) for content in memo_contents)), MEMO_WEIGHT),
+    ]
+    for terms, weight in fields:
+        for term in terms:
+            weights[term] = weights.get(term, 0) + weight
+
+    # ts_rank が出現頻度を見るので、重みの分だけ語を繰り返しておく
+    grams = ' '.join(
+        ' '.join([term] * weight) for term, weight in sorted(weights.items())
+    )
+    return text, grams, weights
+
+
+class BaseSearchBackend:
+    """検索エンジンの共通部分（SearchDocument の維持）"""
+
+    def index_books(self, book_ids):
+        book_ids = list(book_ids)
+        books = Book.objects.filter(pk__in=book_ids).prefetch_related('memos')
+        with transaction.atomic():
+            self.remove_books(book_ids)
+            entries = []
+            for book in books:
+                text, grams, weights = build_document(
+                    book.title, book.author, (memo.content for memo in book.memos.all())
+                )
+                document = SearchDocument(book_id=book.pk, user_id=book.user_id, text=text, grams=grams)
+                entries.append((document, weights))
+            SearchDocument.objects.bulk_create([document for document, _ in entries])
+            self.save_terms(entries)
+
+    def save_terms(self, entries):
+        """転置インデックスを持つエンジンは語ごとの重みをここで保存する"""
+
+    def remove_books(self, book_ids):
+        SearchDocument.objects.filter(book_id__in=book_ids).delete()
+
+    def search(self, queryset, query, user_id=None):
+        """user_id は queryset の書籍の所有者（分かっていればインデックスの絞り込みに使う）"""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """どの DB でも動く n-gram 転置インデックス（テスト・SQLite・MySQL 用）"""
+
+    def save_terms(self, entries):
+        # 書籍1冊で数十行になるので、モデルのインスタンスを作らず executemany で挿入する
+        opts = SearchToken._meta
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(opts.get_field(name).column) for name in ('book', 'user', 'token', 'weight'))
+        sql = f'INSERT INTO {quote(opts.db_table)} ({columns}) VALUES (%s, %s, %s, %s)'
+        rows = [
+            (document.book_id, document.user_id, term, weight)
+            for document, weights in entries
+            for term, weight in weights.items()
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def remove_books(self, book_ids):
+        SearchToken.objects.filter(book_id__in=book_ids).delete()
+        super().remove_books(book_ids)
+
+    def search(self, queryset, query, user_id=None):
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+        tokens = {'search_tokens__token__in': terms}
+        if user_id is not None:
+            # 所有者でも絞ると (user, token, book) のインデックスで他のユーザーの語を読まずに済む
+            tokens['search_tokens__user_id'] = user_id
+        queryset = queryset.filter(**tokens).annotate(
+            search_hits=Count('search_tokens'),
+            search_rank=Sum('search_tokens__weight'),
+        ).filter(search_hits=len(terms))
+        # bi-gram がすべて含まれていても語として連続しているとは限らないので本文で確認する
+        for word in split_words(query):
+            queryset = queryset.filter(search_document__text__contains=word)
+        return queryset.order_by('-search_rank', '-id')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """PostgreSQL の tsvector と pg_trgm を使う本番用エンジン
+
+    インデックスはマイグレーション 0002 で PostgreSQL の場合のみ作成する。
+    """
+
+    def search(self, queryset, query, user_id=None):
+        from django.contrib.postgres.search import (
+            SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+        )
+
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+        vector = SearchVector('search_document__grams', config='simple')
+        search_query = SearchQuery(
+            ' & '.join(f"'{term}'" for term in sorted(terms)), config='simple', search_type='raw'
+        )
+        queryset = queryset.annotate(search_vector=vector).filter(search_vector=search_query)
+        for word in split_words(query):
+            queryset = queryset.filter(search_document__text__contains=word)
+        return queryset.annotate(
+            search_rank=SearchRank(vector, search_query)
+            + TrigramSimilarity('search_document__text', normalize(query)),
+        ).order_by('-search_rank', '-id')
+
+
+def get_backend():
+    return import_string(getattr(settings, 'BOOKLOG_SEARCH_BACKEND', DEFAULT_BACKEND))()
+
+
+def index_books(book_ids, batch_size=500):
+    backend = get_backend()
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), batch_size):
+        backend.index_books(book_ids[start:start + batch_size])
+
+
+def remove_books(book_ids):
+    get_backend().remove_books(book_ids)
+
+
+def search_books(queryset, query, user_id=None):
+    """queryset を検索語で絞り込み、関連度順に並べて返す
+
+    queryset がユーザーの書籍なら user_id も渡す（検索インデックスを所有者で絞る）。
+    """
+    return get_backend().search(queryset, query, user_id=user_id)
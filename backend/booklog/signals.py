@@ -0,0 +1,144 @@
+# backend/booklog/signals.py
+"""Book / Memo の変更に合わせて派生データを更新するシグナルハンドラ"""
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import completion, search, stats, sync
+from .models import Book, Memo
+
+# bulk_create / bulk_update は post_save を送らないので、一括書き込みの後にこれを送る
+# sender はモデルクラス、引数は user_id と objects（書き込んだインスタンスのリスト）、
+# created（bulk_create なら True、bulk_update なら False）
+bulk_changed = Signal()
+
+
+def _cascaded(origin, model):
+    """親（書籍やユーザー）の削除に伴うカスケード削除かどうか
+
+    親側のハンドラが処理するので、子の削除では何もしない。
+    """
+    if origin is None:
+        return False
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is not model
+
+
+def _purged(instance):
+    """論理削除済みの行の物理削除（booklog.deletion.purge_deleted）かどうか
+
+    集計・検索インデックス・キャッシュは論理削除の時点で更新しているので何もしない。
+    """
+    return instance.deleted_at is not None
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+
+
+@receiver(post_save, sender=Memo)
+def index_memo_book(sender, instance, **kwargs):
+    search.index_books([instance.book_id])
+
+
+@receiver(post_delete, sender=Memo)
+def reindex_after_memo_delete(sender, instance, origin=None, **kwargs):
+    # 書籍ごと削除される場合は検索インデックスもカスケードで消える
+    if _cascaded(origin, Memo) or _purged(instance):
+        return
+    search.index_books([instance.book_id])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def mark_book_changed(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin, Book) or _purged(instance):
+        return
+    sync.record_changes(instance.user_id, sync.BOOK, [instance.pk], deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(post_save, sender=Memo)
+@receiver(post_delete, sender=Memo)
+def mark_memo_changed(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin, Memo) or _purged(instance):
+        return
+    sync.record_changes(instance.book.user_id, sync.MEMO, [instance.pk], deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, **kwargs):
+    if created:
+        stats.books_added(instance.user_id, [instance])
+    else:
+        stats.books_changed(instance.user_id, [instance])
+
+
+@receiver(pre_delete, sender=Book)
+def count_book_memos(sender, instance, origin=None, **kwargs):
+    # メモはカスケードで先に消えるので、削除前に数えておく
+    if _cascaded(origin, Book) or _purged(instance):
+        return
+    instance._stats_memo_count = instance.memos.count()
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin, Book) or _purged(instance):
+        return
+    stats.books_removed(
+        instance.user_id, [(instance.author, instance.published_date, instance.created_at)],
+        memos=getattr(instance, '_stats_memo_count', 0),
+    )
+
+
+@receiver(post_save, sender=Book)
+def complete_saved_book(sender, instance, created, **kwargs):
+    if created:
+        completion.books_added(instance.user_id, [instance])
+    else:
+        completion.books_changed(instance.user_id, [instance])
+
+
+@receiver(post_delete, sender=Book)
+def complete_deleted_book(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin, Book) or _purged(instance):
+        return
+    completion.books_removed(instance.user_id, [(instance.title, instance.author)])
+
+
+@receiver(post_save, sender=Memo)
+def count_saved_memo(sender, instance, created, **kwargs):
+    if created:
+        stats.memos_added(instance.book.user_id, 1)
+
+
+@receiver(post_delete, sender=Memo)
+def count_deleted_memo(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin, Memo) or _purged(instance):
+        return
+    stats.memos_added(instance.book.user_id, -1)
+
+
+@receiver(bulk_changed, sender=Book)
+def books_bulk_changed(sender, user_id, objects, created=False, **kwargs):
+    search.index_books([book.pk for book in objects])
+    sync.record_changes(user_id, sync.BOOK, [book.pk for book in objects])
+    if created:
+        # インポートでは書籍と一緒にメモも登録している
+        memo_ids = list(Memo.objects.filter(book__in=objects).values_list('pk', flat=True))
+        if memo_ids:
+            sync.record_changes(user_id, sync.MEMO, memo_ids)
+        stats.books_added(user_id, objects, memos=len(memo_ids))
+        completion.books_added(user_id, objects)
+    else:
+        stats.books_changed(user_id, objects)
+        completion.books_changed(user_id, objects)
+
+
+@receiver(bulk_changed, sender=Memo)
+def memos_bulk_changed(sender, user_id, objects, created=False, **kwargs):
+    search.index_books({memo.book_id for memo in objects})
+    sync.record_changes(user_id, sync.MEMO, [memo.pk for memo in objects])
+    if created:
+        stats.memos_added(user_id, len(objects))
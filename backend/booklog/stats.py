@@ -0,0 +1,174 @@
+# backend/booklog/stats.py
+"""ユーザーごとの蔵書の集計（ダッシュボード用）
+
+表示のたびに Book / Memo を GROUP BY しないよう、集計を LibraryStats
+（冊数・メモ数）と LibraryStatBucket（著者別・登録月別・出版年別の冊数）に
+保存しておき、書籍・メモが変更されるたびに差分だけを F() で加減する
+（booklog.signals から呼ぶ）。ずれたときは ``manage.py rebuild_stats`` で作り直す。
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractYear, TruncMonth
+from django.utils import timezone
+
+from .models import Book, LibraryStatBucket, LibraryStats, Memo
+
+AUTHOR = LibraryStatBucket.AUTHOR
+MONTH = LibraryStatBucket.MONTH
+YEAR = LibraryStatBucket.YEAR
+
+
+def month_key(value):
+    return f'{value:%Y-%m}'
+
+
+def book_buckets(author, published_date, created_at):
+    """書籍1冊が数えられる (種類, キー) の一覧"""
+    buckets = [(AUTHOR, author), (MONTH, month_key(timezone.localtime(created_at)))]
+    if published_date is not None:
+        buckets.append((YEAR, str(published_date.year)))
+    return buckets
+
+
+def bucket_counts(books):
+    """書籍のクエリセットから {(種類, キー): 冊数} を求める（マイグレーションからも使う）"""
+    books = books.order_by()
+    counts = Counter()
+    for author, count in books.values_list('author').annotate(count=Count('pk')):
+        counts[AUTHOR, author] = count
+    for month, count in books.values_list(TruncMonth('created_at')).annotate(count=Count('pk')):
+        counts[MONTH, month_key(month)] = count
+    for year, count in (
+        books.filter(published_date__isnull=False)
+        .values_list(ExtractYear('published_date')).annotate(count=Count('pk'))
+    ):
+        counts[YEAR, str(year)] = count
+    return counts
+
+
+def rebuild_user(user_id):
+    """ユーザーの集計を Book / Memo から作り直す"""
+    books = Book.objects.filter(user_id=user_id)
+    with transaction.atomic():
+        stats, _ = LibraryStats.objects.update_or_create(user_id=user_id, defaults={
+            'book_count': books.count(),
+            'memo_count': Memo.objects.filter(book__user_id=user_id).count(),
+        })
+        LibraryStatBucket.objects.filter(user_id=user_id).delete()
+        LibraryStatBucket.objects.bulk_create([
+            LibraryStatBucket(user_id=user_id, kind=kind, key=key, count=count)
+            for (kind, key), count in sorted(bucket_counts(books).items())
+        ], batch_size=1000)
+    return stats
+
+
+def apply(user_id, books=0, memos=0, buckets=None):
+    """集計に差分を加える。buckets は {(種類, キー): 増減}"""
+    buckets = {bucket: delta for bucket, delta in (buckets or {}).items() if delta}
+    if not (books or memos or buckets):
+        return
+    with transaction.atomic():
+        updated = LibraryStats.objects.filter(user_id=user_id).update(
+            book_count=F('book_count') + books,
+            memo_count=F('memo_count') + memos,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # まだ集計が無い（変更はすでに DB に反映されている）ので全体を数える
+            rebuild_user(user_id)
+            return
+        emptied = []
+        for (kind, key), delta in buckets.items():
+            if not _add_to_bucket(user_id, kind, key, delta) and delta > 0:
+                _create_bucket(user_id, kind, key, delta)
+            elif delta < 0:
+                emptied.append((kind, key))
+        for kind, key in emptied:
+            LibraryStatBucket.objects.filter(user_id=user_id, kind=kind, key=key, count__lte=0).delete()
+
+
+def _add_to_bucket(user_id, kind, key, delta):
+    return LibraryStatBucket.objects.filter(user_id=user_id, kind=kind, key=key).update(count=F('count') + delta)
+
+
+def _create_bucket(user_id, kind, key, count):
+    try:
+        with transaction.atomic():
+            LibraryStatBucket.objects.create(user_id=user_id, kind=kind, key=key, count=count)
+    except IntegrityError:
+        # 同時に別のリクエストが作った
+        _add_to_bucket(user_id, kind, key, count)
+
+
+def _remember(book):
+    book._stats_loaded = (book.author, book.published_date)
+
+
+def books_added(user_id, books, memos=0):
+    """書籍の登録。memos は一緒に登録したメモの数（インポート）"""
+    buckets = Counter()
+    for book in books:
+        buckets.update(book_buckets(book.author, book.published_date, book.created_at))
+        _remember(book)
+    apply(user_id, books=len(books), memos=memos, buckets=buckets)
+
+
+def books_changed(user_id, books):
+    """書籍の更新。読み込んだ時点（Book.from_db）の著者・出版日との差分を数える"""
+    buckets = Counter()
+    for book in books:
+        loaded = getattr(book, '_stats_loaded', None)
+        if loaded is None:
+            # 読み込んだ時点の値が分からない（Book(pk=...) を直接保存した場合など）
+            rebuild_user(user_id)
+            return
+        buckets.update(book_buckets(book.author, book.published_date, book.created_at))
+        buckets.subtract(book_buckets(*loaded, book.created_at))
+        _remember(book)
+    apply(user_id, buckets=buckets)
+
+
+def books_removed(user_id, books, memos=0):
+    """書籍の削除。books は (著者, 出版日, 登録日時)、memos は一緒に削除したメモの数"""
+    buckets = Counter()
+    for author, published_date, created_at in books:
+        buckets.subtract(book_buckets(author, published_date, created_at))
+    apply(user_id, books=-len(books), memos=-memos, buckets=buckets)
+
+
+def memos_added(user_id, count):
+    apply(user_id, memos=count)
+
+
+# 内訳の並び（著者は冊数の多い順、登録月・出版年は新しい順）
+BUCKET_ORDERINGS = {
+    AUTHOR: ('-count', 'key'),
+    MONTH: ('-key',),
+    YEAR: ('-key',),
+}
+
+
+def top_buckets(user_id, kind, limit):
+    """内訳の上位 limit 件の (キー, 冊数) を読むクエリセット
+
+    並べ替えと件数の制限は DB で行う（著者は booklog_statbucket_count、登録月・出版年は
+    一意制約のインデックスを順に読む）ので、著者の多い蔵書でも読む行は limit 件で済む。
+    """
+    return (
+        LibraryStatBucket.objects.filter(user_id=user_id, kind=kind)
+        .order_by(*BUCKET_ORDERINGS[kind])
+        .values_list('key', 'count')[:limit]
+    )
+
+
+def dashboard(user_id, months=12, authors=10, years=10):
+    """ダッシュボードに表示する集計（集計のテーブルだけを読む）"""
+    stats = LibraryStats.objects.filter(user_id=user_id).first() or LibraryStats(user_id=user_id)
+    return {
+        'stats': stats,
+        'authors': list(top_buckets(user_id, AUTHOR, authors)),
+        'months': list(top_buckets(user_id, MONTH, months)),
+        'years': list(top_buckets(user_id, YEAR, years)),
+    }
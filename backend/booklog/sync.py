@@ -0,0 +1,107 @@
+# backend/booklog/sync.py
+"""オフラインのクライアント向けの変更フィード（/api/v1/changes/）
+
+書籍・メモが作成・更新・削除されるたびに、LibraryChange に (種類, id, 通番, 削除) を
+記録する（booklog.signals / booklog.deletion から呼ぶ）。同じ書籍・メモの行は上書きする
+ので、行数は書籍・メモの数より増えない。削除も行として残るので、クライアントは
+削除されたものを知ることができる。書籍の削除はその書籍のメモの削除も意味する
+（メモの数によらず削除が一定の時間で済むよう、メモごとには記録しない）。
+
+通番は LibraryState.seq でユーザーごとに1ずつ増える。通番を進めてから変更を記録する
+までを1トランザクションで行い、その間 LibraryState の行をロックしているので、
+変更は通番の順にコミットされる。そのため同期トークン（最後に受け取った (通番, id)）
+より後を読めば、取りこぼしは起きない。
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .conditional import touch_library
+from .models import Book, LibraryChange, LibraryState, Memo
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+BOOK = LibraryChange.BOOK
+MEMO = LibraryChange.MEMO
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def record_changes(user_id, kind, object_ids, deleted=False):
+    """書籍（BOOK）またはメモ（MEMO）の変更を記録し、その通番を返す"""
+    object_ids = list(object_ids)
+    # MySQL は一意制約を指定できない（どの一意制約の衝突でも更新する）
+    unique_fields = ['user', 'kind', 'object_id'] if connection.features.supports_update_conflicts_with_target else None
+    # 呼び出し元のトランザクションの中ではセーブポイントを作らない（失敗すれば全体を戻す）
+    with transaction.atomic(savepoint=False):
+        touch_library(user_id)
+        seq = LibraryState.objects.filter(user_id=user_id).values_list('seq', flat=True).get()
+        LibraryChange.objects.bulk_create(
+            [
+                LibraryChange(user_id=user_id, kind=kind, object_id=pk, seq=seq, deleted=deleted)
+                for pk in object_ids
+            ],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['seq', 'deleted'],
+            batch_size=settings.BOOKLOG_BULK_BATCH_SIZE,
+        )
+    return seq
+
+
+def encode_token(seq, pk):
+    return encode_cursor([seq, pk])
+
+
+def decode_token(token):
+    """同期トークンを (通番, id) にする。空なら最初から"""
+    if not token:
+        return 0, 0
+    try:
+        seq, pk = decode_cursor(token)
+    except (InvalidCursor, TypeError, ValueError):
+        raise InvalidToken(token)
+    if not (isinstance(seq, int) and isinstance(pk, int)):
+        raise InvalidToken(token)
+    return seq, pk
+
+
+class ChangeSet:
+    """同期トークンより後の変更の1ページ"""
+
+    def __init__(self, books, memos, deleted_books, deleted_memos, token, has_more):
+        self.books = books
+        self.memos = memos
+        self.deleted_books = deleted_books
+        self.deleted_memos = deleted_memos
+        self.token = token
+        self.has_more = has_more
+
+
+def changes_since(user_id, token, limit):
+    """token より後の変更を最大 limit 件返す（書籍・メモは今の内容を読む）"""
+    seq, pk = decode_token(token)
+    rows = list(
+        LibraryChange.objects.filter(user_id=user_id)
+        .filter(Q(seq__gt=seq) | Q(seq=seq, pk__gt=pk))
+        .order_by('seq', 'pk')
+        .values_list('pk', 'seq', 'kind', 'object_id', 'deleted')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changed = {BOOK: [], MEMO: []}
+    deleted = {BOOK: [], MEMO: []}
+    for _, _, kind, object_id, is_deleted in rows:
+        (deleted if is_deleted else changed)[kind].append(object_id)
+
+    books = list(Book.objects.filter(user_id=user_id, pk__in=changed[BOOK])) if changed[BOOK] else []
+    memos = list(Memo.objects.filter(book__user_id=user_id, pk__in=changed[MEMO])) if changed[MEMO] else []
+    # 書籍ごと削除されたメモは削除として返す
+    deleted[BOOK] += sorted(set(changed[BOOK]) - {book.pk for book in books})
+    deleted[MEMO] += sorted(set(changed[MEMO]) - {memo.pk for memo in memos})
+
+    if rows:
+        token = encode_token(rows[-1][1], rows[-1][0])
+    return ChangeSet(books, memos, deleted[BOOK], deleted[MEMO], token or encode_token(0, 0), has_more)
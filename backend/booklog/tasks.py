@@ -0,0 +1,102 @@
+# backend/booklog/tasks.py
+"""バックグラウンドジョブの処理本体（booklog.jobs.task で登録する）"""
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.utils import timezone
+
+from . import completion, deletion, export, importers, search
+from .jobs import PermanentJobError, job_storage, report_progress, task
+from .models import Book
+
+# エクスポートの進捗を報告する間隔（書き出したバイト数）
+EXPORT_PROGRESS_BYTES = 1024 * 1024
+
+
+def _job_user(job):
+    if job.user_id is None:
+        raise PermanentJobError('ユーザーが見つかりません')
+    return job.user
+
+
+@task('import_books', '書籍のインポート')
+def import_books(job):
+    """アップロードされたファイルを取り込む
+
+    (タイトル, 著者) が同じ書籍は登録しないので、途中で失敗して再実行しても二重にならない。
+    """
+    user = _job_user(job)
+    path = job.payload['path']
+    storage = job_storage()
+
+    def progress(result):
+        report_progress(job, processed=result.processed, created=result.created)
+
+    try:
+        with storage.open(path, 'rb') as source:
+            result = importers.import_books(
+                user, importers.open_text(source, path), job.payload['format'], progress=progress
+            )
+    except importers.ImportFailed as error:
+        raise PermanentJobError(str(error))
+    storage.delete(path)
+    return result.as_dict()
+
+
+@task('export_library', 'エクスポート')
+def export_library(job):
+    """エクスポートのファイルを作り、ダウンロードできるようにする"""
+    user = _job_user(job)
+    format, memos, gzip = job.payload['format'], job.payload['memos'], job.payload.get('gzip', False)
+    filename = export.export_filename(format, gzip, timezone.localdate())
+    path = f'exports/{job.pk}/{filename}'
+    storage = job_storage()
+    if storage.exists(path):
+        storage.delete(path)
+
+    with tempfile.TemporaryFile() as output:
+        reported = 0
+        for chunk in export.export_library(user, format, memos, gzip=gzip):
+            output.write(chunk)
+            # 進捗の報告が実行中であることの知らせ（ハートビート）にもなる
+            if output.tell() - reported >= EXPORT_PROGRESS_BYTES:
+                reported = output.tell()
+                report_progress(job, written=reported)
+        size = output.tell()
+        output.seek(0)
+        path = storage.save(path, File(output))
+    return {'path': path, 'filename': filename, 'size': size}
+
+
+@task('reindex', '検索インデックスの再作成')
+def reindex(job):
+    """ユーザーの書籍の検索インデックス（と入力補完）を作り直す"""
+    user = _job_user(job)
+    book_ids = list(Book.objects.filter(user=user).order_by('pk').values_list('pk', flat=True))
+    batch_size = settings.BOOKLOG_BULK_BATCH_SIZE
+    for start in range(0, len(book_ids), batch_size):
+        search.index_books(book_ids[start:start + batch_size])
+        report_progress(job, indexed=min(start + batch_size, len(book_ids)), total=len(book_ids))
+    completion.rebuild_user(user.pk)
+    return {'indexed': len(book_ids)}
+
+
+@task('delete_account', 'アカウントの削除', max_attempts=5)
+def delete_account(job):
+    """書籍・メモとユーザーごとの派生データを少しずつ削除してから、ユーザーを削除する
+
+    1回のトランザクションで全件を消すとロックが長くなるので、
+    BOOKLOG_BULK_BATCH_SIZE 件ずつ区切る（booklog.deletion.purge_user）。
+    """
+    user_id = job.payload['user']
+    done = {}
+
+    def progress(model_name, deleted):
+        done[model_name] = deleted
+        report_progress(job, **done)
+
+    purged = deletion.purge_user(user_id, progress=progress)
+    get_user_model().objects.filter(pk=user_id).delete()
+    return {'deleted': purged['books']}
@@ -0,0 +1,30 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from booklog import assets
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def stylesheet(context):
+    """CSS の読み込み（booklog.assets を参照）"""
+    url = static(assets.STYLESHEET)
+    version = assets.stylesheet_version(url)
+    request = context.get('request')
+    if request is not None and request.COOKIES.get(assets.COOKIE) == version:
+        return format_html('<link href="{}" rel="stylesheet">', url)
+    # 読み終えたら rel を stylesheet にして適用し、Cookie に CSS の版を覚えておく
+    onload = (
+        f"this.onload=null;this.rel='stylesheet';"
+        f"document.cookie='{assets.COOKIE}={version};path=/;max-age=31536000;samesite=lax'"
+    )
+    return format_html(
+        '<style>{}</style>\n'
+        '    <link href="{}" rel="preload" as="style" onload="{}">\n'
+        '    <noscript><link href="{}" rel="stylesheet"></noscript>',
+        # CSS は <style> の中なのでエスケープしない（テンプレートから作ったもので </style> は含まない）
+        mark_safe(assets.critical_css()), url, onload, url,
+    )
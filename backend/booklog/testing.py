@@ -0,0 +1,68 @@
+# backend/booklog/testing.py
+"""テスト用のユーティリティ"""
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from . import completion, stats, sync
+from .models import Book, Memo
+
+
+class QueryBudgetMixin:
+    """ビューの ``query_budget`` を超えるクエリが発行されたらテストを失敗させる
+
+    TestCase に混ぜて使う::
+
+        response = self.assertWithinQueryBudget(reverse('booklog:book_list'))
+    """
+
+    def assertWithinQueryBudget(self, url, data=None, budget=None):
+        if budget is None:
+            view_class = resolve(url).func.view_class
+            budget = getattr(view_class, 'query_budget', None)
+            if budget is None:
+                self.fail(f'{view_class.__name__} に query_budget が宣言されていません')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+            if response.streaming:
+                # ストリーミングはクエリが本文の生成中に走るので、ここで読み切っておく
+                response.streaming_content = [b''.join(response.streaming_content)]
+
+        if len(queries) > budget:
+            executed = '\n'.join(
+                f"{i}. {query['sql']}" for i, query in enumerate(queries.captured_queries, start=1)
+            )
+            self.fail(f'{url} のクエリ数が上限を超えました: {len(queries)} > {budget}\n{executed}')
+        return response
+
+
+def seed_library(user, books, memos_per_book=0, batch_size=1000):
+    """大きな蔵書を bulk_create で作る（シグナルを送らないので検索インデックスは作らない）
+
+    集計（booklog.stats）と入力補完（booklog.completion）は最後にまとめて作り直し、
+    変更フィード（booklog.sync）にはバッチごとに記録する。
+
+    更新日時は登録順とずらしておき、「更新順」の並びが id の順と一致しないようにする。
+    """
+    now = timezone.now()
+    for start in range(0, books, batch_size):
+        created = Book.objects.bulk_create([
+            Book(user=user, title=f'書籍{number}', author=f'著者{number % 97}')
+            for number in range(start, min(start + batch_size, books))
+        ])
+        for book in created:
+            book.updated_at = now - datetime.timedelta(minutes=(book.pk * 7919) % 10007)
+        Book.objects.bulk_update(created, ['updated_at'])
+        memos = Memo.objects.bulk_create([
+            Memo(book=book, content=f'メモ{number}')
+            for book in created
+            for number in range(memos_per_book)
+        ])
+        sync.record_changes(user.pk, sync.BOOK, [book.pk for book in created])
+        sync.record_changes(user.pk, sync.MEMO, [memo.pk for memo in memos])
+    stats.rebuild_user(user.pk)
+    completion.rebuild_user(user.pk)
@@ -1,10 +1,43 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
+from django.core.cache import cache
 from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
 from django.urls import reverse
 from django.utils import timezone
-from datetime import date
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import pstats
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.conf import settings
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.handlers.wsgi import WSGIHandler
+from unittest import mock
+from django.urls import clear_url_caches, resolve
+import config.urls
+from config.database import configure_connections
+from benchmarks import compare as benchmark_compare, micro as benchmark_micro
 from .models import Book, Memo
 from .forms import BookForm, MemoForm
+from .search import search_books, query_terms, normalize
+from .pagination import KeysetPaginator, InvalidCursor
+from .testing import QueryBudgetMixin, seed_library
+from .conditional import library_state
+from . import async_views, auth, completion, counting, deletion, export, importers, jobs, metrics, queryplans, routers, stats, sync, urls as booklog_urls
+from .models import CompletionEntry, Job, LibraryChange, LibraryStatBucket, LibraryState, LibraryStats, SearchDocument, SearchToken
 
 
 class BookModelTest(TestCase):
@@ -519,4 +552,2170 @@ class IntegrationTest(TestCase):
         
         # 検索テスト
         response = self.client.get(reverse('booklog:book_list'), {'query': '更新された'})
-        self.assertContains(response, '更新された統合テスト書籍')
\ No newline at end of file
+        self.assertContains(response, '更新された統合テスト書籍')
+
+
+class BookSearchTest(TestCase):
+    """全文検索インデックスのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='searchuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(
+            title='吾輩は猫である',
+            author='夏目漱石',
+            user=self.user
+        )
+        self.memo_book = Book.objects.create(
+            title='こころ',
+            author='夏目漱石',
+            user=self.user
+        )
+        Memo.objects.create(book=self.memo_book, content='先生と私の関係が印象的')
+        Book.objects.create(
+            title='吾輩は猫である',
+            author='夏目漱石',
+            user=self.other_user
+        )
+
+    def search(self, query):
+        return list(search_books(Book.objects.filter(user=self.user), query))
+
+    def test_normalize(self):
+        """全角・半角と大文字・小文字の正規化テスト"""
+        self.assertEqual(normalize('ＤｊａｎｇｏＡＢＣ'), 'djangoabc')
+        self.assertEqual(query_terms('猫です'), {'猫で', 'です'})
+
+    def test_search_title_partial(self):
+        """タイトルの部分一致検索テスト"""
+        self.assertEqual(self.search('猫で'), [self.book])
+        self.assertEqual(self.search('猫'), [self.book])
+
+    def test_search_memo_content(self):
+        """メモ本文の検索テスト"""
+        self.assertEqual(self.search('先生'), [self.memo_book])
+
+    def test_search_excludes_other_users(self):
+        """他ユーザーの書籍が検索されないことのテスト"""
+        results = self.search('吾輩')
+        self.assertEqual(results, [self.book])
+
+    def test_search_requires_contiguous_words(self):
+        """bi-gram が揃っていても連続していない語は一致しないテスト"""
+        self.assertEqual(self.search('猫吾輩'), [])
+
+    def test_search_ranking(self):
+        """タイトル一致がメモ一致より上位になるテスト"""
+        Memo.objects.create(book=self.book, content='こころに残る')
+        self.assertEqual(self.search('こころ'), [self.memo_book, self.book])
+
+    def test_index_follows_updates(self):
+        """書籍の更新・メモ削除でインデックスが更新されるテスト"""
+        self.book.title = '坊っちゃん'
+        self.book.save()
+        self.assertEqual(self.search('吾輩'), [])
+        self.assertEqual(self.search('坊っちゃん'), [self.book])
+
+        self.memo_book.memos.all().delete()
+        self.assertEqual(self.search('先生'), [])
+
+    def test_book_delete_removes_index(self):
+        """書籍削除でインデックスも削除されるテスト"""
+        self.memo_book.delete()
+        self.assertEqual(self.search('先生'), [])
+
+
+class KeysetPaginationTest(TestCase):
+    """カーソル方式ページネーションのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='pageuser',
+            password='testpass123'
+        )
+        self.books = [
+            Book.objects.create(title=f'書籍{i}', author='著者', user=self.user)
+            for i in range(12)
+        ]
+        # 更新日時が同じ書籍があってもシークできることを確認するため揃えておく
+        Book.objects.filter(pk__in=[b.pk for b in self.books[:6]]).update(
+            updated_at=timezone.now()
+        )
+
+    def walk(self, ordering):
+        paginator = KeysetPaginator(Book.objects.filter(user=self.user), 5, ordering)
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):  # COUNT(*) を発行しない
+                page = paginator.page(cursor)
+            seen.extend(book.pk for book in page)
+            if not page.has_next():
+                return seen
+            cursor = page.next_cursor
+
+    def test_walk_by_id(self):
+        """id 順にすべての書籍を重複なく辿れるテスト"""
+        self.assertEqual(self.walk(('-id',)), [b.pk for b in reversed(self.books)])
+
+    def test_walk_by_updated_at(self):
+        """(updated_at, id) 順にすべての書籍を重複なく辿れるテスト"""
+        expected = list(
+            Book.objects.filter(user=self.user)
+            .order_by('-updated_at', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(self.walk(('-updated_at', '-id')), expected)
+
+    def test_invalid_cursor(self):
+        """不正なカーソルのテスト"""
+        paginator = KeysetPaginator(Book.objects.all(), 5, ('-id',))
+        with self.assertRaises(InvalidCursor):
+            paginator.page('invalid')
+        other = KeysetPaginator(Book.objects.all(), 5, ('-updated_at', '-id'))
+        with self.assertRaises(InvalidCursor):
+            paginator.page(other.cursor_for(self.books[0]))
+
+    def test_book_list_cursor_mode(self):
+        """書籍一覧のカーソル方式ページ送りテスト"""
+        self.client.login(username='pageuser', password='testpass123')
+        response = self.client.get(reverse('booklog:book_list'))
+        self.assertTrue(response.context['cursor_mode'])
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'?after={next_cursor}')
+        self.assertNotContains(response, '全 12 件')
+
+        response = self.client.get(reverse('booklog:book_list'), {'after': next_cursor})
+        self.assertEqual(
+            [b.pk for b in response.context['books']],
+            [b.pk for b in reversed(self.books[2:7])]
+        )
+
+        response = self.client.get(reverse('booklog:book_list'), {'after': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_book_list_page_number_fallback(self):
+        """ページ番号指定時は従来のページネーションになるテスト"""
+        self.client.login(username='pageuser', password='testpass123')
+        response = self.client.get(reverse('booklog:book_list'), {'page': 2})
+        self.assertFalse(response.context['cursor_mode'])
+        self.assertContains(response, '全 12 件')
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """ビューごとのクエリ数上限のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='budgetuser',
+            password='testpass123'
+        )
+        for i in range(8):
+            book = Book.objects.create(title=f'書籍{i}', author='著者', user=self.user)
+            for j in range(3):
+                Memo.objects.create(book=book, content=f'メモ{j}')
+        self.book = book
+        self.memo = book.memos.first()
+        self.client.login(username='budgetuser', password='testpass123')
+
+    def test_all_views_declare_budget(self):
+        """booklog の全ビューが query_budget を宣言しているテスト"""
+        for pattern in booklog_urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertIsNotNone(getattr(pattern.callback.view_class, 'query_budget', None))
+
+    def test_book_views(self):
+        """書籍ビューがクエリ数の上限内に収まるテスト"""
+        self.assertWithinQueryBudget(reverse('booklog:book_list'))
+        self.assertWithinQueryBudget(reverse('booklog:book_list'), {'page': 2})
+        self.assertWithinQueryBudget(reverse('booklog:book_list'), {'query': '書籍'})
+        self.assertWithinQueryBudget(reverse('booklog:book_create'))
+        for name in ['book_detail', 'book_update', 'book_delete']:
+            with self.subTest(name=name):
+                self.assertWithinQueryBudget(reverse(f'booklog:{name}', kwargs={'pk': self.book.pk}))
+
+    def test_book_detail_and_delete_show_memos(self):
+        """メモの一覧と件数が1回の取得で表示されるテスト"""
+        response = self.assertWithinQueryBudget(
+            reverse('booklog:book_detail', kwargs={'pk': self.book.pk})
+        )
+        self.assertContains(response, 'メモ2')
+        response = self.assertWithinQueryBudget(
+            reverse('booklog:book_delete', kwargs={'pk': self.book.pk})
+        )
+        self.assertContains(response, '3件のメモも同時に削除されます')
+
+    def test_memo_views(self):
+        """メモビューがクエリ数の上限内に収まるテスト"""
+        self.assertWithinQueryBudget(reverse('booklog:memo_add', kwargs={'book_pk': self.book.pk}))
+        self.assertWithinQueryBudget(reverse('booklog:memo_edit', kwargs={'pk': self.memo.pk}))
+        self.assertWithinQueryBudget(reverse('booklog:memo_delete', kwargs={'pk': self.memo.pk}))
+
+    def test_export_view(self):
+        """エクスポートがクエリ数の上限内に収まるテスト"""
+        self.assertWithinQueryBudget(reverse('booklog:export'), {'format': 'ndjson'})
+        self.assertWithinQueryBudget(reverse('booklog:book_import'))
+
+
+class FragmentCacheTest(TestCase):
+    """一覧・詳細ページのキャッシュのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='cacheuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='othercacheuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='キャッシュ書籍', author='著者', user=self.user)
+        Book.objects.create(title='他人の書籍', author='著者', user=self.other_user)
+        self.client.login(username='cacheuser', password='testpass123')
+
+    def test_book_list_served_from_cache(self):
+        """2回目の一覧表示で書籍を取得しないテスト"""
+        url = reverse('booklog:book_list')
+        self.client.get(url)
+        with self.assertNumQueries(1):  # 最終変更日時のみ（セッションとユーザーはキャッシュから読む）
+            response = self.client.get(url)
+        self.assertContains(response, 'キャッシュ書籍')
+        self.assertNotContains(response, '他人の書籍')
+
+    def test_cache_varies_on_parameters(self):
+        """検索語ごとに別のキャッシュになるテスト"""
+        url = reverse('booklog:book_list')
+        self.client.get(url)
+        response = self.client.get(url, {'query': '存在しない'})
+        self.assertNotContains(response, 'キャッシュ書籍')
+
+    def test_book_write_invalidates_list(self):
+        """書籍の登録・削除で一覧のキャッシュが無効になるテスト"""
+        url = reverse('booklog:book_list')
+        self.client.get(url)
+        book = Book.objects.create(title='追加した書籍', author='著者', user=self.user)
+        self.assertContains(self.client.get(url), '追加した書籍')
+        book.delete()
+        self.assertNotContains(self.client.get(url), '追加した書籍')
+
+    def test_memo_write_invalidates_detail(self):
+        """メモの追加・削除で詳細のキャッシュが無効になるテスト"""
+        url = reverse('booklog:book_detail', kwargs={'pk': self.book.pk})
+        self.assertContains(self.client.get(url), 'まだありません')
+        memo = Memo.objects.create(book=self.book, content='キャッシュされないメモ')
+        response = self.client.get(url)
+        self.assertContains(response, 'キャッシュされないメモ')
+        self.assertContains(response, '<title>キャッシュ書籍 - 書籍詳細</title>')
+        memo.delete()
+        self.assertNotContains(self.client.get(url), 'キャッシュされないメモ')
+
+    def test_other_user_write_keeps_cache(self):
+        """他ユーザーの変更ではキャッシュが残るテスト"""
+        url = reverse('booklog:book_list')
+        self.client.get(url)
+        Book.objects.create(title='別ユーザーの追加', author='著者', user=self.other_user)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_version_read_from_database(self):
+        """キャッシュのカウンタではなく DB の変更の通番でキャッシュを分けるテスト
+
+        別のプロセス（ワーカー・他の gunicorn ワーカー）の書き込みはこのプロセスの
+        キャッシュに何も残さないので、DB の値だけで無効になる必要がある。
+        """
+        url = reverse('booklog:book_list')
+        self.client.get(url)
+        Book.objects.bulk_create([Book(title='別のプロセスの書籍', author='著者', user=self.user)])
+        self.assertNotContains(self.client.get(url), '別のプロセスの書籍')
+        LibraryState.objects.filter(user=self.user).update(seq=F('seq') + 1)
+        self.assertContains(self.client.get(url), '別のプロセスの書籍')
+
+
+class ConditionalGetTest(TestCase):
+    """ETag / Last-Modified による条件付き GET のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='etaguser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='ETag書籍', author='著者', user=self.user)
+        self.memo = Memo.objects.create(book=self.book, content='最初のメモ')
+        self.client.login(username='etaguser', password='testpass123')
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_book_list_not_modified(self):
+        """一覧が変更されていなければ 304 を返すテスト"""
+        url = reverse('booklog:book_list')
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        with self.assertNumQueries(1):  # 最終変更日時（セッションとユーザーはキャッシュから読む）
+            self.assertNotModified(url, etag)
+
+        # 検索条件が違えば別の ETag になる
+        self.assertNotEqual(self.client.get(url, {'sort': 'updated'})['ETag'], etag)
+
+    def test_relogin_not_reuses_page(self):
+        """ログインし直すと、蔵書が同じでも古いページ（古い CSRF トークン）を 304 で使わせないテスト"""
+        for url in (reverse('booklog:book_list'), reverse('booklog:book_detail', kwargs={'pk': self.book.pk})):
+            with self.subTest(url=url):
+                self.client.get(url)  # CSRF の Cookie が発行される
+                etag = self.client.get(url)['ETag']
+                self.client.logout()
+                self.client.login(username='etaguser', password='testpass123')
+                self.assertModified(url, etag)
+
+    def test_book_list_modified_by_memo_delete(self):
+        """メモの削除で一覧の ETag が変わるテスト"""
+        url = reverse('booklog:book_list')
+        etag = self.client.get(url)['ETag']
+        self.memo.delete()
+        self.assertModified(url, etag)
+
+    def test_book_detail_validators(self):
+        """メモの編集・追加・削除で詳細の ETag が変わるテスト"""
+        url = reverse('booklog:book_detail', kwargs={'pk': self.book.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+
+        self.memo.content = '編集したメモ'
+        self.memo.save()
+        etag = self.assertModified(url, etag)
+
+        memo = Memo.objects.create(book=self.book, content='追加したメモ')
+        etag = self.assertModified(url, etag)
+
+        memo.delete()
+        self.assertModified(url, etag)
+
+    def test_book_detail_other_user(self):
+        """他ユーザーの書籍には検証子を返さず 404 になるテスト"""
+        other = User.objects.create_user(username='etagother', password='testpass123')
+        book = Book.objects.create(title='他人の書籍', author='著者', user=other)
+        response = self.client.get(
+            reverse('booklog:book_detail', kwargs={'pk': book.pk}),
+            headers={'if-none-match': '*'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_user_delete_cascades(self):
+        """ユーザー削除時に蔵書の状態が残らないテスト"""
+        self.user.delete()
+        self.assertFalse(Book.objects.exists())
+
+
+class ApiTest(TestCase):
+    """JSON API のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='apiuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='apiother',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='API書籍', author='API著者', user=self.user)
+        self.other_book = Book.objects.create(title='他人の書籍', author='著者', user=self.other_user)
+        self.memo = Memo.objects.create(book=self.book, content='APIメモ')
+        self.client.login(username='apiuser', password='testpass123')
+
+    def send(self, method, name, data=None, kwargs=None, **params):
+        url = reverse(f'booklog:{name}', kwargs=kwargs)
+        if method == 'get':
+            return self.client.get(url, params)
+        return getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+
+    def test_requires_login(self):
+        """未ログインでは 401 を返すテスト"""
+        self.client.logout()
+        response = self.send('get', 'api_book_list')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('error', response.json())
+
+    def test_book_list_sparse_fields_and_cursor(self):
+        """一覧の疎なフィールドセットとカーソルのテスト"""
+        for i in range(3):
+            Book.objects.create(title=f'追加{i}', author='著者', user=self.user)
+        response = self.send('get', 'api_book_list', fields='title', limit=2)
+        data = response.json()
+        self.assertEqual(data['results'], [{'id': b.pk, 'title': b.title} for b in
+                                           Book.objects.filter(user=self.user).order_by('-id')[:2]])
+        response = self.send('get', 'api_book_list', fields='title', limit=2, after=data['next'])
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next'])
+
+        self.assertEqual(self.send('get', 'api_book_list', fields='password').status_code, 400)
+
+    def test_book_crud(self):
+        """書籍の作成・取得・更新・削除のテスト"""
+        response = self.send('post', 'api_book_list', {'title': '新しい本', 'author': '新著者'})
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()['id']
+        self.assertEqual(Book.objects.get(pk=pk).user, self.user)
+
+        response = self.send('patch', 'api_book_detail', {'published_date': '2024-05-01'}, kwargs={'pk': pk})
+        self.assertEqual(response.json()['title'], '新しい本')
+        self.assertEqual(response.json()['published_date'], '2024-05-01')
+
+        response = self.send('put', 'api_book_detail', {'title': '題名のみ'}, kwargs={'pk': pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('author', response.json()['errors'])
+
+        response = self.send('delete', 'api_book_detail', kwargs={'pk': pk})
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Book.objects.filter(pk=pk).exists())
+
+    def test_other_users_objects(self):
+        """他ユーザーの書籍・メモを操作できないテスト"""
+        response = self.send('get', 'api_book_detail', kwargs={'pk': self.other_book.pk})
+        self.assertEqual(response.status_code, 404)
+        response = self.send('post', 'api_memo_list', {'book': self.other_book.pk, 'content': '侵入'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Memo.objects.filter(content='侵入').exists())
+
+    def test_bulk_create_books(self):
+        """書籍の一括作成が1トランザクションで書き込まれるテスト"""
+        items = [{'title': f'一括{i}', 'author': '一括著者'} for i in range(300)]
+        response = self.send('post', 'api_book_bulk', items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['results']), 300)
+        self.assertEqual(Book.objects.filter(user=self.user, author='一括著者').count(), 300)
+        # 一括作成した書籍も検索インデックスに登録される
+        self.assertEqual(len(search_books(Book.objects.filter(user=self.user), '一括299')), 1)
+
+    def test_bulk_create_rejects_all_on_error(self):
+        """1件でも誤りがあれば何も書き込まないテスト"""
+        items = [{'title': '正しい本', 'author': '著者'}, {'title': '著者なし'}]
+        response = self.send('post', 'api_book_bulk', items)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.json()['errors'])
+        self.assertFalse(Book.objects.filter(title='正しい本').exists())
+
+    def test_bulk_limit(self):
+        """一括処理の件数上限のテスト"""
+        with self.settings(BOOKLOG_API_BULK_LIMIT=2):
+            response = self.send('post', 'api_book_bulk', [{'title': 't', 'author': 'a'}] * 3)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_update_and_delete(self):
+        """書籍の一括更新・一括削除のテスト"""
+        before = self.book.updated_at
+        response = self.send('patch', 'api_book_bulk', [{'id': self.book.pk, 'title': '一括更新'}])
+        self.assertEqual(response.status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, '一括更新')
+        self.assertEqual(self.book.author, 'API著者')
+        self.assertGreater(self.book.updated_at, before)
+
+        response = self.send('patch', 'api_book_bulk', [{'id': self.other_book.pk, 'title': '乗っ取り'}])
+        self.assertEqual(response.status_code, 400)
+
+        response = self.send('delete', 'api_book_bulk', [self.book.pk, self.other_book.pk])
+        self.assertEqual(response.json(), {'deleted': 1})
+        self.assertTrue(Book.objects.filter(pk=self.other_book.pk).exists())
+
+    def test_bulk_create_without_returning_pks(self):
+        """bulk_create が pk を返さない DB（MySQL）でも作成した id を返すテスト"""
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False):
+            response = self.send('post', 'api_book_bulk', [{'title': '同じ本', 'author': '著者'}] * 2)
+            book_ids = [item['id'] for item in response.json()['results']]
+            response = self.send('post', 'api_memo_bulk', [{'book': book_ids[0], 'content': 'MySQLのメモ'}])
+            memo_id = response.json()['results'][0]['id']
+        self.assertEqual(Book.objects.filter(pk__in=book_ids, title='同じ本').count(), 2)
+        self.assertEqual(Memo.objects.get(pk=memo_id).book_id, book_ids[0])
+        # 変更フィード・検索インデックスにも実際の id で登録される
+        self.assertTrue(LibraryChange.objects.filter(kind=sync.MEMO, object_id=memo_id).exists())
+        self.assertEqual(search_books(Book.objects.filter(user=self.user), 'MySQLのメモ').get().pk, book_ids[0])
+
+    def test_bulk_memos(self):
+        """メモの一括作成と書籍での絞り込みのテスト"""
+        items = [{'book': self.book.pk, 'content': f'一括メモ{i}'} for i in range(5)]
+        response = self.send('post', 'api_memo_bulk', items)
+        self.assertEqual(response.status_code, 201)
+        response = self.send('get', 'api_memo_list', book=self.book.pk, fields='content')
+        self.assertEqual(len(response.json()['results']), 6)
+        self.assertEqual(search_books(Book.objects.filter(user=self.user), '一括メモ').get(), self.book)
+
+
+class ExportTest(TestCase):
+    """蔵書のエクスポートのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='exportuser',
+            password='testpass123'
+        )
+        other_user = User.objects.create_user(
+            username='exportother',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(
+            title='エクスポート書籍', author='著者, 名前', published_date=date(2024, 1, 2), user=self.user
+        )
+        Memo.objects.create(book=self.book, content='一つ目のメモ')
+        Memo.objects.create(book=self.book, content='二つ目\nのメモ')
+        self.empty_book = Book.objects.create(title='メモなし', author='著者', user=self.user)
+        Book.objects.create(title='他人の書籍', author='著者', user=other_user)
+        self.client.login(username='exportuser', password='testpass123')
+
+    def export(self, **params):
+        response = self.client.get(reverse('booklog:export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content), response
+
+    def test_csv_nested(self):
+        """CSV でメモを1列にまとめて出力するテスト"""
+        body, response = self.export(format='csv')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment; filename="booklog-'))
+        rows = list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+        self.assertEqual([row['title'] for row in rows], ['エクスポート書籍', 'メモなし'])
+        self.assertEqual(rows[0]['author'], '著者, 名前')
+        self.assertEqual(rows[0]['published_date'], '2024-01-02')
+        memos = json.loads(rows[0]['memos'])
+        self.assertEqual([memo['memo_content'] for memo in memos], ['一つ目のメモ', '二つ目\nのメモ'])
+        self.assertEqual(json.loads(rows[1]['memos']), [])
+
+    def test_ndjson_flat(self):
+        """NDJSON でメモごとに1行出力するテスト"""
+        body, response = self.export(format='ndjson', memos='flat')
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual({record['id'] for record in records}, {self.book.pk, self.empty_book.pk})
+        self.assertIsNone(records[-1]['memo_id'])
+
+    def test_gzip(self):
+        """gzip で圧縮して出力するテスト"""
+        body, response = self.export(format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_invalid_format(self):
+        """不正な形式の指定は 400 を返すテスト"""
+        response = self.client.get(reverse('booklog:export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        """export_library コマンドのテスト"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+            call_command(
+                'export_library', 'exportuser', '--memos', 'flat', '--chunk-size', '1',
+                '-o', path, stderr=io.StringIO(),
+            )
+            with open(path, encoding='utf-8-sig') as exported:
+                rows = list(csv.DictReader(exported))
+        self.assertEqual(len(rows), 3)
+
+
+class ImportTest(TestCase):
+    """書籍の一括インポートのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='importuser',
+            password='testpass123'
+        )
+        Book.objects.create(title='既存の本', author='著者', user=self.user)
+        self.client.login(username='importuser', password='testpass123')
+
+    def run_import(self, text, format='csv', **kwargs):
+        return importers.import_books(self.user, io.StringIO(text), format, **kwargs)
+
+    def test_csv(self):
+        """CSV の検証・重複除外・登録のテスト"""
+        text = (
+            'title,author,published_date,memos\n'
+            '新しい本,著者,2024-05-01,"[""メモ1"", ""メモ2""]"\n'
+            '既存の本,著者,,\n'
+            ',著者なしタイトル,,\n'
+            '日付が不正,著者,2024-13-40,\n'
+            '新しい本,著者,,\n'
+        )
+        result = self.run_import(text)
+        self.assertEqual(result.processed, 5)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.memos, 2)
+        self.assertEqual(result.duplicates, 2)
+        self.assertEqual([line for line, _ in result.errors], [4, 5])
+        self.assertIn('title', result.errors[0][1])
+        self.assertIn('published_date', result.errors[1][1])
+
+        book = Book.objects.get(title='新しい本')
+        self.assertEqual(book.published_date, date(2024, 5, 1))
+        self.assertEqual(book.memos.count(), 2)
+        self.assertEqual(search_books(Book.objects.filter(user=self.user), 'メモ2').get(), book)
+
+    def test_flat_export_roundtrip(self):
+        """memos=flat のエクスポートを小さいバッチで読み込んでもメモがまとまるテスト"""
+        book = Book.objects.get(title='既存の本')
+        for i in range(3):
+            Memo.objects.create(book=book, content=f'メモ{i}')
+        exported = b''.join(export.export_library(self.user, 'csv', 'flat')).decode('utf-8-sig')
+
+        other = User.objects.create_user(username='importother', password='testpass123')
+        result = importers.import_books(other, io.StringIO(exported), 'csv', batch_size=2)
+        self.assertEqual((result.created, result.memos, result.error_count), (1, 3, 0))
+        self.assertEqual(Memo.objects.filter(book__user=other).count(), 3)
+
+    def test_memos_without_returning_pks(self):
+        """bulk_create が pk を返さない DB（MySQL）でも、前のバッチの書籍に追加したメモを変更フィードに載せるテスト"""
+        text = 'title,author,memos\n本A,著者,"[""一つ目""]"\n本B,著者,\n本A,著者,"[""二つ目""]"\n'
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False):
+            result = self.run_import(text, batch_size=2)
+        self.assertEqual((result.created, result.memos), (2, 2))
+        memo = Memo.objects.get(content='二つ目')
+        self.assertTrue(LibraryChange.objects.filter(kind=sync.MEMO, object_id=memo.pk).exists())
+        self.assertEqual(LibraryStats.objects.get(user=self.user).memo_count, 2)
+
+    def test_goodreads(self):
+        """Goodreads の CSV を変換して登録するテスト"""
+        text = (
+            'Book Id,Title,Author,My Rating,Year Published,Original Publication Year,My Review,Exclusive Shelf\n'
+            '1,Dune,Frank Herbert,5,2005,1965,Great,read\n'
+            '2,Emma,Jane Austen,4,,,,to-read\n'
+        )
+        result = self.run_import(text)
+        self.assertEqual(result.created, 2)
+        dune = Book.objects.get(title='Dune')
+        self.assertEqual(dune.published_date, date(1965, 1, 1))
+        self.assertEqual(dune.memos.get().content, 'Great')
+
+    def test_ndjson(self):
+        """NDJSON の読み込みと壊れた行のエラーのテスト"""
+        text = (
+            '{"title": "JSONの本", "author": "著者", "memos": [{"memo_content": "メモ"}]}\n'
+            '\n'
+            '{壊れた行\n'
+            '["配列"]\n'
+        )
+        result = self.run_import(text, 'ndjson')
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+
+    def test_progress_and_error_limit(self):
+        """バッチごとの進捗通知とエラー詳細の件数上限のテスト"""
+        rows = ''.join(f'本{i},著者,\n' for i in range(5)) + ',,\n' * 3
+        reports = []
+        result = self.run_import(
+            'title,author,published_date\n' + rows, batch_size=2, max_errors=1,
+            progress=lambda result: reports.append(result.created),
+        )
+        self.assertEqual(reports, [2, 4, 5])
+        self.assertEqual(result.error_count, 3)
+        self.assertEqual(len(result.errors), 1)
+
+    def test_upload(self):
+        """アップロードフォームからのインポートのテスト（gzip 圧縮も可）"""
+        body = gzip.compress('{"title": "アップロード", "author": "著者"}\n'.encode())
+        upload = SimpleUploadedFile('books.ndjson.gz', body)
+        response = self.client.post(reverse('booklog:book_import'), {'file': upload, 'format': 'auto'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '書籍 1 件・メモ 0 件を登録')
+        self.assertTrue(Book.objects.filter(title='アップロード', user=self.user).exists())
+
+    def test_upload_invalid_encoding(self):
+        """UTF-8 でないファイルはフォームのエラーにするテスト"""
+        upload = SimpleUploadedFile('books.csv', 'title,author\n本,著者\n'.encode('shift_jis'))
+        response = self.client.post(reverse('booklog:book_import'), {'file': upload, 'format': 'csv'})
+        self.assertContains(response, 'UTF-8 のファイルを指定してください')
+
+    def test_command(self):
+        """import_books コマンドのテスト"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.csv')
+            with open(path, 'w', encoding='utf-8') as source:
+                source.write('title,author\nコマンドの本,著者\n')
+            stdout = io.StringIO()
+            call_command('import_books', 'importuser', path, stdout=stdout, stderr=io.StringIO())
+        self.assertIn('書籍 1 件', stdout.getvalue())
+        self.assertTrue(Book.objects.filter(title='コマンドの本').exists())
+
+
+class JobTest(TestCase):
+    """バックグラウンドジョブのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='jobuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='ジョブの本', author='著者', user=self.user)
+        Memo.objects.create(book=self.book, content='ジョブのメモ')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storage_settings = self.settings(BOOKLOG_JOB_STORAGE_DIR=directory.name)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.client.login(username='jobuser', password='testpass123')
+
+    def register(self, kind, func, max_attempts=3):
+        jobs.task(kind, kind, max_attempts)(func)
+        self.addCleanup(jobs.TASKS.pop, kind)
+
+    def work(self):
+        return jobs.Worker('test', burst=True).run()
+
+    def test_run_job(self):
+        """ジョブを取り出して実行し、結果を保存するテスト"""
+        job = jobs.enqueue('reindex', self.user)
+        self.assertEqual(self.work(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.result, {'indexed': 1})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claim_skips_future_and_running_jobs(self):
+        """実行予定時刻前のジョブと実行中のジョブは取り出さないテスト"""
+        jobs.enqueue('reindex', self.user, run_at=timezone.now() + timezone.timedelta(hours=1))
+        running = jobs.enqueue('reindex', self.user)
+        self.assertEqual(jobs.claim('a').pk, running.pk)
+        self.assertIsNone(jobs.claim('b'))
+
+    def test_retry_with_backoff(self):
+        """失敗したジョブを待ち時間を倍にしながら再実行し、上限で失敗にするテスト"""
+        self.register('flaky', lambda job: 1 / 0, max_attempts=2)
+        job = jobs.enqueue('flaky')
+        with self.settings(BOOKLOG_JOB_RETRY_DELAY=10), self.assertLogs('booklog.jobs', 'WARNING'):
+            jobs.run_job(jobs.claim('test'))
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.QUEUED)
+            self.assertGreater(job.run_at, timezone.now() + timezone.timedelta(seconds=5))
+            self.assertIn('ZeroDivisionError', job.error)
+            self.assertEqual(jobs.backoff(3), timezone.timedelta(seconds=40))
+
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            jobs.run_job(jobs.claim('test'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_permanent_error(self):
+        """PermanentJobError は再実行しないテスト"""
+        def broken(job):
+            raise jobs.PermanentJobError('壊れています')
+        self.register('broken', broken)
+        job = jobs.enqueue('broken')
+        with self.assertLogs('booklog.jobs', 'WARNING'):
+            self.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.FAILED, '壊れています'))
+
+    def test_requeue_stale(self):
+        """止まったワーカーのジョブを待機中に戻すテスト"""
+        job = jobs.enqueue('reindex', self.user)
+        jobs.claim('dead')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(hours=2))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_progress_is_heartbeat(self):
+        """進捗を報告している実行中のジョブは戻さず、ワーカーのループが止まったジョブを戻すテスト"""
+        running = jobs.enqueue('reindex', self.user)
+        stale = jobs.enqueue('reindex', self.user)
+        jobs.claim('alive')
+        jobs.claim('dead')
+        old = timezone.now() - timezone.timedelta(hours=2)
+        Job.objects.filter(pk__in=[running.pk, stale.pk]).update(locked_at=old)
+        jobs.report_progress(Job.objects.get(pk=running.pk), indexed=1)
+
+        with self.assertLogs('booklog.jobs', 'WARNING'):
+            jobs.Worker('test', kinds=['none'], burst=True).run()
+        self.assertEqual(Job.objects.get(pk=running.pk).status, Job.RUNNING)
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, Job.QUEUED)
+
+    def test_worker_names(self):
+        """ワーカーの名前がホスト・プロセスごとに違うテスト"""
+        self.assertEqual(jobs.worker_name(2), f'{socket.gethostname()}:{os.getpid()}:2')
+
+    def test_background_export(self):
+        """エクスポートをジョブで作成してダウンロードするテスト"""
+        # GET ではジョブを登録しない（リンクの先読みやクロスサイトの <img> で登録されないように）
+        self.client.get(reverse('booklog:export'), {'format': 'ndjson', 'background': '1'})
+        self.assertFalse(Job.objects.filter(user=self.user).exists())
+        self.assertContains(self.client.get(reverse('booklog:book_list')), 'form="background-export"')
+
+        csrf_client = Client(enforce_csrf_checks=True)
+        csrf_client.force_login(self.user)
+        self.assertEqual(csrf_client.post(reverse('booklog:export'), {'format': 'ndjson'}).status_code, 403)
+
+        response = self.client.post(reverse('booklog:export'), {'format': 'ndjson'})
+        job = Job.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('booklog:job_detail', kwargs={'pk': job.pk}))
+        self.work()
+        response = self.client.get(reverse('booklog:job_detail', kwargs={'pk': job.pk}))
+        self.assertContains(response, 'をダウンロード')
+        response = self.client.get(reverse('booklog:job_download', kwargs={'pk': job.pk}))
+        record = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(record['memos'][0]['memo_content'], 'ジョブのメモ')
+
+    def test_large_import_runs_in_background(self):
+        """大きいファイルのインポートはジョブで行うテスト"""
+        upload = SimpleUploadedFile('books.csv', 'title,author\n大きな本,著者\n'.encode())
+        with self.settings(BOOKLOG_IMPORT_INLINE_MAX_BYTES=10):
+            response = self.client.post(reverse('booklog:book_import'), {'file': upload, 'format': 'auto'})
+        job = Job.objects.get(user=self.user, kind='import_books')
+        self.assertRedirects(response, reverse('booklog:job_detail', kwargs={'pk': job.pk}))
+        self.assertFalse(Book.objects.filter(title='大きな本').exists())
+        self.work()
+        job.refresh_from_db()
+        self.assertEqual(job.result['created'], 1)
+        self.assertTrue(Book.objects.filter(title='大きな本', user=self.user).exists())
+        self.assertFalse(jobs.job_storage().exists(job.payload['path']))
+
+    def test_delete_account(self):
+        """アカウント削除で無効化・ログアウトし、ジョブで書籍ごと削除するテスト"""
+        response = self.client.post(reverse('booklog:account_delete'))
+        self.assertRedirects(response, reverse('login'))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(self.client.login(username='jobuser', password='testpass123'))
+
+        with self.settings(BOOKLOG_BULK_BATCH_SIZE=1):
+            Book.objects.create(title='二冊目', author='著者', user=self.user)
+            self.work()
+        job = Job.objects.get(kind='delete_account')
+        self.assertEqual((job.status, job.result, job.user_id), (Job.SUCCEEDED, {'deleted': 2}, None))
+        self.assertFalse(User.objects.filter(username='jobuser').exists())
+        self.assertFalse(Memo.objects.exists())
+
+    def test_job_pages_are_per_user(self):
+        """ジョブの状態ページは本人のものだけ見られるテスト"""
+        job = jobs.enqueue('reindex', self.user)
+        response = self.client.get(reverse('booklog:job_list'))
+        self.assertContains(response, '検索インデックスの再作成')
+        User.objects.create_user(username='jobother', password='testpass123')
+        self.client.login(username='jobother', password='testpass123')
+        response = self.client.get(reverse('booklog:job_detail', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+
+class RunWorkersCommandTest(TransactionTestCase):
+    """run_workers コマンドのテスト（ワーカーのスレッドから見えるようコミットする）
+
+    テスト用のインメモリ SQLite はスレッド間でテーブルロックが競合するのでワーカーは1つにする。
+    """
+
+    def test_burst(self):
+        """--burst で待機中のジョブを実行して終了するテスト"""
+        user = User.objects.create_user(username='workeruser', password='testpass123')
+        Book.objects.create(title='ワーカーの本', author='著者', user=user)
+        for _ in range(3):
+            jobs.enqueue('reindex', user)
+        call_command('run_workers', '--workers', '1', '--burst', stdout=io.StringIO())
+        self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 3)
+
+
+class QueryPlanTest(TestCase):
+    """よく実行されるクエリが複合インデックスを使うテスト（EXPLAIN で確認する）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        """大きな蔵書を持つユーザーを複数作り、統計情報を更新する"""
+        users = [
+            User.objects.create_user(username=f'planuser{i}', password='testpass123')
+            for i in range(3)
+        ]
+        for user in users:
+            seed_library(user, 1500, memos_per_book=2)
+        cls.user = users[1]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_hot_queries_use_indexes(self):
+        """一覧・メモ・重複チェックのクエリがインデックスを使い、並べ替えをしないテスト"""
+        for name, index, plan, problems in queryplans.check_plans(self.user):
+            with self.subTest(name=name):
+                if problems is None:
+                    self.skipTest(f'{connection.vendor} のプランは判定できません')
+                self.assertEqual(problems, [], plan)
+
+    def test_search_reads_owner_tokens(self):
+        """検索が検索トークンを所有者と語の複合インデックス（booklog_searchtoken_lookup）で読むテスト"""
+        if connection.vendor != 'sqlite':
+            self.skipTest(f'{connection.vendor} のプランは判定できません')
+        view = queryplans._list_view(self.user, query='書籍1')
+        plan = queryplans.explain(view.get_queryset())
+        self.assertRegex(plan, r'search_?token.*USING (COVERING )?INDEX booklog_searchtoken_lookup \(user_id=\? AND token=\?\)')
+
+    def test_updated_order_pages(self):
+        """更新順のページ送りで全件を重複・抜けなく取得できるテスト"""
+        seen = []
+        paginator = KeysetPaginator(Book.objects.filter(user=self.user), 500, ('-updated_at', '-id'))
+        page = paginator.page()
+        while True:
+            seen.extend(book.pk for book in page)
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+        expected = list(Book.objects.filter(user=self.user).order_by('-updated_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_command(self):
+        """check_query_plans コマンドのテスト"""
+        stdout = io.StringIO()
+        call_command('check_query_plans', 'planuser1', stdout=stdout)
+        self.assertIn('book_list_updated_next_page', stdout.getvalue())
+
+
+def reload_urls():
+    """BOOKLOG_ASYNC_VIEWS を切り替えた後に URL 設定を読み直す"""
+    importlib.reload(booklog_urls)
+    importlib.reload(config.urls)
+    clear_url_caches()
+
+
+class AsyncViewTest(QueryBudgetMixin, TestCase):
+    """一覧・詳細の非同期版ビュー（BOOKLOG_ASYNC_VIEWS）のテスト"""
+
+    def setUp(self):
+        """非同期版のビューに切り替え、テスト用データを準備する"""
+        self.addCleanup(reload_urls)
+        self.enterContext(override_settings(BOOKLOG_ASYNC_VIEWS=True))
+        reload_urls()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='asyncuser',
+            password='testpass123'
+        )
+        for i in range(7):
+            self.book = Book.objects.create(title=f'非同期書籍{i}', author='著者', user=self.user)
+        Memo.objects.create(book=self.book, content='非同期のメモ')
+        Book.objects.create(
+            title='他人の書籍', author='著者',
+            user=User.objects.create_user(username='asyncother', password='testpass123')
+        )
+        self.client.login(username='asyncuser', password='testpass123')
+
+    def test_urls_use_async_views(self):
+        """一覧・詳細の URL が非同期版のビューになるテスト"""
+        for url in [reverse('booklog:book_list'), reverse('booklog:book_detail', kwargs={'pk': self.book.pk})]:
+            with self.subTest(url=url):
+                view_class = resolve(url).func.view_class
+                self.assertIs(view_class, getattr(async_views, view_class.__name__))
+                self.assertTrue(view_class.view_is_async)
+
+    async def test_book_list_cursor(self):
+        """キーセット方式で一覧の次ページをたどれるテスト"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('booklog:book_list'))
+        self.assertContains(response, '非同期書籍6')
+        self.assertNotContains(response, '他人の書籍')
+        next_cursor = response.context['page_obj'].next_cursor
+        response = await self.async_client.get(reverse('booklog:book_list'), {'after': next_cursor})
+        self.assertContains(response, '非同期書籍0')
+        self.assertNotContains(response, '非同期書籍6')
+
+        response = await self.async_client.get(reverse('booklog:book_list'), {'after': '不正'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_book_list_search_and_page_number(self):
+        """検索とページ番号方式で件数を数えて表示するテスト"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('booklog:book_list'), {'query': '非同期', 'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertContains(response, '(全 7 件)')
+        response = await self.async_client.get(reverse('booklog:book_list'), {'page': 'last'})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        response = await self.async_client.get(reverse('booklog:book_list'), {'page': 9})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_book_detail(self):
+        """詳細にメモを表示し、他ユーザーの書籍は 404 にするテスト"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('booklog:book_detail', kwargs={'pk': self.book.pk}))
+        self.assertContains(response, '非同期のメモ')
+        self.assertContains(response, '<title>非同期書籍6 - 書籍詳細</title>')
+        other = await Book.objects.aget(title='他人の書籍')
+        response = await self.async_client.get(reverse('booklog:book_detail', kwargs={'pk': other.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified(self):
+        """同期版と同じ ETag で 304 を返すテスト"""
+        url = reverse('booklog:book_detail', kwargs={'pk': self.book.pk})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_shares_cache_with_sync_views(self):
+        """同期版で描画した断片をキャッシュから返すテスト"""
+        with override_settings(BOOKLOG_ASYNC_VIEWS=False):
+            reload_urls()
+            self.client.get(reverse('booklog:book_list'))
+        reload_urls()
+        with self.assertNumQueries(1):  # 最終変更日時のみ（セッションとユーザーはキャッシュから読む）
+            response = self.client.get(reverse('booklog:book_list'))
+        self.assertContains(response, '非同期書籍6')
+
+    def test_same_context_as_sync_views(self):
+        """同期版と同じ検索・並び順・ページ送り・件数・ファセットになるテスト（BookListMixin を共有する）"""
+        def summary(context):
+            return (
+                [book.pk for book in context['books']], getattr(context['page_obj'], 'number', None),
+                str(context['result_count']), context['facets'], context['filter_query'],
+                context['query'], context['sort'], context['cursor_mode'],
+            )
+
+        cases = [{}, {'sort': 'updated', 'page': 2}, {'query': '非同期', 'page': 'last'}, {'query': '非同期', 'author': '著者'}]
+        for params in cases:
+            with self.subTest(params=params):
+                cache.clear()
+                with override_settings(BOOKLOG_ASYNC_VIEWS=False):
+                    reload_urls()
+                    expected = summary(self.client.get(reverse('booklog:book_list'), params).context)
+                reload_urls()
+                cache.clear()
+                self.assertEqual(summary(self.client.get(reverse('booklog:book_list'), params).context), expected)
+
+    def test_query_budget(self):
+        """非同期版もクエリ数の上限内に収まるテスト"""
+        self.assertWithinQueryBudget(reverse('booklog:book_list'))
+        self.assertWithinQueryBudget(reverse('booklog:book_list'), {'query': '非同期', 'page': 2})
+        self.assertWithinQueryBudget(reverse('booklog:book_detail', kwargs={'pk': self.book.pk}))
+
+    def test_login_required(self):
+        """未ログインならログインページへリダイレクトするテスト"""
+        self.client.logout()
+        response = self.client.get(reverse('booklog:book_list'))
+        self.assertRedirects(response, f"{reverse('login')}?next=/", fetch_redirect_response=False)
+
+
+class BenchmarkTest(TestCase):
+    """benchmarks（性能測定）のテスト"""
+
+    def test_micro_covers_all_views(self):
+        """booklog の全ビューにマイクロベンチマークがあるテスト"""
+        user = User.objects.create_user(username='benchuser', password='testpass123')
+        seed_library(user, 12, memos_per_book=1)
+        names = {case[1] for case in benchmark_micro.cases(user)} | set(benchmark_micro.SKIPPED)
+        for pattern in booklog_urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertIn(pattern.name, names)
+
+    def test_micro_run(self):
+        """各ビューの時間とクエリ数を測れるテスト"""
+        user = User.objects.create_user(username='benchuser', password='testpass123')
+        seed_library(user, 12, memos_per_book=1)
+        results = benchmark_micro.run(user, repeat=1)
+        self.assertGreater(results['book_list']['queries'], 0)
+        self.assertIn('median_ms', results['api_memo_bulk'])
+
+    def test_compare(self):
+        """ベースラインより遅くなった・クエリが増えた場合に劣化とするテスト"""
+        params = {'books': 10}
+        baseline = {
+            'params': params,
+            'micro': {'book_list': {'median_ms': 10.0, 'queries': 4}},
+            'load': {'list': {'p95_ms': 100.0, 'p99_ms': 120.0, 'rps': 50.0, 'errors': 0}},
+        }
+        same = {**baseline, 'micro': {'book_list': {'median_ms': 12.0, 'queries': 4}}}
+        self.assertEqual(benchmark_compare.compare(same, baseline), [])
+
+        slower = {
+            'params': params,
+            'micro': {'book_list': {'median_ms': 30.0, 'queries': 5}},
+            'load': {'list': {'p95_ms': 100.0, 'p99_ms': 120.0, 'rps': 20.0, 'errors': 0}},
+        }
+        problems = benchmark_compare.compare(slower, baseline)
+        self.assertEqual(len(problems), 3)
+        self.assertIn('micro.book_list.queries: 4 -> 5', problems)
+
+        # 条件が違う結果とは比べない
+        self.assertEqual(len(benchmark_compare.compare({**same, 'params': {'books': 20}}, baseline)), 1)
+
+
+@override_settings(
+    BOOKLOG_INSTRUMENTATION=True,
+    MIDDLEWARE=['booklog.instrumentation.InstrumentationMiddleware', *settings.MIDDLEWARE],
+)
+class InstrumentationTest(TestCase):
+    """リクエストごとの計測（InstrumentationMiddleware）のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='metricsuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='計測書籍', author='著者', user=self.user)
+        self.client.login(username='metricsuser', password='testpass123')
+        self.profile_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+    def get_logged(self, url, client=None):
+        with self.assertLogs('booklog.instrumentation', 'INFO') as logs:
+            response = (client or self.client).get(url)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_server_timing_and_log(self):
+        """クエリ数・描画時間・キャッシュを Server-Timing とログに出すテスト"""
+        url = reverse('booklog:book_list')
+        with self.assertNumQueries(3):
+            response, record = self.get_logged(url)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertEqual(record['view'], 'booklog:book_list')
+        self.assertEqual(record['db_queries'], 3)
+        self.assertEqual(record['user_id'], self.user.pk)
+        self.assertEqual((record['cache_hits'], record['cache_misses']), (0, 1))
+        self.assertGreater(record['render_ms'], 0)
+        self.assertIsNone(record['profile'])
+
+        # 2回目は断片キャッシュから返す
+        response, record = self.get_logged(url)
+        self.assertEqual((record['cache_hits'], record['cache_misses']), (1, 0))
+        self.assertIn('cache;desc="hit=1 miss=0"', response['Server-Timing'])
+
+    async def test_async_requests(self):
+        """ASGI（非同期のミドルウェアの経路）でも計測するテスト"""
+        await self.async_client.aforce_login(self.user)
+        url = reverse('booklog:book_detail', kwargs={'pk': self.book.pk})
+        with self.assertLogs('booklog.instrumentation', 'INFO') as logs:
+            response = await self.async_client.get(url)
+        self.assertContains(response, '計測書籍')
+        self.assertIn('Server-Timing', response.headers)
+        self.assertGreater(json.loads(logs.records[-1].getMessage())['db_queries'], 0)
+
+    def test_sampled_profile(self):
+        """N 件に1件 cProfile の結果を保存するテスト"""
+        url = reverse('booklog:book_list')
+        with self.settings(BOOKLOG_PROFILE_SAMPLE_RATE=2, BOOKLOG_PROFILE_DIR=self.profile_dir):
+            records = [self.get_logged(url)[1] for _ in range(4)]
+        profiles = [record['profile'] for record in records if record['profile']]
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(len(os.listdir(self.profile_dir)), 2)
+        pstats.Stats(profiles[0])  # pstats で読み込める
+
+    def test_slow_request_profile(self):
+        """しきい値より遅いリクエストだけ保存するテスト"""
+        url = reverse('booklog:book_list')
+        with self.settings(BOOKLOG_PROFILE_SLOW_MS=60_000, BOOKLOG_PROFILE_DIR=self.profile_dir):
+            self.assertIsNone(self.get_logged(url)[1]['profile'])
+        with self.settings(BOOKLOG_PROFILE_SLOW_MS=1, BOOKLOG_PROFILE_DIR=self.profile_dir):
+            self.assertIsNotNone(self.get_logged(f'{url}?page=1')[1]['profile'])
+        self.assertEqual(len(os.listdir(self.profile_dir)), 1)
+
+
+@override_settings(
+    BOOKLOG_METRICS=True,
+    BOOKLOG_METRICS_TOKEN='',
+    MIDDLEWARE=['booklog.instrumentation.InstrumentationMiddleware', *settings.MIDDLEWARE],
+)
+class MetricsTest(TestCase):
+    """Prometheus のメトリクス（/metrics）のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='promuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='メトリクス書籍', author='著者', user=self.user)
+        self.client.login(username='promuser', password='testpass123')
+
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        """ビューごとの処理時間・クエリ数・キャッシュの参照を記録するテスト"""
+        view = 'booklog:book_list'
+        requests = self.sample('booklog_request_duration_seconds_count', view=view, method='GET')
+        queries = self.sample('booklog_request_db_queries_sum', view=view)
+        hits = self.sample('booklog_fragment_cache_lookups_total', result='hit')
+        misses = self.sample('booklog_fragment_cache_lookups_total', result='miss')
+
+        self.client.get(reverse('booklog:book_list'))
+        self.client.get(reverse('booklog:book_list'))
+
+        self.assertEqual(self.sample('booklog_request_duration_seconds_count', view=view, method='GET'), requests + 2)
+        self.assertEqual(self.sample('booklog_requests_total', view=view, method='GET', status='200') > 0, True)
+        # 1回目はユーザー・最終変更日時・書籍の 3 クエリ、2回目はキャッシュから返すので 1 クエリ
+        self.assertEqual(self.sample('booklog_request_db_queries_sum', view=view), queries + 4)
+        self.assertEqual(self.sample('booklog_fragment_cache_lookups_total', result='hit'), hits + 1)
+        self.assertEqual(self.sample('booklog_fragment_cache_lookups_total', result='miss'), misses + 1)
+
+    def test_metrics_endpoint(self):
+        """/metrics が Prometheus のテキスト形式で返すテスト"""
+        self.client.get(reverse('booklog:book_detail', kwargs={'pk': self.book.pk}))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('booklog_request_duration_seconds_bucket{le="0.005",method="GET",view="booklog:book_detail"}', body)
+        self.assertIn('booklog_process_resident_memory_bytes', body)
+        self.assertIn('booklog_db_connection_reuse_total', body)
+
+    def test_token_and_disabled(self):
+        """トークンの確認と、無効なときは 404 になるテスト"""
+        with self.settings(BOOKLOG_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', headers={'authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+        with self.settings(BOOKLOG_METRICS=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_multiprocess_aggregation(self):
+        """PROMETHEUS_MULTIPROC_DIR で複数プロセスの値を合計するテスト"""
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        env = {
+            **os.environ,
+            'PROMETHEUS_MULTIPROC_DIR': directory,
+            'DJANGO_SETTINGS_MODULE': 'config.settings',
+            'DATABASE_URL': 'sqlite://:memory:',
+        }
+        setup = 'import django; django.setup(); from booklog import metrics; '
+        for _ in range(2):
+            subprocess.run(
+                [sys.executable, '-c', setup + "metrics.REQUESTS.labels('booklog:book_list', 'GET', '200').inc()"],
+                env=env, check=True,
+            )
+        output = subprocess.run(
+            [sys.executable, '-c', setup + 'print(metrics.render_latest()[0].decode())'],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        self.assertIn('booklog_requests_total{method="GET",status="200",view="booklog:book_list"} 2.0', output)
+
+
+class CountingTest(TestCase):
+    """検索結果の件数とファセットのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='countuser',
+            password='testpass123'
+        )
+        for i in range(7):
+            Book.objects.create(
+                title=f'件数書籍{i}', author='著者A' if i < 4 else '著者B',
+                published_date=date(2020 + i % 2, 1, 1), user=self.user,
+            )
+        Book.objects.create(title='件数書籍（出版日なし）', author='著者C', user=self.user)
+        self.client.login(username='countuser', password='testpass123')
+
+    def search(self):
+        return search_books(Book.objects.filter(user=self.user), '件数')
+
+    def test_count_results(self):
+        """上限までは正確に、超えたら「上限+」で返すテスト"""
+        with self.assertNumQueries(1):
+            self.assertEqual(str(counting.count_results(self.search())), '8')
+        result = counting.count_results(self.search(), cap=5)
+        self.assertEqual((result.value, result.exact, str(result)), (5, False, '5+'))
+        estimated = counting.ResultCount(12000, exact=False, estimated=True)
+        self.assertEqual(str(estimated), '約 12,000')
+
+    def test_search_shows_total_count(self):
+        """検索結果の件数がページの件数ではなく全体の件数になるテスト"""
+        response = self.client.get(reverse('booklog:book_list'), {'query': '件数'})
+        self.assertContains(response, 'の検索結果: 8 件')
+        self.assertContains(response, '(全 8 件)')
+
+        cache.clear()
+        with self.settings(BOOKLOG_COUNT_CAP=5):
+            response = self.client.get(reverse('booklog:book_list'), {'query': '件数'})
+            self.assertContains(response, 'の検索結果: 5+ 件')
+            self.assertEqual(response.context['paginator'].num_pages, 1)
+            self.assertTrue(response.context['page_obj'].has_next())
+            self.assertContains(response, '1 ページ')
+
+            # 上限より先のページも 404 にせず、1件多く読んで次のページの有無を決める
+            response = self.client.get(reverse('booklog:book_list'), {'query': '件数', 'page': 2})
+            self.assertEqual(len(response.context['books']), 3)
+            self.assertFalse(response.context['page_obj'].has_next())
+            self.assertEqual(response.context['page_obj'].end_index(), 8)
+            self.assertContains(response, '?page=1&sort=')
+            response = self.client.get(reverse('booklog:book_list'), {'query': '件数', 'page': 3})
+            self.assertEqual(response.status_code, 404)
+
+    def test_facet_counts(self):
+        """著者別・出版年別の件数を1回のクエリで求めてキャッシュするテスト"""
+        def version():
+            # 一覧のビューと同じく蔵書の変更の通番をキャッシュの版にする
+            return library_state(self.user.pk)[1]
+
+        seq = version()
+        with self.assertNumQueries(1):
+            facets = counting.facet_counts(self.user.pk, seq, self.search(), '件数')
+        self.assertEqual(facets['authors'], [('著者A', 4), ('著者B', 3), ('著者C', 1)])
+        self.assertEqual(facets['years'], [(2020, 4), (2021, 3)])
+        with self.assertNumQueries(0):
+            counting.facet_counts(self.user.pk, seq, self.search(), '件数')
+
+        # 書籍が変更されたら数え直す
+        Book.objects.create(title='件数書籍8', author='著者C', user=self.user)
+        facets = counting.facet_counts(self.user.pk, version(), self.search(), '件数')
+        self.assertIn(('著者C', 2), facets['authors'])
+
+    def test_facet_filter(self):
+        """ファセットで絞り込んでも件数の一覧は検索結果全体のままになるテスト"""
+        response = self.client.get(reverse('booklog:book_list'), {'query': '件数', 'author': '著者B'})
+        self.assertContains(response, 'の検索結果: 3 件')
+        self.assertEqual(response.context['facets']['authors'][0], ('著者A', 4))
+        self.assertContains(response, 'author=%E8%91%97%E8%80%85B')
+
+        response = self.client.get(reverse('booklog:book_list'), {'query': '件数', 'year': '2021', 'author': '著者A'})
+        self.assertEqual(len(response.context['books']), 2)
+
+
+class StatsTest(TestCase):
+    """ユーザーごとの蔵書の集計（ダッシュボード）のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='statsuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(
+            title='集計の本', author='著者A', published_date=date(2001, 4, 1), user=self.user
+        )
+        Memo.objects.create(book=self.book, content='メモ1')
+        self.client.login(username='statsuser', password='testpass123')
+
+    def snapshot(self):
+        stats_row = LibraryStats.objects.get(user=self.user)
+        buckets = LibraryStatBucket.objects.filter(user=self.user).order_by('kind', 'key')
+        return (
+            stats_row.book_count, stats_row.memo_count,
+            list(buckets.values_list('kind', 'key', 'count')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        stats.rebuild_user(self.user.pk)
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def send(self, method, name, data):
+        return getattr(self.client, method)(
+            reverse(f'booklog:{name}'), json.dumps(data), content_type='application/json'
+        )
+
+    def test_incremental_updates(self):
+        """書籍・メモの保存と削除で集計が差分だけ更新されるテスト"""
+        book_count, memo_count, buckets = self.assertMatchesRebuild()
+        self.assertEqual((book_count, memo_count), (1, 1))
+        month = stats.month_key(timezone.localtime(self.book.created_at))
+        self.assertEqual(buckets, [('author', '著者A', 1), ('month', month, 1), ('year', '2001', 1)])
+
+        self.client.post(reverse('booklog:book_update', kwargs={'pk': self.book.pk}), {
+            'title': '集計の本', 'author': '著者B', 'published_date': '2010-01-01',
+        })
+        other = Book.objects.create(title='二冊目', author='著者B', user=self.user)
+        Memo.objects.create(book=other, content='メモ2')
+        _, _, buckets = self.assertMatchesRebuild()
+        self.assertIn(('author', '著者B', 2), buckets)
+        self.assertNotIn(('author', '著者A', 1), buckets)
+
+        # 書籍を削除するとカスケードで消えたメモも数えから外す
+        self.client.post(reverse('booklog:book_delete', kwargs={'pk': self.book.pk}))
+        other.memos.get().delete()
+        self.assertEqual(self.assertMatchesRebuild()[:2], (1, 0))
+
+    def test_bulk_operations(self):
+        """API の一括作成・更新とインポートでも集計が更新されるテスト"""
+        response = self.send('post', 'api_book_bulk', [
+            {'title': f'一括{n}', 'author': '著者C', 'published_date': '1999-01-01'} for n in range(3)
+        ])
+        created = [item['id'] for item in response.json()['results']]
+        self.send('post', 'api_memo_bulk', [{'book': created[0], 'content': '一括メモ'}])
+        self.send('patch', 'api_book_bulk', [{'id': created[1], 'author': '著者D'}])
+        importers.import_books(self.user, io.StringIO(
+            'title,author,published_date,memos\n'
+            'インポートの本,著者C,,"[""メモA"", ""メモB""]"\n'
+        ), 'csv')
+        book_count, memo_count, buckets = self.assertMatchesRebuild()
+        self.assertEqual((book_count, memo_count), (5, 4))
+        self.assertIn(('author', '著者C', 3), buckets)
+        self.assertIn(('year', '1999', 3), buckets)
+
+    def test_dashboard_reads_only_stats(self):
+        """ダッシュボードが集計のテーブルだけを読むテスト"""
+        Book.objects.create(title='二冊目', author='著者A', user=self.user)
+        with self.assertNumQueries(5):  # ユーザー・集計・内訳3種（セッションはキャッシュから読む）
+            response = self.client.get(reverse('booklog:stats'))
+        self.assertContains(response, '2 冊')
+        self.assertContains(response, '0.5 件')
+        self.assertEqual(response.context['authors'], [('著者A', 2)])
+
+    def test_rebuild_stats_command(self):
+        """rebuild_stats コマンドでずれた集計を修復するテスト"""
+        LibraryStats.objects.filter(user=self.user).update(book_count=99)
+        LibraryStatBucket.objects.filter(user=self.user).delete()
+        stdout = io.StringIO()
+        call_command('rebuild_stats', user='statsuser', stdout=stdout)
+        self.assertIn('1 人', stdout.getvalue())
+        self.assertEqual(self.snapshot()[0], 1)
+        self.assertEqual(len(self.snapshot()[2]), 3)
+
+
+@override_settings(
+    DATABASE_ROUTERS=['booklog.routers.ReplicaRouter'],
+    BOOKLOG_REPLICAS=['replica'],
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'booklog.routers.ReplicaPinMiddleware'],
+    BOOKLOG_FRAGMENT_CACHE_TIMEOUT=0,
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    """レプリカへの読み取りの振り分けのテスト
+
+    replica はレプリケーションしていない空の DB なので、レプリカから読むと書籍が見えない。
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        """テスト用データの準備（プライマリにだけ書き込む）"""
+        self.user = User.objects.create_user(
+            username='replicauser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='プライマリの本', author='著者', user=self.user)
+        self.client.login(username='replicauser', password='testpass123')
+
+    def test_reads_go_to_replica(self):
+        """一覧と詳細の読み取りがレプリカに送られるテスト"""
+        response = self.client.get(reverse('booklog:book_list'))
+        self.assertNotContains(response, 'プライマリの本')
+        response = self.client.get(reverse('booklog:book_detail', kwargs={'pk': self.book.pk}))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_read_your_writes(self):
+        """書き込んだ直後のリダイレクト先はプライマリから読むテスト"""
+        response = self.client.post(reverse('booklog:book_create'), {'title': '登録した本', 'author': '著者'})
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        response = self.client.get(response.url)
+        self.assertContains(response, '登録した本')
+
+        # 固定の期限が切れたらレプリカに戻る
+        self.client.cookies[routers.PIN_COOKIE] = str(time.time() - 1)
+        response = self.client.get(reverse('booklog:book_list'))
+        self.assertNotContains(response, '登録した本')
+
+    def test_router_rules(self):
+        """リクエストの外・Job・トランザクションの中はプライマリから読むテスト"""
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Book))
+        state = routers.RoutingState('replica', pinned=False)
+        token = routers._current.set(state)
+        try:
+            self.assertEqual(router.db_for_read(Book), 'replica')
+            self.assertIsNone(router.db_for_read(Job))
+            self.assertIsNone(router.db_for_read(User))
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Book))
+            self.assertEqual(router.db_for_write(Memo), 'default')
+            self.assertIsNone(router.db_for_read(Book))
+        finally:
+            routers._current.reset(token)
+        self.assertFalse(router.allow_migrate('replica', 'booklog'))
+
+
+@override_settings(
+    BOOKLOG_METRICS=True,
+    MIDDLEWARE=['booklog.instrumentation.InstrumentationMiddleware', *settings.MIDDLEWARE],
+)
+class ConnectionPoolTest(TransactionTestCase):
+    """DB 接続の使い回し・プール・ヘルスチェックのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='pooluser',
+            password='testpass123'
+        )
+        Book.objects.create(title='接続の本', author='著者', user=self.user)
+        client = Client()
+        client.force_login(self.user)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    def request(self, handler):
+        # テストクライアントはリクエストの前後で古い接続を閉じる処理（close_old_connections）を
+        # 外してしまうので、本番と同じ WSGIHandler を直接呼ぶ
+        request = RequestFactory().get(reverse('booklog:book_list'), HTTP_COOKIE=self.cookie)
+        statuses = []
+        response = handler(request.environ, lambda status, headers, exc_info=None: statuses.append(status))
+        b''.join(response)
+        response.close()
+        return statuses[0]
+
+    def test_configure_connections(self):
+        """プール・使い回し・ヘルスチェックを環境変数で設定するテスト"""
+        env = {'DB_POOL_MAX_SIZE': '20', 'DB_POOL_TIMEOUT': '2.5', 'DB_CONN_HEALTH_CHECKS': 'False'}
+        with mock.patch.dict(os.environ, env):
+            postgres = configure_connections({'ENGINE': 'django.db.backends.postgresql'})
+        self.assertEqual(postgres['CONN_MAX_AGE'], 0)
+        self.assertFalse(postgres['CONN_HEALTH_CHECKS'])
+        self.assertEqual(postgres['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual(postgres['OPTIONS']['pool']['timeout'], 2.5)
+
+        with mock.patch.dict(os.environ, {'DB_POOL': 'False'}):
+            postgres = configure_connections({'ENGINE': 'django.db.backends.postgresql'})
+        self.assertEqual(postgres['CONN_MAX_AGE'], 600)
+        self.assertNotIn('OPTIONS', postgres)
+
+        mysql = configure_connections({'ENGINE': 'django.db.backends.mysql'}, server_mode='asgi')
+        self.assertEqual((mysql['CONN_MAX_AGE'], mysql['CONN_HEALTH_CHECKS']), (0, True))
+
+    def test_connection_reused_across_requests(self):
+        """リクエストをまたいで接続を使い回し、リクエストごとに1回だけ確認するテスト"""
+        handler = WSGIHandler()
+        connection.ensure_connection()
+        first = connection.connection
+        reused = metrics.REGISTRY.get_sample_value('booklog_db_connection_reuse_total', {'reused': 'true'}) or 0
+        with mock.patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}), \
+                mock.patch.object(connection, 'health_check_enabled', True), \
+                mock.patch.object(connection, 'close_at', time.monotonic() + 600), \
+                mock.patch.object(connection, 'is_usable', wraps=connection.is_usable) as is_usable:
+            for _ in range(3):
+                self.assertEqual(self.request(handler), '200 OK')
+        self.assertIs(connection.connection, first)
+        self.assertEqual(is_usable.call_count, 3)
+        self.assertEqual(
+            metrics.REGISTRY.get_sample_value('booklog_db_connection_reuse_total', {'reused': 'true'}), reused + 3
+        )
+
+    def test_pool_stats(self):
+        """コネクションプールの統計をメトリクスに出力するテスト"""
+        pool = mock.Mock()
+        pool.get_stats.return_value = {'pool_size': 4, 'pool_available': 3, 'requests_waiting': 0}
+        with mock.patch.object(connection, 'pool', pool, create=True):
+            self.assertEqual(metrics.pool_stats(), {'default': pool.get_stats.return_value})
+            body = self.client.get('/metrics').content.decode()
+        self.assertIn('booklog_db_pool{alias="default",stat="pool_available"} 3.0', body)
+
+
+class SoftDeleteTest(TestCase):
+    """書籍・メモの論理削除と物理削除（purge_deleted）のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='deleteuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='削除する本', author='著者A', user=self.user)
+        self.memo = Memo.objects.create(book=self.book, content='消えるメモ')
+        self.other = Book.objects.create(title='残る本', author='著者B', user=self.user)
+        self.client.login(username='deleteuser', password='testpass123')
+
+    def delete_book(self, book):
+        return self.client.post(reverse('booklog:book_delete', kwargs={'pk': book.pk}))
+
+    def test_book_delete_keeps_rows(self):
+        """書籍の削除で書籍とメモが論理削除され、一覧・検索・集計から外れるテスト"""
+        self.assertEqual(self.delete_book(self.book).status_code, 302)
+
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+        self.assertTrue(Book.all_objects.get(pk=self.book.pk).is_deleted)
+        self.assertTrue(Memo.all_objects.get(pk=self.memo.pk).is_deleted)
+        self.assertEqual(self.book.memos.count(), 0)
+
+        response = self.client.get(reverse('booklog:book_list'))
+        self.assertNotContains(response, '削除する本')
+        response = self.client.get(reverse('booklog:book_list'), {'query': '消えるメモ'})
+        self.assertEqual(len(response.context['books']), 0)
+        self.assertEqual(self.delete_book(self.book).status_code, 404)
+
+        self.assertEqual(LibraryStats.objects.get(user=self.user).book_count, 1)
+        self.assertEqual(LibraryStats.objects.get(user=self.user).memo_count, 0)
+
+    def test_book_delete_does_not_depend_on_memo_count(self):
+        """メモがどれだけあっても書籍の削除のクエリ数が変わらないテスト"""
+        Memo.objects.bulk_create([Memo(book=self.other, content=f'メモ{n}') for n in range(30)])
+        self.delete_book(self.book)  # キャッシュの作成などを先に済ませる
+        small = Book.objects.create(title='メモ1件', author='著者A', user=self.user)
+        Memo.objects.create(book=small, content='メモ')
+
+        with CaptureQueriesContext(connection) as one_memo:
+            self.delete_book(small)
+        with CaptureQueriesContext(connection) as many_memos:
+            self.delete_book(self.other)
+        self.assertEqual(len(one_memo), len(many_memos))
+        self.assertEqual(Memo.all_objects.filter(book=self.other, deleted_at__isnull=False).count(), 30)
+
+    def test_memo_delete_keeps_row(self):
+        """メモの削除で論理削除され、検索インデックスと集計が更新されるテスト"""
+        response = self.client.post(reverse('booklog:memo_delete', kwargs={'pk': self.memo.pk}))
+        self.assertRedirects(response, reverse('booklog:book_detail', kwargs={'pk': self.book.pk}))
+        self.assertTrue(Memo.all_objects.get(pk=self.memo.pk).is_deleted)
+
+        response = self.client.get(reverse('booklog:book_detail', kwargs={'pk': self.book.pk}))
+        self.assertNotContains(response, '消えるメモ')
+        self.assertFalse(search_books(Book.objects.filter(user=self.user), '消えるメモ').exists())
+        self.assertEqual(LibraryStats.objects.get(user=self.user).memo_count, 0)
+
+    def test_api_delete(self):
+        """API の削除も論理削除で、削除済みの行は見つからないテスト"""
+        url = reverse('booklog:api_book_detail', kwargs={'pk': self.book.pk})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+        response = self.client.delete(
+            reverse('booklog:api_book_bulk'), json.dumps([self.book.pk, self.other.pk]),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json(), {'deleted': 1})
+        self.assertEqual(Book.all_objects.filter(user=self.user).count(), 2)
+        self.assertEqual(LibraryStats.objects.get(user=self.user).book_count, 0)
+
+    def test_purge_deleted(self):
+        """purge_deleted が期限を過ぎた削除済みの行だけを少しずつ物理削除するテスト"""
+        self.delete_book(self.book)
+        kept = Memo.objects.create(book=self.other, content='最近消したメモ')
+        deletion.soft_delete_memo(kept)
+        Book.all_objects.filter(pk=self.book.pk).update(deleted_at=timezone.now() - timedelta(days=8))
+        Memo.all_objects.filter(pk=self.memo.pk).update(deleted_at=timezone.now() - timedelta(days=8))
+        before = LibraryStats.objects.get(user=self.user)
+
+        stdout = io.StringIO()
+        call_command('purge_deleted', batch_size=1, verbosity=2, stdout=stdout)
+        self.assertIn('書籍 1 件・メモ 1 件', stdout.getvalue())
+        self.assertIn('memo: 1 件', stdout.getvalue())
+
+        self.assertFalse(Book.all_objects.filter(pk=self.book.pk).exists())
+        self.assertFalse(Memo.all_objects.filter(pk=self.memo.pk).exists())
+        self.assertTrue(Memo.all_objects.filter(pk=kept.pk).exists())
+        self.assertTrue(Book.objects.filter(pk=self.other.pk).exists())
+        # 集計は論理削除の時点で更新済みなので、物理削除では変わらない
+        after = LibraryStats.objects.get(user=self.user)
+        self.assertEqual((after.book_count, after.memo_count), (before.book_count, before.memo_count))
+
+        call_command('purge_deleted', older_than=0, stdout=io.StringIO())
+        self.assertFalse(Memo.all_objects.filter(pk=kept.pk).exists())
+
+    def test_purge_user(self):
+        """退会したユーザーの行を、ユーザーの削除のカスケードに任せずに少しずつ消すテスト"""
+        job = jobs.enqueue('reindex', self.user)
+        progress = []
+        purged = deletion.purge_user(self.user.pk, batch_size=1, progress=lambda *args: progress.append(args))
+        self.assertEqual((purged['books'], purged['memos']), (2, 1))
+        self.assertIn(('librarychange', 1), progress)
+        for model in (SearchToken, SearchDocument, CompletionEntry, LibraryStatBucket, LibraryChange):
+            self.assertFalse(model.objects.filter(user=self.user).exists(), model.__name__)
+        job.refresh_from_db()
+        self.assertIsNone(job.user_id)
+
+
+class ChangeFeedTest(QueryBudgetMixin, TestCase):
+    """変更フィード（/api/v1/changes/）のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='syncuser',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='同期する本', author='著者A', user=self.user)
+        self.memo = Memo.objects.create(book=self.book, content='同期するメモ')
+        other = User.objects.create_user(username='syncother', password='testpass123')
+        Book.objects.create(title='他人の本', author='著者B', user=other)
+        self.client.login(username='syncuser', password='testpass123')
+
+    def sync(self, token=None, **params):
+        if token:
+            params['since'] = token
+        response = self.client.get(reverse('booklog:api_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_then_incremental(self):
+        """最初の同期で全件を、次からは変更分だけを受け取るテスト"""
+        first = self.sync()
+        self.assertEqual([book['title'] for book in first['books']], ['同期する本'])
+        self.assertEqual([memo['content'] for memo in first['memos']], ['同期するメモ'])
+        self.assertFalse(first['has_more'])
+
+        unchanged = self.sync(first['sync_token'])
+        self.assertEqual((unchanged['books'], unchanged['memos']), ([], []))
+        self.assertEqual(unchanged['sync_token'], first['sync_token'])
+
+        self.memo.content = '書き換えたメモ'
+        self.memo.save()
+        added = Book.objects.create(title='追加した本', author='著者A', user=self.user)
+        changes = self.sync(first['sync_token'])
+        self.assertEqual([book['id'] for book in changes['books']], [added.pk])
+        self.assertEqual([memo['content'] for memo in changes['memos']], ['書き換えたメモ'])
+
+    def test_deletes(self):
+        """論理削除・物理削除の両方が削除として返るテスト"""
+        token = self.sync()['sync_token']
+        other_memo = Memo.objects.create(book=self.book, content='消すメモ')
+        self.client.post(reverse('booklog:memo_delete', kwargs={'pk': other_memo.pk}))
+        changes = self.sync(token)
+        self.assertEqual(changes['deleted'], {'books': [], 'memos': [other_memo.pk]})
+
+        token = changes['sync_token']
+        self.client.post(reverse('booklog:book_delete', kwargs={'pk': self.book.pk}))
+        gone = Book.objects.create(title='管理画面で消す本', author='著者A', user=self.user)
+        gone_pk = gone.pk
+        gone.delete()
+        changes = self.sync(token)
+        self.assertEqual(changes['books'], [])
+        self.assertEqual(sorted(changes['deleted']['books']), sorted([self.book.pk, gone_pk]))
+
+        # 最初から同期すると、書籍ごと削除されたメモも削除として返る
+        changes = self.sync()
+        self.assertEqual(changes['memos'], [])
+        self.assertIn(self.memo.pk, changes['deleted']['memos'])
+
+    def test_pagination(self):
+        """limit ずつ取得して全件を取りこぼさずに受け取るテスト"""
+        for number in range(4):
+            Book.objects.create(title=f'本{number}', author='著者C', user=self.user)
+        seen, token, pages = [], None, 0
+        while True:
+            page = self.sync(token, limit=2)
+            seen += [('book', book['id']) for book in page['books']]
+            seen += [('memo', memo['id']) for memo in page['memos']]
+            token, pages = page['sync_token'], pages + 1
+            if not page['has_more']:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+    def test_sequence(self):
+        """通番が変更ごとに増え、1件につき最後の変更だけを残すテスト"""
+        state = self.user.library_state
+        before = state.seq
+        self.book.title = '改題'
+        self.book.save()
+        self.book.save()
+        state.refresh_from_db()
+        self.assertEqual(state.seq, before + 2)
+        change = LibraryChange.objects.get(user=self.user, kind=sync.BOOK, object_id=self.book.pk)
+        self.assertEqual(change.seq, state.seq)
+
+    def test_invalid_token_and_budget(self):
+        """不正なトークンは 400 で、クエリ数が上限に収まるテスト"""
+        response = self.client.get(reverse('booklog:api_changes'), {'since': 'xxx'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('booklog:api_changes'), {'since': sync.encode_token('a', 1)})
+        self.assertEqual(response.status_code, 400)
+        self.assertWithinQueryBudget(reverse('booklog:api_changes'))
+
+
+class AuthCacheTest(TestCase):
+    """セッション（cached_db）とログイン中のユーザーのキャッシュのテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(
+            username='authuser',
+            password='testpass123'
+        )
+        self.client.login(username='authuser', password='testpass123')
+        self.url = reverse('booklog:stats')
+
+    def test_no_auth_queries_when_cached(self):
+        """2回目以降のリクエストでセッションとユーザーを DB から読まないテスト"""
+        self.client.get(self.url)
+        self.assertIsNotNone(cache.get(auth.user_cache_key(self.user.pk)))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        tables = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('auth_user', tables)
+
+    def test_session_from_previous_backend(self):
+        """CachedModelBackend に切り替える前にログインしたセッションでもログインしたままになるテスト"""
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(BOOKLOG_USER_CACHE=False)
+    def test_without_shared_cache(self):
+        """共有のキャッシュでなければユーザーを毎回 DB から読み、他のプロセスでの変更がすぐ効くテスト"""
+        self.client.get(self.url)
+        self.assertIsNone(cache.get(auth.user_cache_key(self.user.pk)))
+        # 別のプロセスでのパスワードの変更（このプロセスのキャッシュは消えない）
+        User.objects.filter(pk=self.user.pk).update(password=make_password('newpass456'))
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_session_survives_cache_loss(self):
+        """キャッシュが消えても DB のセッションでログインしたままになるテスト"""
+        cache.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_password_change_invalidates(self):
+        """パスワードを変更すると古いセッションが無効になるテスト"""
+        self.client.get(self.url)
+        self.user.set_password('newpass456')
+        self.user.save()
+        self.assertIsNone(cache.get(auth.user_cache_key(self.user.pk)))
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_logout_and_deactivate_clear_cache(self):
+        """ログアウトと退会でユーザーのキャッシュを消すテスト"""
+        self.client.get(self.url)
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get(auth.user_cache_key(self.user.pk)))
+
+        self.client.login(username='authuser', password='testpass123')
+        self.client.get(self.url)
+        self.client.post(reverse('booklog:account_delete'))
+        self.assertIsNone(cache.get(auth.user_cache_key(self.user.pk)))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class StartupTest(TestCase):
+    """起動の準備（リリースの手順・gunicorn の warm-up）のテスト"""
+    databases = '__all__'
+
+    def forget_latest_migration(self):
+        from django.db.migrations.recorder import MigrationRecorder
+
+        latest = MigrationRecorder.Migration.objects.filter(app='booklog').order_by('-name').first()
+        latest.delete()
+        return f'booklog.{latest.name}'
+
+    def test_release_without_pending_migrations(self):
+        """未適用のマイグレーションが無ければ migrate せずに終わるテスト"""
+        out = io.StringIO()
+        # テーブルの一覧とマイグレーションの記録を読むだけ
+        with mock.patch('booklog.management.commands.release.call_command') as migrate, \
+                self.assertNumQueries(2):
+            call_command('release', stdout=out)
+        call_command('release', '--check', verbosity=0)
+        migrate.assert_not_called()
+        self.assertIn('未適用のマイグレーションはありません', out.getvalue())
+
+    def test_release_applies_pending_migrations(self):
+        """未適用のマイグレーションがあれば migrate し、--check なら失敗するテスト"""
+        name = self.forget_latest_migration()
+        out = io.StringIO()
+        with self.assertRaises(SystemExit) as raised:
+            call_command('release', '--check', stdout=out)
+        self.assertEqual(raised.exception.code, 1)
+        self.assertIn(name, out.getvalue())
+
+        with mock.patch('booklog.management.commands.release.call_command') as migrate:
+            call_command('release', stdout=io.StringIO())
+        migrate.assert_called_once_with(
+            'migrate', database='default', interactive=False, verbosity=1, stdout=mock.ANY, stderr=mock.ANY,
+        )
+
+    def test_warm_up_compiles_project_templates(self):
+        """warm-up でこのプロジェクトのテンプレートがすべてコンパイルされるテスト"""
+        from django.template import engines
+
+        from config import warmup
+
+        engine = engines['django']
+        names = set(warmup.template_names(engine))
+        self.assertIn('booklog/base.html', names)
+        self.assertIn('registration/login.html', names)
+        self.assertFalse(any(name.startswith('admin/') for name in names))
+
+        loader, = engine.engine.template_loaders
+        loader.reset()
+        with self.assertLogs('booklog.warmup', 'INFO'):
+            self.assertGreaterEqual(warmup.warm_up(), 0)
+        self.assertTrue(names <= set(loader.get_template_cache))
+
+    def test_connect_databases(self):
+        """ワーカーの起動時に DB に接続し、失敗しても起動を止めないテスト"""
+        from django.db import OperationalError
+
+        from config import warmup
+
+        warmup.connect_databases()
+        self.assertIsNotNone(connection.connection)
+        with mock.patch.object(connection, 'ensure_connection', side_effect=OperationalError), \
+                self.assertLogs('booklog.warmup', 'WARNING'):
+            warmup.connect_databases()
+
+
+class StaticAssetsTest(TestCase):
+    """静的ファイルの削減・圧縮・キャッシュと、最初のページへの CSS の埋め込みのテスト"""
+
+    def test_purge_css(self):
+        """使っていないクラスのセレクタと @keyframes だけを除くテスト"""
+        from . import assets
+
+        css = (
+            '/*! license */body{margin:0}.btn{color:red}.btn,.unused{padding:0}'
+            '.btn:not(.unused){opacity:1}.unused .btn{opacity:0}a[href^="http"]{color:blue}'
+            '@media (min-width:576px){.unused{x:1}.btn{x:2}}@media print{.unused{x:3}}'
+            '@keyframes spin{to{transform:rotate(1turn)}}@keyframes fade{to{opacity:0}}.btn{animation:spin 1s}'
+        )
+        self.assertEqual(
+            assets.purge_css(css, {'btn'}),
+            '/*! license */body{margin:0}.btn{color:red}.btn{padding:0}.btn:not(.unused){opacity:1}'
+            'a[href^="http"]{color:blue}@media (min-width:576px){.btn{x:2}}'
+            '@keyframes spin{to{transform:rotate(1turn)}}.btn{animation:spin 1s}',
+        )
+
+    def test_used_classes(self):
+        """テンプレート・{% if %} の中・フォームのウィジェットのクラスを集めるテスト"""
+        from . import assets
+
+        classes = assets.used_classes()
+        self.assertTrue({'navbar', 'dropdown-menu-end', 'col-lg-9', 'col-12', 'form-control', 'show'} <= classes)
+        self.assertNotIn('carousel', classes)
+        critical = assets.critical_css()
+        self.assertIn('.navbar-brand{', critical)
+        self.assertNotIn('.table{', critical)
+        self.assertNotIn('@charset', critical)
+
+    def test_collectstatic_purges_and_compresses(self):
+        """collectstatic で削った CSS にハッシュ付きの名前と Brotli・gzip 版を作り、immutable で返すテスト"""
+        from whitenoise.middleware import WhiteNoiseMiddleware
+
+        from . import assets
+
+        source = os.path.getsize(os.path.join(settings.BASE_DIR, 'static', assets.STYLESHEET))
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'booklog.assets.BooklogStaticFilesStorage'}}
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, STORAGES=storages):
+            call_command('collectstatic', '--noinput', verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+
+            hashed = staticfiles_storage.stored_name(assets.STYLESHEET)
+            self.assertNotEqual(hashed, assets.STYLESHEET)
+            path = os.path.join(root, hashed)
+            self.assertLess(os.path.getsize(path), source / 3)
+            self.assertTrue(os.path.exists(path + '.br'))
+            self.assertTrue(os.path.exists(path + '.gz'))
+
+            middleware = WhiteNoiseMiddleware(lambda request: None)
+            request = RequestFactory().get(settings.STATIC_URL + hashed, HTTP_ACCEPT_ENCODING='gzip, br')
+            response = middleware(request)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
+
+    def test_first_visit_inlines_critical_css(self):
+        """最初のページでは CSS を埋め込み、読み込んだ後のページでは <link> だけにするテスト"""
+        from django.templatetags.static import static
+
+        from . import assets
+
+        response = self.client.get(reverse('login'))
+        self.assertContains(response, '<style>')
+        self.assertContains(response, 'rel="preload" as="style"')
+        self.assertContains(response, '<noscript>')
+
+        url = static(assets.STYLESHEET)
+        self.client.cookies[assets.COOKIE] = assets.stylesheet_version(url)
+        response = self.client.get(reverse('login'))
+        self.assertNotContains(response, '<style>')
+        self.assertContains(response, f'<link href="{url}" rel="stylesheet">')
+
+
+class FragmentRenderingTest(TestCase):
+    """?fragment=rows で表の行とページ送りだけを返すテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='rowsuser', password='testpass123')
+        for i in range(7):
+            self.book = Book.objects.create(title=f'断片書籍{i}', author='断片著者', user=self.user)
+        Memo.objects.create(book=self.book, content='断片のメモ')
+        self.client.login(username='rowsuser', password='testpass123')
+        self.list_url = reverse('booklog:book_list')
+
+    def test_list_rows(self):
+        """検索の行・件数・ページ送りだけを、ページより少ないクエリで返すテスト"""
+        params = {'query': '断片', 'page': 2}
+        with CaptureQueriesContext(connection) as page_queries:
+            page = self.client.get(self.list_url, params)
+        with CaptureQueriesContext(connection) as rows_queries:
+            rows = self.client.get(self.list_url, {**params, 'fragment': 'rows'})
+        self.assertEqual(rows.status_code, 200)
+        # ファセットを数えない
+        self.assertLess(len(rows_queries), len(page_queries))
+        self.assertLess(len(rows.content) * 5, len(page.content))
+
+        html = rows.content.decode()
+        self.assertNotIn('<nav class="navbar', html)
+        self.assertNotIn('<form', html)
+        for part in ('summary', 'rows', 'pagination', 'facets'):
+            self.assertIn(f'data-fragment-part="{part}"', html)
+        self.assertIn('断片書籍1', html)
+        self.assertIn('(全 7 件)', html)
+        self.assertIn('?page=1&sort=new&query=', html)
+
+    def test_list_rows_cached_separately(self):
+        """ページと断片を別々にキャッシュし、断片もキャッシュから返すテスト"""
+        self.assertContains(self.client.get(self.list_url), 'data-fragment-search')
+        rows = self.client.get(self.list_url, {'fragment': 'rows'})
+        self.assertNotContains(rows, 'data-fragment-search')
+        with self.assertNumQueries(1):  # 最終変更日時のみ
+            cached = self.client.get(self.list_url, {'fragment': 'rows'})
+        self.assertEqual(cached.content, rows.content)
+        self.assertContains(self.client.get(self.list_url), 'js/fragments.js')
+
+    def test_detail_rows(self):
+        """詳細はメモの表の行だけを返すテスト"""
+        url = reverse('booklog:book_detail', kwargs={'pk': self.book.pk})
+        response = self.client.get(url, {'fragment': 'rows'})
+        self.assertContains(response, '断片のメモ')
+        self.assertContains(response, 'data-fragment-part="rows"')
+        self.assertNotContains(response, '著者:')
+        self.assertNotContains(response, '<title>')
+
+    def test_async_views(self):
+        """非同期版のビューも同じ断片を返すテスト"""
+        rows = self.client.get(self.list_url, {'query': '断片', 'fragment': 'rows'}).content
+        cache.clear()
+        self.addCleanup(reload_urls)
+        with override_settings(BOOKLOG_ASYNC_VIEWS=True):
+            reload_urls()
+            response = self.client.get(self.list_url, {'query': '断片', 'fragment': 'rows'})
+            self.assertEqual(response.content, rows)
+            detail = self.client.get(reverse('booklog:book_detail', kwargs={'pk': self.book.pk}), {'fragment': 'rows'})
+            self.assertContains(detail, '断片のメモ')
+            self.assertNotContains(detail, '<title>')
+
+
+class CompletionTest(QueryBudgetMixin, TestCase):
+    """検索欄の入力補完（タイトル・著者の前方一致）のテスト"""
+
+    def setUp(self):
+        """テスト用データの準備"""
+        self.user = User.objects.create_user(username='completionuser', password='testpass123')
+        self.book = Book.objects.create(title='ハリー・ポッターと賢者の石', author='J.K.ローリング', user=self.user)
+        Book.objects.create(title='ノルウェイの森', author='村上春樹', user=self.user)
+        Book.objects.create(title='海辺のカフカ', author='村上春樹', user=self.user)
+        Book.objects.create(title='Harry Potter and the Chamber of Secrets', author='J.K. Rowling', user=self.user)
+        self.client.login(username='completionuser', password='testpass123')
+        self.url = reverse('booklog:api_completions')
+
+    def snapshot(self):
+        return list(
+            CompletionEntry.objects.filter(user=self.user).order_by('kind', 'value', 'key')
+            .values_list('kind', 'key', 'value', 'count')
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        completion.rebuild_user(self.user.pk)
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def values(self, query, limit=10):
+        return [item['value'] for item in completion.complete(self.user.pk, query, limit)]
+
+    def test_variants(self):
+        """かな・カナ、全角・半角、大文字・小文字の違いと語の途中からでも補完されるテスト"""
+        title = 'ハリー・ポッターと賢者の石'
+        for query in ['はりー', 'ハリー', 'ﾊﾘｰ', 'はりーぽ', 'ポッター', 'ぽったーと賢', 'ﾎﾟｯﾀｰ']:
+            with self.subTest(query=query):
+                self.assertIn(title, self.values(query))
+        for query in ['harry', 'ＨＡＲＲＹ', 'Harry Pot', 'chamber']:
+            with self.subTest(query=query):
+                self.assertIn('Harry Potter and the Chamber of Secrets', self.values(query))
+        self.assertEqual(self.values('ろーりんぐ'), ['J.K.ローリング'])
+        self.assertEqual(self.values('jk'), ['J.K. Rowling', 'J.K.ローリング'])
+        self.assertEqual(self.values('  '), [])
+        # 前方一致なので語の途中の文字列では出ない
+        self.assertEqual(self.values('ッター'), [])
+
+    def test_authors_counted_once(self):
+        """同じ著者の書籍が何冊あっても候補は1件で、冊数を返すテスト"""
+        self.assertEqual(completion.complete(self.user.pk, '村上'), [
+            {'kind': 'author', 'value': '村上春樹', 'count': 2},
+        ])
+        # 他のユーザーの書籍は出ない
+        other = User.objects.create_user(username='completionother', password='testpass123')
+        Book.objects.create(title='村上の本', author='他人', user=other)
+        self.assertEqual(self.values('村上'), ['村上春樹'])
+
+    def test_incremental_updates(self):
+        """書籍の保存・削除・一括操作で冊数が差分だけ更新されるテスト"""
+        self.assertMatchesRebuild()
+        self.client.post(reverse('booklog:book_update', kwargs={'pk': self.book.pk}), {
+            'title': 'ハリー・ポッターと秘密の部屋', 'author': '村上春樹',
+        })
+        self.assertIn(('author', '村上春樹', '村上春樹', 3), self.assertMatchesRebuild())
+        self.assertEqual(self.values('ハリー'), ['ハリー・ポッターと秘密の部屋'])
+
+        response = self.client.post(reverse('booklog:api_book_bulk'), json.dumps([
+            {'title': f'一括の本{n}', 'author': '村上春樹'} for n in range(3)
+        ]), content_type='application/json')
+        created = [item['id'] for item in response.json()['results']]
+        self.client.patch(reverse('booklog:api_book_bulk'), json.dumps([
+            {'id': created[0], 'title': '一括で変えた本'},
+        ]), content_type='application/json')
+        self.assertIn(('author', '村上春樹', '村上春樹', 6), self.assertMatchesRebuild())
+        self.assertEqual(self.values('一括'), ['一括で変えた本', '一括の本1', '一括の本2'])
+
+        # 論理削除した書籍は候補から消え、冊数も減る
+        self.client.post(reverse('booklog:book_delete', kwargs={'pk': self.book.pk}))
+        self.client.delete(reverse('booklog:api_book_bulk'), json.dumps(created), content_type='application/json')
+        self.assertIn(('author', '村上春樹', '村上春樹', 2), self.assertMatchesRebuild())
+        self.assertEqual(self.values('ハリー'), [])
+        self.assertEqual(self.values('一括'), [])
+
+    def test_api(self):
+        """API が候補を JSON で返し、クエリ数が上限内に収まるテスト"""
+        response = self.assertWithinQueryBudget(self.url, {'q': 'ha'})
+        self.assertEqual(response.json(), {'results': [
+            {'kind': 'title', 'value': 'Harry Potter and the Chamber of Secrets', 'count': 1},
+        ]})
+        response = self.assertWithinQueryBudget(self.url, {'q': 'の', 'limit': 1})
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(self.client.get(self.url, {'q': 'ha', 'limit': 0}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url, {'q': 'ha'}).status_code, 401)
+
+    def test_cost_does_not_grow(self):
+        """蔵書が大きくても1回のクエリで limit 件だけを読むテスト"""
+        seed_library(self.user, 3000)
+        with CaptureQueriesContext(connection) as queries:
+            suggestions = completion.complete(self.user.pk, '書籍1', limit=5)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT 10', queries[0]['sql'])
+        self.assertEqual([item['value'] for item in suggestions], ['書籍1', '書籍10', '書籍100', '書籍1000', '書籍1001'])
+
+    def test_rebuild_completions_command(self):
+        """rebuild_completions コマンドでずれた冊数を修復するテスト"""
+        expected = self.snapshot()
+        CompletionEntry.objects.filter(user=self.user).update(count=99)
+        stdout = io.StringIO()
+        call_command('rebuild_completions', user='completionuser', stdout=stdout)
+        self.assertIn('1 人', stdout.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
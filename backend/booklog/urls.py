@@ -1,21 +1,51 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'booklog'
 
+# ASGI で動かすときは一覧・詳細（検索を含む）を非同期版にする
+if settings.BOOKLOG_ASYNC_VIEWS:
+    from . import async_views as pages
+else:
+    pages = views
+
 urlpatterns = [
     # 書籍用のURL
-    path('', views.BookListView.as_view(), name='book_list'),
-    path('detail/<int:pk>/', views.BookDetailView.as_view(), name='book_detail'),
+    path('', pages.BookListView.as_view(), name='book_list'),
+    path('detail/<int:pk>/', pages.BookDetailView.as_view(), name='book_detail'),
     path('create/', views.BookCreateView.as_view(), name='book_create'),
     path('update/<int:pk>/', views.BookUpdateView.as_view(), name='book_update'),
     path('delete/<int:pk>/', views.BookDeleteView.as_view(), name='book_delete'),
+    path('export/', views.ExportView.as_view(), name='export'),
+    path('import/', views.BookImportView.as_view(), name='book_import'),
+    path('stats/', views.StatsView.as_view(), name='stats'),
     
     # サインアップ用のURL
     path('signup/', views.SignUpView.as_view(), name='signup'),
+    path('account/delete/', views.AccountDeleteView.as_view(), name='account_delete'),
+
+    # バックグラウンドジョブ用のURL
+    path('jobs/', views.JobListView.as_view(), name='job_list'),
+    path('jobs/<int:pk>/', views.JobDetailView.as_view(), name='job_detail'),
+    path('jobs/<int:pk>/download/', views.JobDownloadView.as_view(), name='job_download'),
+    path('jobs/reindex/', views.ReindexView.as_view(), name='job_reindex'),
     
     # メモ用のURL
     path('detail/<int:book_pk>/memo/add/', views.MemoCreateView.as_view(), name='memo_add'),
     path('memo/edit/<int:pk>/', views.MemoUpdateView.as_view(), name='memo_edit'),
     path('memo/delete/<int:pk>/', views.MemoDeleteView.as_view(), name='memo_delete'),
+
+    # Prometheus のメトリクス
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
+
+    # JSON API
+    path('api/v1/books/', api.BookListApi.as_view(), name='api_book_list'),
+    path('api/v1/books/bulk/', api.BookBulkApi.as_view(), name='api_book_bulk'),
+    path('api/v1/books/<int:pk>/', api.BookDetailApi.as_view(), name='api_book_detail'),
+    path('api/v1/memos/', api.MemoListApi.as_view(), name='api_memo_list'),
+    path('api/v1/memos/bulk/', api.MemoBulkApi.as_view(), name='api_memo_bulk'),
+    path('api/v1/memos/<int:pk>/', api.MemoDetailApi.as_view(), name='api_memo_detail'),
+    path('api/v1/changes/', api.ChangeFeedApi.as_view(), name='api_changes'),
+    path('api/v1/completions/', api.CompletionApi.as_view(), name='api_completions'),
 ]
\ No newline at end of file
@@ -1,56 +1,186 @@
 from django.urls import reverse_lazy
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.shortcuts import get_object_or_404
-from django.core.paginator import Paginator
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView, TemplateView
+from django.shortcuts import get_object_or_404, redirect
+from django.core.paginator import InvalidPage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils import timezone
+from django.views import View
 
-from .models import Book, Memo
-from .forms import MemoForm, BookForm
+from .models import Book, Job, Memo
+from .forms import MemoForm, BookForm, ImportForm
+from .search import search_books
+from .pagination import KeysetPaginator, InvalidCursor
+from .cache import FragmentCacheMixin
+from .counting import CountingPaginator, apply_facet_filters, facet_context, facet_counts
+from .conditional import (
+    ConditionalGetMixin, book_validators, detail_validators, detail_version, library_state, list_validators,
+)
+from . import deletion, export, importers, jobs, metrics, stats
 
+from django.conf import settings
+from django.contrib.auth import logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import UserCreationForm
-
-from django.db.models import Q
+from django.db.models import Count, Q
 
 class UserBookOwnerMixin(LoginRequiredMixin):
     def get_queryset(self):
+        # Book.objects は論理削除した書籍を含まない（booklog.deletion）
         return Book.objects.filter(user=self.request.user).order_by('-id')
 
 class UserMemoOwnerMixin(LoginRequiredMixin):
     def get_queryset(self):
-        return Memo.objects.filter(book__user=self.request.user)
+        # テンプレートと成功時のリダイレクトで書籍を参照するので同時に取得する
+        return Memo.objects.filter(book__user=self.request.user).select_related('book')
 
 
 
-class BookListView(UserBookOwnerMixin, ListView):
-    model = Book
-    template_name = 'booklog/book_list.html'
-    context_object_name = 'books'
+class BookListMixin:
+    """書籍一覧の検索・並び順・ページ送りの方式とコンテキスト
+
+    同期版（BookListView）と非同期版（booklog.async_views.BookListView）で共有する。
+    クエリの発行（件数・ページ・ファセット）だけをそれぞれのビューが行う。
+    """
+    rows_template_name = 'booklog/includes/book_list_rows.html'
+    fragment_cache_params = ('page', 'after', 'query', 'sort', 'author', 'year')
     paginate_by = 5
+    # 並び順（sort パラメータ）ごとのキーセットページネーション用の並び
+    orderings = {
+        'new': ('-id',),
+        'updated': ('-updated_at', '-id'),
+    }
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort')
+        return sort if sort in self.orderings else 'new'
+
+    def get_search_queryset(self):
+        """検索語で絞り込んだ結果（ファセットでの絞り込み前）"""
+        # Book.objects は論理削除した書籍を含まない（booklog.deletion）
+        queryset = Book.objects.filter(user=self.request.user).order_by(*self.orderings[self.get_sort()])
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        
         query = self.request.GET.get('query')
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) | Q(author__icontains=query)
-            )
+            # タイトル・著者・メモ本文の検索インデックスから関連度順に取得
+            queryset = search_books(queryset, query, user_id=self.request.user.pk)
         return queryset
 
+    def get_queryset(self):
+        return apply_facet_filters(self.get_search_queryset(), self.request.GET)
+
+    def get_list_validators(self, state):
+        """library_state() の結果から検証子を求める"""
+        # ページ断片・ファセットのキャッシュは変更の通番ごとに分ける
+        self.fragment_version = state and state[1]
+        return list_validators(self.request, state)
+
+    def uses_cursor(self):
+        # ページ番号の指定があるときと、関連度順の検索結果はページ番号方式にする
+        return 'page' not in self.request.GET and not self.request.GET.get('query')
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        # 件数は上限付きで数える（booklog.counting）
+        if self.uses_cursor():
+            return KeysetPaginator(queryset, per_page, self.orderings[self.get_sort()])
+        return CountingPaginator(queryset, per_page)
+
+    def get_window(self, paginator):
+        """ページの行を読むクエリセットと、page_from_rows() に渡すカーソルかページ番号
+
+        ?after= のカーソル・?page= のページ番号（'last' なら最後のページ）が不正なら 404 にする。
+        """
+        if self.uses_cursor():
+            cursor = self.request.GET.get('after')
+            try:
+                return paginator.window(cursor), cursor
+            except InvalidCursor:
+                raise Http404('不正なカーソルです')
+        page = self.request.GET.get('page') or 1
+        try:
+            number = paginator.validate_number(page)
+        except InvalidPage:
+            if page != 'last':
+                raise Http404('不正なページです')
+            number = paginator.num_pages
+        return paginator.window(number), number
+
+    def get_page(self, paginator, rows, position):
+        """読んだ行からページを作る（件数の上限を超えた先の空のページは 404）"""
+        try:
+            return paginator.page_from_rows(rows, position)
+        except InvalidPage:
+            raise Http404('不正なページです')
+
+    def wants_facets(self):
+        # 表の行だけのとき（入力中の検索）はファセットを数えない
+        return bool(self.request.GET.get('query')) and not self.renders_rows()
+
+    def get_list_context(self, paginator, page, facets):
+        cursor_mode = self.uses_cursor()
+        return {
+            'query': self.request.GET.get('query', ''),
+            'sort': self.get_sort(),
+            'cursor_mode': cursor_mode,
+            'result_count': None if cursor_mode else paginator.result_count,
+            'facets': facets,
+            **facet_context(self.request.GET),
+        }
+
+
+class BookListView(BookListMixin, UserBookOwnerMixin, ConditionalGetMixin, FragmentCacheMixin, ListView):
+    model = Book
+    template_name = 'booklog/book_list.html'
+    fragment_template_name = 'booklog/includes/book_list_content.html'
+    context_object_name = 'books'
+    # GET 1回で発行してよいクエリ数の上限（booklog.testing.QueryBudgetMixin で検証する）
+    # セッションはキャッシュから読み、ユーザーはキャッシュに無いときだけ読む（booklog.auth）
+    # 検索ではページの取得に加えて件数とファセットを1回ずつ数える
+    query_budget = 5
+
+    def get_validators(self):
+        return self.get_list_validators(library_state(self.request.user.pk))
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_paginator(queryset, page_size)
+        window, position = self.get_window(paginator)
+        page = self.get_page(paginator, list(window), position)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['query'] = self.request.GET.get('query', '')
+        facets = None
+        if self.wants_facets():
+            facets = facet_counts(
+                self.request.user.pk, self.fragment_version, self.get_search_queryset(), self.request.GET['query']
+            )
+        context.update(self.get_list_context(context['paginator'], context['page_obj'], facets))
         return context
 
-class BookDetailView(UserBookOwnerMixin, DetailView):
+class BookDetailView(UserBookOwnerMixin, ConditionalGetMixin, FragmentCacheMixin, DetailView):
     model = Book
     template_name = 'booklog/book_detail.html'
+    fragment_template_name = 'booklog/includes/book_detail_content.html'
+    rows_template_name = 'booklog/includes/book_detail_rows.html'
+    query_budget = 4
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related('memos')
+
+    def get_validators(self):
+        state = book_validators(self.request.user.pk, self.kwargs['pk'])
+        self.fragment_version = detail_version(state)
+        return detail_validators(self.request, self.kwargs['pk'], state)
+
+    def get_cached_context(self, context):
+        return {'title': self.object.title}
 
 class BookCreateView(LoginRequiredMixin, CreateView):
     model = Book
     form_class = BookForm
     template_name = 'booklog/book_form.html'
     success_url = reverse_lazy('booklog:book_list')
+    query_budget = 1
 
     def form_valid(self, form):
         form.instance.user = self.request.user
@@ -60,6 +190,7 @@ class BookUpdateView(UserBookOwnerMixin, UpdateView):
     model = Book
     form_class = BookForm
     template_name = 'booklog/book_form.html'
+    query_budget = 2
     
     def get_success_url(self):
         return reverse_lazy('booklog:book_detail', kwargs={'pk': self.object.pk})
@@ -68,13 +199,24 @@ class BookDeleteView(UserBookOwnerMixin, DeleteView):
     model = Book
     template_name = 'booklog/book_delete.html'
     success_url = reverse_lazy('booklog:book_list')
+    query_budget = 2
+
+    def get_queryset(self):
+        # 集計の Count は関連マネージャーを通らないので、論理削除したメモを自分で除く
+        memo_count = Count('memos', filter=Q(memos__deleted_at__isnull=True))
+        return super().get_queryset().annotate(memo_count=memo_count)
 
+    def form_valid(self, form):
+        # 行は残して論理削除だけ行う（物理削除は manage.py purge_deleted）
+        deletion.soft_delete_book(self.object)
+        return redirect(self.get_success_url())
 
 
 class MemoCreateView(UserMemoOwnerMixin, CreateView):
     model = Memo
     form_class = MemoForm
     template_name = 'booklog/memo_form.html'
+    query_budget = 2
 
     # フォームが送信された際の処理
     def form_valid(self, form):
@@ -105,20 +247,173 @@ class MemoUpdateView(UserMemoOwnerMixin, UpdateView):
     model = Memo
     form_class = MemoForm
     template_name = 'booklog/memo_form.html'
+    query_budget = 2
 
     def get_success_url(self):
-        return reverse_lazy('booklog:book_detail', kwargs={'pk': self.object.book.pk})
+        return reverse_lazy('booklog:book_detail', kwargs={'pk': self.object.book_id})
 
 
 class MemoDeleteView(UserMemoOwnerMixin, DeleteView):
     model = Memo
     template_name = 'booklog/memo_delete.html'
+    query_budget = 2
 
     def get_success_url(self):
-        return reverse_lazy('booklog:book_detail', kwargs={'pk': self.object.book.pk})
+        return reverse_lazy('booklog:book_detail', kwargs={'pk': self.object.book_id})
+
+    def form_valid(self, form):
+        deletion.soft_delete_memo(self.object)
+        return redirect(self.get_success_url())
+
+# --- エクスポートビュー ---
+class ExportView(LoginRequiredMixin, View):
+    """蔵書全体を ?format=csv|ndjson&memos=nested|flat&gzip=1 でストリーミング出力する
+
+    同じ指定を POST するとバックグラウンドのジョブで作成する（ジョブを登録するので
+    CSRF で守られる POST だけにする）。
+    """
+    # 書籍とメモはチャンクごとに1回ずつ読むので、件数が少ない場合の上限
+    query_budget = 3
+
+    def get_options(self, params):
+        """(format, memos, gzip)。指定が正しくなければ None"""
+        format = params.get('format', 'csv')
+        memos = params.get('memos', 'nested')
+        if format not in export.FORMATS or memos not in export.MEMO_MODES:
+            return None
+        return format, memos, params.get('gzip') == '1'
+
+    def post(self, request, *args, **kwargs):
+        options = self.get_options(request.POST)
+        if options is None:
+            return HttpResponseBadRequest('format または memos の指定が正しくありません')
+        format, memos, compress = options
+        job = jobs.enqueue('export_library', request.user, {'format': format, 'memos': memos, 'gzip': compress})
+        return redirect('booklog:job_detail', pk=job.pk)
+
+    def get(self, request, *args, **kwargs):
+        options = self.get_options(request.GET)
+        if options is None:
+            return HttpResponseBadRequest('format または memos の指定が正しくありません')
+        format, memos, compress = options
+
+        response = StreamingHttpResponse(
+            export.export_library(request.user, format, memos, gzip=compress),
+            content_type='application/gzip' if compress else export.CONTENT_TYPES[format],
+        )
+        filename = export.export_filename(format, compress, timezone.localdate())
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+# --- インポートビュー ---
+class BookImportView(LoginRequiredMixin, FormView):
+    form_class = ImportForm
+    template_name = 'booklog/book_import.html'
+    query_budget = 1
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        format = form.cleaned_data['format']
+        if format == 'auto':
+            format = importers.detect_format(upload.name)
+        if upload.size > settings.BOOKLOG_IMPORT_INLINE_MAX_BYTES:
+            # 大きいファイルは保存してワーカーに任せる
+            path = jobs.job_storage().save(f'imports/{self.request.user.pk}/{upload.name}', upload)
+            job = jobs.enqueue('import_books', self.request.user, {'path': path, 'format': format})
+            return redirect('booklog:job_detail', pk=job.pk)
+        try:
+            result = importers.import_books(
+                self.request.user, importers.open_text(upload, upload.name), format
+            )
+        except importers.ImportFailed as error:
+            form.add_error('file', str(error))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=self.form_class(), result=result))
+
+# --- ジョブのビュー ---
+class UserJobOwnerMixin(LoginRequiredMixin):
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by('-id')
+
+class StatsView(LoginRequiredMixin, TemplateView):
+    """蔵書のダッシュボード（booklog.stats の集計だけを読む）"""
+    template_name = 'booklog/stats.html'
+    # 集計と内訳（著者・登録月・出版年）を1回ずつ
+    query_budget = 5
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(stats.dashboard(self.request.user.pk))
+        return context
+
+class JobListView(UserJobOwnerMixin, ListView):
+    model = Job
+    template_name = 'booklog/job_list.html'
+    context_object_name = 'jobs'
+    paginate_by = 20
+    query_budget = 3
+
+class JobDetailView(UserJobOwnerMixin, DetailView):
+    model = Job
+    template_name = 'booklog/job_detail.html'
+    query_budget = 2
+
+class JobDownloadView(UserJobOwnerMixin, DetailView):
+    """エクスポートのジョブが作ったファイルをダウンロードする"""
+    model = Job
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.kind != 'export_library' or job.status != Job.SUCCEEDED:
+            raise Http404('ファイルがありません')
+        storage = jobs.job_storage()
+        if not storage.exists(job.result['path']):
+            raise Http404('ファイルがありません')
+        return FileResponse(storage.open(job.result['path'], 'rb'), as_attachment=True, filename=job.result['filename'])
+
+class ReindexView(LoginRequiredMixin, View):
+    query_budget = 2
+
+    def post(self, request, *args, **kwargs):
+        job = jobs.enqueue('reindex', request.user)
+        return redirect('booklog:job_detail', pk=job.pk)
+
+class AccountDeleteView(LoginRequiredMixin, TemplateView):
+    """アカウントを無効にしてログアウトし、書籍・メモの削除はジョブで行う"""
+    template_name = 'booklog/account_delete.html'
+    query_budget = 2
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['book_count'] = Book.objects.filter(user=self.request.user).count()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        user = request.user
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        jobs.enqueue('delete_account', payload={'user': user.pk})
+        logout(request)
+        return redirect('login')
+
+# --- メトリクス ---
+class MetricsView(View):
+    """Prometheus がスクレイプする /metrics（BOOKLOG_METRICS が無効なら 404）"""
+    query_budget = 0
+
+    def get(self, request, *args, **kwargs):
+        if not settings.BOOKLOG_METRICS:
+            raise Http404('メトリクスは無効です')
+        token = settings.BOOKLOG_METRICS_TOKEN
+        if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('認証が必要です', status=401, content_type='text/plain; charset=utf-8')
+        body, content_type = metrics.render_latest()
+        return HttpResponse(body, content_type=content_type)
 
 # --- サインアップビュー ---
 class SignUpView(CreateView):
     form_class = UserCreationForm
     success_url = reverse_lazy('login') # 登録成功後はログインページにリダイレクト
-    template_name = 'booklog/signup.html'
\ No newline at end of file
+    template_name = 'booklog/signup.html'
+    query_budget = 2
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""DATABASES の接続の使い回し・プール・ヘルスチェックの設定
+
+すべて環境変数（decouple）で変更できる。
+
+- PostgreSQL: DB_POOL=True（既定）なら psycopg3 のコネクションプールを使う
+  （Django 5.1 以降の OPTIONS['pool']）。ワーカーの再起動のたびに接続が一斉に
+  張り直されないよう、プールが接続を作る数と待ち時間に上限を設ける。
+  プールを使うときは CONN_MAX_AGE を 0 にする（Django の制約）。
+- それ以外（MySQL、DB_POOL=False の PostgreSQL）: DB_CONN_MAX_AGE 秒、
+  リクエストをまたいで接続を使い回す（ASGI では接続がスレッドごとなので既定は 0）。
+- DB_CONN_HEALTH_CHECKS=True（既定）なら、使い回す接続をリクエストの最初の
+  クエリの前に確認し、切れていれば張り直す。
+"""
+from decouple import config
+
+POSTGRESQL = 'django.db.backends.postgresql'
+
+
+def pool_options():
+    return {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        # 空きが無いときに接続を待つ秒数（超えたら PoolTimeout）
+        'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+        # 接続を作り直すまでの秒数と、使われていない接続を閉じるまでの秒数
+        'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800.0, cast=float),
+        'max_idle': config('DB_POOL_MAX_IDLE', default=300.0, cast=float),
+    }
+
+
+def configure_connections(database, server_mode='wsgi'):
+    """DATABASES の1件（dict）に接続の設定を加えて返す"""
+    database['CONN_HEALTH_CHECKS'] = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+    if database['ENGINE'] == POSTGRESQL and config('DB_POOL', default=True, cast=bool):
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = pool_options()
+    else:
+        database['CONN_MAX_AGE'] = config(
+            'DB_CONN_MAX_AGE', default=0 if server_mode == 'asgi' else 600, cast=int
+        )
+    return database
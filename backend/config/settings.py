@@ -9,11 +9,14 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import os
 import sys
 from pathlib import Path
 from decouple import config
 import dj_database_url
 
+from config.database import configure_connections
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -56,6 +59,25 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# リクエストごとの計測（DB・描画・キャッシュ・全体の時間を Server-Timing とログに出す）
+BOOKLOG_INSTRUMENTATION = config('BOOKLOG_INSTRUMENTATION', default=False, cast=bool)
+# Prometheus のメトリクス（/metrics）。BOOKLOG_METRICS_TOKEN を設定すると Bearer トークンを要求する
+BOOKLOG_METRICS = config('BOOKLOG_METRICS', default=False, cast=bool)
+BOOKLOG_METRICS_TOKEN = config('BOOKLOG_METRICS_TOKEN', default='')
+# gunicorn の全ワーカーの値を合計するためのディレクトリ（起動前に空にしておく）
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if PROMETHEUS_MULTIPROC_DIR:
+    # prometheus_client は import 時に環境変数を見るので .env で指定された場合も反映する
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = PROMETHEUS_MULTIPROC_DIR
+if BOOKLOG_INSTRUMENTATION or BOOKLOG_METRICS:
+    # 静的ファイルを除いて全体を測れるよう WhiteNoise の直後に入れる
+    MIDDLEWARE.insert(2, 'booklog.instrumentation.InstrumentationMiddleware')
+# N 件に1件 cProfile の結果を保存する（0 で無効）
+BOOKLOG_PROFILE_SAMPLE_RATE = config('BOOKLOG_PROFILE_SAMPLE_RATE', default=0, cast=int)
+# これより遅いリクエストの cProfile の結果を保存する（ミリ秒、0 で無効）
+BOOKLOG_PROFILE_SLOW_MS = config('BOOKLOG_PROFILE_SLOW_MS', default=0, cast=int)
+BOOKLOG_PROFILE_DIR = config('BOOKLOG_PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -76,6 +98,11 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 
+# サーバーの動かし方（wsgi: gunicorn の同期ワーカー / asgi: gunicorn + uvicorn ワーカー）
+# Dockerfile の start.sh も同じ環境変数で起動コマンドを切り替える
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -91,27 +118,159 @@ if TESTING:
     }
 else:
     # 本番環境ではDATABASE_URL、開発環境ではローカルMySQL
+    # 接続の使い回し・プール・ヘルスチェックは config/database.py（DB_* の環境変数）で設定する
     DATABASE_URL = config('DATABASE_URL', default=None)
     if DATABASE_URL:
         # Render等の本番環境でPostgreSQL
         DATABASES = {
-            'default': dj_database_url.config(
-                default=DATABASE_URL,
-                conn_max_age=600
-            )
+            'default': configure_connections(dj_database_url.parse(DATABASE_URL), SERVER_MODE)
         }
     else:
         # ローカル開発環境でMySQL
         DATABASES = {
-            'default': {
+            'default': configure_connections({
                 'ENGINE': 'django.db.backends.mysql',
                 'NAME': config('MYSQL_DATABASE', default='booklog_db'),
                 'USER': config('MYSQL_USER', default='user'),
                 'PASSWORD': config('MYSQL_PASSWORD', default='password'),
                 'HOST': config('DB_HOST', default='db'),
                 'PORT': config('DB_PORT', default='3306'),
-            }
+            }, SERVER_MODE)
+        }
+
+# 読み取り専用のレプリカ（カンマ区切りの URL）。booklog.routers.ReplicaRouter が
+# 一覧・詳細・検索などの Book / Memo の読み取りをレプリカに、書き込みをプライマリに振り分ける。
+# ローカルでは DATABASE_URL=sqlite:///db.sqlite3 と DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 で試せる
+BOOKLOG_REPLICAS = []
+if TESTING:
+    # ReplicaRoutingTest が「遅れているレプリカ」として使う（BOOKLOG_REPLICAS を上書きしたときだけ使われる）
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+else:
+    for number, url in enumerate(filter(None, config('DATABASE_REPLICA_URLS', default='').split(',')), start=1):
+        DATABASES[f'replica{number}'] = configure_connections(dj_database_url.parse(url.strip()), SERVER_MODE)
+        BOOKLOG_REPLICAS.append(f'replica{number}')
+
+if BOOKLOG_REPLICAS:
+    DATABASE_ROUTERS = ['booklog.routers.ReplicaRouter']
+    MIDDLEWARE.append('booklog.routers.ReplicaPinMiddleware')
+
+# Book / Memo を書き込んだユーザーの読み取りをプライマリに固定する秒数（レプリカの遅延より長くする）
+BOOKLOG_PRIMARY_PIN_SECONDS = config('BOOKLOG_PRIMARY_PIN_SECONDS', default=5, cast=int)
+
+# 全文検索エンジン（PostgreSQL では tsvector / pg_trgm を使う）
+BOOKLOG_SEARCH_BACKEND = config(
+    'BOOKLOG_SEARCH_BACKEND',
+    default='booklog.search.PostgresSearchBackend'
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+    else 'booklog.search.DatabaseSearchBackend',
+)
+
+
+# キャッシュ
+# REDIS_URL があれば Redis（追い出しは Redis 側の maxmemory-policy で LRU を設定する）、
+# なければプロセス内の LocMemCache（MAX_ENTRIES を超えると LRU で追い出す）を使う
+CACHE_TIMEOUT = config('CACHE_TIMEOUT', default=300, cast=int)
+REDIS_URL = config('REDIS_URL', default=None)
+
+if REDIS_URL and not TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': CACHE_TIMEOUT,
         }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'booklog',
+            'TIMEOUT': CACHE_TIMEOUT,
+            'OPTIONS': {
+                'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=1000, cast=int),
+            },
+        }
+    }
+
+# セッションはキャッシュから読み、DB にも書き込む（キャッシュから消えてもログアウトしない）
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# ModelBackend は切り替える前にログインしたセッション（バックエンドのパスを保存している）を読むために残す
+AUTHENTICATION_BACKENDS = [
+    'booklog.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# ログイン中のユーザーをキャッシュする（booklog.auth）。ユーザーの保存とログアウトで消すが、
+# LocMemCache では他のワーカーのキャッシュを消せず、パスワードの変更・退会の後も古いユーザーで
+# ログインしたままになるので、Redis（REDIS_URL）のときだけ使う（テストは1プロセスなので使う）
+BOOKLOG_USER_CACHE = config('BOOKLOG_USER_CACHE', default=bool(REDIS_URL) or TESTING, cast=bool)
+BOOKLOG_USER_CACHE_TIMEOUT = config('BOOKLOG_USER_CACHE_TIMEOUT', default=CACHE_TIMEOUT, cast=int)
+
+# 一覧・詳細・検索を非同期版のビュー（booklog.async_views）で処理する
+BOOKLOG_ASYNC_VIEWS = config('BOOKLOG_ASYNC_VIEWS', default=SERVER_MODE == 'asgi', cast=bool)
+
+# 一覧・詳細ページ本体のキャッシュ保持秒数
+BOOKLOG_FRAGMENT_CACHE_TIMEOUT = config('BOOKLOG_FRAGMENT_CACHE_TIMEOUT', default=CACHE_TIMEOUT, cast=int)
+
+
+# 検索結果の件数を正確に数える上限（超えたら推定値か「上限+」で表示する）
+BOOKLOG_COUNT_CAP = config('BOOKLOG_COUNT_CAP', default=1000, cast=int)
+# 検索結果の横に表示する著者・出版年ごとの件数の数
+BOOKLOG_FACET_LIMIT = config('BOOKLOG_FACET_LIMIT', default=10, cast=int)
+
+
+# ETag に含める描画の版（Render ではデプロイごとのコミットが入る）
+BOOKLOG_RENDER_VERSION = config('RENDER_GIT_COMMIT', default='dev')
+
+
+# API の一括処理で1リクエストに受け付ける件数と、bulk_create / bulk_update のバッチサイズ
+BOOKLOG_API_BULK_LIMIT = config('BOOKLOG_API_BULK_LIMIT', default=500, cast=int)
+BOOKLOG_BULK_BATCH_SIZE = config('BOOKLOG_BULK_BATCH_SIZE', default=500, cast=int)
+
+# 論理削除した書籍・メモを manage.py purge_deleted が物理削除するまでの秒数（既定 7 日）
+BOOKLOG_PURGE_AFTER = config('BOOKLOG_PURGE_AFTER', default=7 * 24 * 3600, cast=int)
+
+# エクスポートで1回に読み込む書籍の件数
+BOOKLOG_EXPORT_CHUNK_SIZE = config('BOOKLOG_EXPORT_CHUNK_SIZE', default=500, cast=int)
+
+# インポートで1回に検証・登録する行数
+BOOKLOG_IMPORT_BATCH_SIZE = config('BOOKLOG_IMPORT_BATCH_SIZE', default=1000, cast=int)
+# これより大きいファイルのインポートはバックグラウンドジョブで行う
+BOOKLOG_IMPORT_INLINE_MAX_BYTES = config('BOOKLOG_IMPORT_INLINE_MAX_BYTES', default=1024 * 1024, cast=int)
+
+
+# バックグラウンドジョブ（manage.py run_workers で実行する）
+# インポートするファイルとエクスポートの結果を置くディレクトリ
+BOOKLOG_JOB_STORAGE_DIR = config('BOOKLOG_JOB_STORAGE_DIR', default=str(BASE_DIR / 'jobfiles'))
+# 再実行までの待ち時間（秒）。失敗するたびに倍にし、RETRY_MAX_DELAY で頭打ちにする
+BOOKLOG_JOB_RETRY_DELAY = config('BOOKLOG_JOB_RETRY_DELAY', default=30, cast=int)
+BOOKLOG_JOB_RETRY_MAX_DELAY = config('BOOKLOG_JOB_RETRY_MAX_DELAY', default=3600, cast=int)
+# これ以上 locked_at（進捗の報告のたびに更新する）が古い running のジョブは、
+# ワーカーが落ちたとみなして待機中に戻す（秒）
+BOOKLOG_JOB_TIMEOUT = config('BOOKLOG_JOB_TIMEOUT', default=1800, cast=int)
+# 各ワーカーが止まったジョブを探す間隔（秒）
+BOOKLOG_JOB_STALE_CHECK_INTERVAL = config('BOOKLOG_JOB_STALE_CHECK_INTERVAL', default=60, cast=int)
+
+
+# ログ（booklog.instrumentation はリクエストごとに JSON を1行出力する）
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'booklog': {
+            'handlers': ['console'],
+            'level': config('BOOKLOG_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
 
 
 # Password validation
@@ -154,7 +313,16 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# 静的ファイルはイメージのビルド時に collectstatic で集め、Bootstrap の CSS を使っている
+# クラスだけに削り、ファイル名にハッシュを付けて Brotli・gzip 版も作っておく（booklog.assets）。
+# テストは collectstatic せずに動かすのでマニフェストを使わない
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if TESTING
+        else 'booklog.assets.BooklogStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
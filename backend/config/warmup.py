@@ -0,0 +1,61 @@
+"""ワーカーがリクエストを受け付ける前の準備（gunicorn.conf.py から呼ぶ）
+
+preload_app ではマスターで warm_up() を1回だけ行い、fork したワーカーが読み込んだ
+モジュール・URLconf・コンパイル済みのテンプレート・最初のページに埋め込む CSS を
+共有する（最初のリクエストがそれらの読み込みを待たない）。DB の接続はプロセスをまたいで使えないので、マスターでは
+閉じておき、ワーカーごとに connect_databases() で張る。
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template import engines
+from django.urls import get_resolver
+
+from booklog import assets
+
+logger = logging.getLogger('booklog.warmup')
+
+
+def template_names(engine):
+    """このプロジェクトのテンプレート（Django・外部アプリのものは除く）の名前"""
+    base_dir = Path(settings.BASE_DIR).resolve()
+    for directory in engine.template_dirs:
+        root = Path(directory).resolve()
+        if not root.is_relative_to(base_dir):
+            continue
+        for path in sorted(root.rglob('*.html')):
+            yield path.relative_to(root).as_posix()
+
+
+def warm_up():
+    """URLconf（とビューのモジュール）を読み込み、テンプレートをコンパイルして、かかった秒数を返す"""
+    started = time.perf_counter()
+    resolver = get_resolver()
+    # reverse() の表も作っておく（名前空間ごとの表は最初の reverse() で作られる）
+    resolver.reverse_dict
+    for namespace in resolver.namespace_dict:
+        resolver.namespace_dict[namespace][1].reverse_dict
+    # キャッシュするローダーにコンパイル済みのテンプレートが残る
+    templates = 0
+    for engine in engines.all():
+        for name in template_names(engine):
+            engine.get_template(name)
+            templates += 1
+    # 最初のページに埋め込む CSS も作っておく
+    assets.critical_css()
+    connections.close_all()
+    elapsed = time.perf_counter() - started
+    logger.info('warm-up: テンプレート %d 件 %.3f 秒', templates, elapsed)
+    return elapsed
+
+
+def connect_databases():
+    """すべての DB に接続しておく（失敗してもワーカーは起動し、最初のクエリで張り直す）"""
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('warm-up: %s に接続できませんでした', alias, exc_info=True)
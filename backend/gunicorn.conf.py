@@ -0,0 +1,30 @@
+"""gunicorn の設定（起動したディレクトリにあれば自動で読み込まれる）"""
+import os
+
+# アプリをマスターで1回だけ読み込んで温めてからワーカーを fork する（config.warmup を参照）。
+# コードの変更を HUP で読み込み直したいときは GUNICORN_PRELOAD=False
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() not in ('0', 'false', 'no')
+
+
+def when_ready(server):
+    # preload_app ならアプリはここまでに読み込まれていて、この後ワーカーを fork する
+    if server.cfg.preload_app:
+        from config.warmup import warm_up
+
+        warm_up()
+
+
+def post_worker_init(worker):
+    from config.warmup import connect_databases, warm_up
+
+    if not worker.cfg.preload_app:
+        warm_up()
+    connect_databases()
+
+
+def child_exit(server, worker):
+    # 終了したワーカーのメトリクスを集計から外す（booklog.metrics を参照）
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,42 @@
+#!/bin/bash
+# コンテナの起動スクリプト（Dockerfile の CMD）
+# 静的ファイルはイメージのビルド時に集め、マイグレーションはリリースの手順
+# （render.yaml の preDeployCommand: python manage.py release）で適用するので、ここではすぐに gunicorn を起動する。
+# gunicorn は gunicorn.conf.py の preload_app でアプリを温めてからワーカーを fork する
+set -e
+
+# prometheus_client のマルチプロセス用のディレクトリ（Dockerfile で設定する。無ければ使わない）
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# リリースの手順が無い環境用（未適用のマイグレーションが無ければすぐに終わる）
+if [ "${BOOKLOG_MIGRATE_ON_START:-False}" = "True" ]; then
+  python manage.py release
+fi
+
+# ジョブのファイルを Web と共有するため、ワーカーは同じコンテナで動かす（BOOKLOG_WORKERS=0 で無効）
+pids=()
+if [ "${BOOKLOG_WORKERS:-1}" -gt 0 ]; then
+  python manage.py run_workers --workers "${BOOKLOG_WORKERS:-1}" &
+  pids+=($!)
+fi
+
+# SERVER_MODE=asgi なら uvicorn ワーカーで ASGI として動かす（一覧・詳細は非同期版のビューになる）
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+  gunicorn config.asgi:application --bind "0.0.0.0:$PORT" -k uvicorn_worker.UvicornWorker &
+else
+  gunicorn config.wsgi:application --bind "0.0.0.0:$PORT" &
+fi
+pids+=($!)
+
+# コンテナの停止（SIGTERM）はこのスクリプトにだけ届くので、gunicorn とワーカーの両方に伝える。
+# ワーカーは実行中のジョブを終えてから止まる
+trap 'kill -TERM "${pids[@]}" 2>/dev/null' TERM INT
+
+# どちらかが止まったら（異常終了も）もう一方も止め、両方が終わるのを待ってから終了する
+status=0
+wait -n "${pids[@]}" || status=$?
+kill -TERM "${pids[@]}" 2>/dev/null || true
+wait || true
+exit "$status"
@@ -0,0 +1,143 @@
+// 書籍一覧の検索欄の入力補完（タイトル・著者）
+// 1文字入力するごとに /api/v1/completions/?q= から前方一致する候補を取得する（booklog.completion）
+// 候補を選ぶと検索欄に入れて input イベントを送り、js/fragments.js に一覧を差し替えさせる
+(function () {
+  'use strict';
+
+  // 続けて入力している間はまとめて1回にする時間（ミリ秒）
+  var DELAY = 60;
+  var KINDS = { title: 'タイトル', author: '著者' };
+
+  document.querySelectorAll('input[data-completion-url]').forEach(function (input) {
+    var menu = input.parentElement.querySelector('[data-completion-menu]');
+    var template = input.parentElement.querySelector('template[data-completion-item]');
+    if (!menu || !template) {
+      return;
+    }
+    // 同じ入力（削って戻したときなど）は取得し直さない
+    var cache = new Map();
+    var controller = null;
+    var timer = null;
+    var active = -1;
+    var choosing = false;
+
+    function items() {
+      return menu.querySelectorAll('.dropdown-item');
+    }
+
+    function hide() {
+      menu.classList.remove('show');
+      input.setAttribute('aria-expanded', 'false');
+      active = -1;
+    }
+
+    function highlight(index) {
+      var buttons = items();
+      buttons.forEach(function (button, i) {
+        button.classList.toggle('active', i === index);
+        button.setAttribute('aria-selected', i === index ? 'true' : 'false');
+      });
+      active = index;
+    }
+
+    function render(results) {
+      menu.replaceChildren();
+      results.forEach(function (result) {
+        var item = template.content.firstElementChild.cloneNode(true);
+        item.querySelector('[data-completion-value]').textContent = result.value;
+        item.querySelector('[data-completion-note]').textContent = KINDS[result.kind] + ' · ' + result.count + '冊';
+        item.querySelector('.dropdown-item').addEventListener('click', function () {
+          choose(result.value);
+        });
+        menu.appendChild(item);
+      });
+      active = -1;
+      if (results.length) {
+        menu.classList.add('show');
+        input.setAttribute('aria-expanded', 'true');
+      } else {
+        hide();
+      }
+    }
+
+    function choose(value) {
+      input.value = value;
+      hide();
+      // 一覧の差し替え（js/fragments.js）は input イベントで動く
+      choosing = true;
+      input.dispatchEvent(new Event('input', { bubbles: true }));
+      choosing = false;
+    }
+
+    function load(query) {
+      if (cache.has(query)) {
+        render(cache.get(query));
+        return;
+      }
+      if (controller) {
+        controller.abort();
+      }
+      controller = new AbortController();
+      var url = new URL(input.getAttribute('data-completion-url'), location.href);
+      url.searchParams.set('q', query);
+      fetch(url, { signal: controller.signal, credentials: 'same-origin' })
+        .then(function (response) {
+          if (!response.ok) {
+            throw new Error(response.status);
+          }
+          return response.json();
+        })
+        .then(function (data) {
+          cache.set(query, data.results);
+          // 応答を待つ間に入力が変わっていれば表示しない
+          if (input.value.trim() === query) {
+            render(data.results);
+          }
+        })
+        .catch(function () {
+          // 補完が取れなくても検索はできるので何もしない
+        });
+    }
+
+    // IME の変換中（かなのまま）も候補を出す。カタカナのタイトルはひらがなでも一致する
+    input.addEventListener('input', function () {
+      if (choosing) {
+        return;
+      }
+      clearTimeout(timer);
+      var query = input.value.trim();
+      if (!query) {
+        hide();
+        return;
+      }
+      timer = setTimeout(function () {
+        load(query);
+      }, DELAY);
+    });
+
+    input.addEventListener('keydown', function (event) {
+      if (!menu.classList.contains('show') || event.isComposing) {
+        return;
+      }
+      var count = items().length;
+      if (event.key === 'ArrowDown') {
+        event.preventDefault();
+        highlight((active + 1) % count);
+      } else if (event.key === 'ArrowUp') {
+        event.preventDefault();
+        highlight((active - 1 + count) % count);
+      } else if (event.key === 'Enter' && active >= 0) {
+        event.preventDefault();
+        items()[active].click();
+      } else if (event.key === 'Escape') {
+        hide();
+      }
+    });
+
+    // 候補をクリックするまで検索欄のフォーカスを外さない
+    menu.addEventListener('mousedown', function (event) {
+      event.preventDefault();
+    });
+    input.addEventListener('blur', hide);
+  });
+})();
@@ -0,0 +1,80 @@
+// 書籍一覧の検索・ページ送りで、ページ全体ではなく表の行とページ送りだけを差し替える
+// サーバーは ?fragment=rows のとき data-fragment-part を付けた要素だけを返す（booklog.cache）
+(function () {
+  'use strict';
+
+  // 入力が止まってから検索するまでの時間（ミリ秒）
+  var DELAY = 250;
+  var controller = null;
+
+  function replaceParts(container, html) {
+    var template = document.createElement('template');
+    template.innerHTML = html;
+    template.content.querySelectorAll('[data-fragment-part]').forEach(function (part) {
+      var selector = '[data-fragment-part="' + part.getAttribute('data-fragment-part') + '"]';
+      var current = container.querySelector(selector);
+      if (current) {
+        current.replaceWith(part);
+      }
+    });
+  }
+
+  function load(container, url, push) {
+    // 前の入力の応答がまだなら取り消す（遅れて届いた古い結果で上書きしない）
+    if (controller) {
+      controller.abort();
+    }
+    controller = new AbortController();
+    var fragmentUrl = new URL(url, location.href);
+    fragmentUrl.searchParams.set('fragment', 'rows');
+    fetch(fragmentUrl, { signal: controller.signal, credentials: 'same-origin' })
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status);
+        }
+        return response.text();
+      })
+      .then(function (html) {
+        replaceParts(container, html);
+        history[push ? 'pushState' : 'replaceState'](null, '', url);
+      })
+      .catch(function (error) {
+        // 断片を取れなければ通常のページ遷移にする
+        if (error.name !== 'AbortError') {
+          location.href = url;
+        }
+      });
+  }
+
+  document.querySelectorAll('[data-fragment]').forEach(function (container) {
+    container.addEventListener('click', function (event) {
+      var link = event.target.closest('[data-fragment-part="pagination"] a[href]');
+      if (!link || link.getAttribute('href') === '#' || event.ctrlKey || event.metaKey || event.shiftKey) {
+        return;
+      }
+      event.preventDefault();
+      load(container, link.href, true);
+    });
+
+    var input = container.querySelector('input[data-fragment-search]');
+    if (!input) {
+      return;
+    }
+    var timer = null;
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var url = new URL(input.form.action, location.href);
+        if (input.value.trim()) {
+          url.searchParams.set(input.name, input.value);
+        }
+        load(container, url.href, false);
+      }, DELAY);
+    });
+  });
+
+  // 差し替えた後の履歴に戻ったときは、その URL のページを読み込み直す
+  window.addEventListener('popstate', function () {
+    location.reload();
+  });
+})();